@@ -0,0 +1,40 @@
+import json
+import sqlite3
+import threading
+from typing import Optional
+
+
+class CogMetadataCache:
+    """
+    Persistent SQLite cache of COG metadata keyed by object key, size and
+    ETag, so unchanged rasters never need opening again.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cog_metadata "
+                "(key TEXT PRIMARY KEY, size INTEGER, etag TEXT, metadata TEXT)"
+            )
+
+    def get(self, key: str, size: int, etag: str) -> Optional[dict]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT metadata FROM cog_metadata WHERE key = ? AND size = ? AND etag = ?",
+                (key, size, etag)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, size: int, etag: str, metadata: dict):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cog_metadata (key, size, etag, metadata) VALUES (?, ?, ?, ?)",
+                (key, size, etag, json.dumps(metadata))
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
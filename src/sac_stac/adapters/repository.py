@@ -1,63 +1,348 @@
+import hashlib
+import io
 import json
-from typing import List
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import botocore
+import ijson
 from pystac import STAC_IO
-from sac_stac.domain.s3 import S3, NoObjectError
+from sac_stac.domain.s3 import S3, NoObjectError, ConflictError
 from sac_stac.load_config import get_s3_configuration
+from sac_stac.metrics import stage, S3_SKIPPED_WRITES, S3_WRITE_CONFLICTS
+from sac_stac.tracing import span
 from sac_stac.util import parse_s3_url
 
 S3_ENDPOINT = get_s3_configuration()["endpoint"]
+STAC_IO_CACHE_SIZE = 32
+JSON_HEAD_SIZE = 64 * 1024
+UPDATE_ATTEMPTS = 5
+
+_stac_io_scope = ContextVar('stac_io_scope', default=None)
+_stac_io_lock = threading.Lock()
 
 
 class S3Repository:
 
-    def __init__(self, s3: S3):
+    def __init__(self, s3: S3, cog_cache=None):
         self.s3 = s3
+        self.cog_cache = cog_cache
+        self.skipped_writes = 0
 
     def get_acquisition_keys(self, bucket: str, acquisition_prefix: str) -> List[str]:
-        return self.s3.list_common_prefixes(bucket_name=bucket, prefix=acquisition_prefix)
+        with span('repository.get_acquisition_keys', bucket=bucket, key=acquisition_prefix) as current:
+            acquisition_keys = self.s3.list_common_prefixes(bucket_name=bucket, prefix=acquisition_prefix)
+            current.set_attribute('count', len(acquisition_keys))
+            return acquisition_keys
 
     def get_product_keys(self, bucket: str, products_prefix: str) -> List[str]:
-        product_objs = self.s3.list_objects(bucket_name=bucket, prefix=products_prefix, suffix='.tif')
-        return [p.key for p in product_objs]
+        with span('repository.get_product_keys', bucket=bucket, key=products_prefix) as current:
+            product_objs = self.s3.list_objects(bucket_name=bucket, prefix=products_prefix, suffix='.tif')
+            current.set_attribute('count', len(product_objs))
+            return [p.key for p in product_objs]
+
+    def get_keys(self, bucket: str, prefix: str) -> List[str]:
+        with span('repository.get_keys', bucket=bucket, key=prefix) as current:
+            objs = self.s3.list_objects(bucket_name=bucket, prefix=prefix)
+            current.set_attribute('count', len(objs))
+            return [o.key for o in objs]
+
+    def get_product_fingerprints(self, bucket: str, products_prefix: str) -> Dict[str, Tuple[int, str, str]]:
+        with span('repository.get_product_fingerprints', bucket=bucket, key=products_prefix) as current:
+            product_objs = self.s3.list_objects(bucket_name=bucket, prefix=products_prefix, suffix='.tif')
+            current.set_attribute('count', len(product_objs))
+            return {p.key: (p.size, p.e_tag, p.last_modified.isoformat()) for p in product_objs}
 
     def get_smallest_product_key(self, bucket: str, products_prefix: str) -> str:
         try:
-            product_objs = self.s3.list_objects(bucket_name=bucket, prefix=products_prefix, suffix='.tif')
-            product_objs_size = {p.size: p.key for p in product_objs if p.size > 1}
-            product_min_size = min(list(product_objs_size.keys()))
-            return product_objs_size.get(product_min_size)
+            with span('repository.get_smallest_product_key', bucket=bucket, key=products_prefix) as current:
+                product_objs = self.s3.list_objects(bucket_name=bucket, prefix=products_prefix, suffix='.tif')
+                product_objs_size = {p.size: p.key for p in product_objs if p.size > 1}
+                product_min_size = min(list(product_objs_size.keys()))
+                current.set_attribute('bytes', product_min_size)
+                return product_objs_size.get(product_min_size)
         except NoObjectError:
             raise
 
     def get_product_raster(self, bucket: str, product_key: str) -> bytes:
-        return self.s3.get_object_body(bucket_name=bucket, object_name=product_key)
+        with span('repository.get_product_raster', bucket=bucket, key=product_key) as current:
+            raster = self.s3.get_object_body(bucket_name=bucket, object_name=product_key)
+            current.set_attribute('bytes', len(raster))
+            return raster
+
+    def get_object(self, bucket: str, key: str) -> bytes:
+        with span('repository.get_object', bucket=bucket, key=key) as current:
+            body, _ = self.s3.get_object(bucket_name=bucket, object_name=key)
+            current.set_attribute('bytes', len(body))
+            return body
 
     def get_dict(self, bucket: str, key: str) -> dict:
+        stac_dict, _ = self.get_dict_with_etag(bucket=bucket, key=key)
+        return stac_dict
+
+    def get_dict_with_etag(self, bucket: str, key: str) -> Tuple[dict, str]:
+        """
+        Return a JSON object with the ETag it was read with, to be passed to
+        add_json_from_dict when writing it back in the same operation.
+        """
         try:
-            catalog_body = self.s3.get_object_body(bucket_name=bucket, object_name=key)
-            return json.loads(catalog_body.decode('utf-8'))
+            with span('repository.get_dict', bucket=bucket, key=key) as current:
+                catalog_body, etag = self.s3.get_object(bucket_name=bucket, object_name=key)
+                current.set_attribute('bytes', len(catalog_body))
+                with stage('json_loads'):
+                    return json.loads(catalog_body.decode('utf-8')), etag
         except NoObjectError:
             raise
 
-    def add_json_from_dict(self, bucket: str, key: str, stac_dict: dict):
-        response = self.s3.put_object(
-            bucket_name=bucket,
-            key=key,
-            body=json.dumps(stac_dict)
-        )
-        return response.get('ResponseMetadata').get('HTTPStatusCode')
+    def get_dict_fields(self, bucket: str, key: str, fields: List[str], link_rels: List[str] = None) -> dict:
+        """
+        Parse only the given top-level fields, and the first link of each of
+        the given rels under 'links', out of a JSON object while streaming it,
+        stopping as soon as all of them have been read.
+        """
+        link_rels = link_rels or []
+        with span('repository.get_dict_fields', bucket=bucket, key=key):
+            body = RangedBody(self.s3, bucket=bucket, key=key)
+            try:
+                builders, links = {}, {}
+                done = set()
+                link = None
+                with stage('json_stream'):
+                    for prefix, event, value in ijson.parse(body, use_float=True):
+                        if link_rels and prefix.startswith('links.item'):
+                            if prefix == 'links.item' and event == 'start_map':
+                                link = ijson.ObjectBuilder()
+                            link.event(event, value)
+                            if prefix == 'links.item' and event == 'end_map':
+                                links.setdefault(link.value.get('rel'), link.value)
+                                if set(link_rels) <= set(links):
+                                    done.add('links')
+                        elif link_rels and prefix == 'links' and event == 'end_array':
+                            done.add('links')
+                        field = prefix.split('.', 1)[0]
+                        if field in fields:
+                            builders.setdefault(field, ijson.ObjectBuilder()).event(event, value)
+                            # A scalar or the end of a container at the field's own prefix completes it
+                            if prefix == field and event not in ('start_map', 'start_array', 'map_key'):
+                                done.add(field)
+                        if len(done) == len(fields) + bool(link_rels):
+                            break
+                stac_dict = {field: builder.value for field, builder in builders.items()}
+                if link_rels:
+                    stac_dict['links'] = [links[rel] for rel in link_rels if rel in links]
+                return stac_dict
+            finally:
+                body.close()
+
+    def find_link(self, bucket: str, key: str, rel: str, href: str = None) -> Optional[dict]:
+        """
+        Return the first link of a STAC object with the given rel, and href if
+        given, parsing its links one at a time while streaming it.
+        """
+        with span('repository.find_link', bucket=bucket, key=key, rel=rel):
+            body = RangedBody(self.s3, bucket=bucket, key=key)
+            try:
+                with stage('json_stream'):
+                    for link in ijson.items(body, 'links.item'):
+                        if link.get('rel') == rel and (href is None or link.get('href') == href):
+                            return link
+                return None
+            finally:
+                body.close()
+
+    def head(self, bucket: str, key: str) -> Optional[dict]:
+        """
+        Return the ETag and user metadata of an object, None if it does not exist.
+        """
+        head = self.s3.head_object(bucket_name=bucket, key=key)
+        if head is None:
+            return None
+        return {'etag': head.get('ETag'), 'metadata': head.get('Metadata', {})}
+
+    def exists(self, bucket: str, key: str) -> bool:
+        return self.head(bucket=bucket, key=key) is not None
+
+    def add_json_from_dict(self, bucket: str, key: str, stac_dict: dict, metadata: dict = None,
+                           etag: str = None):
+        """
+        Write a STAC dict as JSON, skipping the PUT when etag, the ETag the
+        object was read with in the same operation, shows it already holds
+        the same body. Writes with metadata are never skipped, as the ETag
+        does not cover it.
+        """
+        with span('repository.add_json_from_dict', bucket=bucket, key=key) as current:
+            with stage('json_dumps'):
+                # Sorted keys make the body, and so its MD5, deterministic
+                body = json.dumps(stac_dict, sort_keys=True).encode('utf-8')
+            current.set_attribute('bytes', len(body))
+
+            if etag and metadata is None and etag == f'"{hashlib.md5(body).hexdigest()}"':
+                S3_SKIPPED_WRITES.inc()
+                self.skipped_writes += 1
+                current.set_attribute('skipped', True)
+                return 304
+
+            response = self.s3.put_object(
+                bucket_name=bucket,
+                key=key,
+                body=body,
+                metadata=metadata
+            )
+            return response.get('ResponseMetadata').get('HTTPStatusCode')
+
+    def update_dict(self, bucket: str, key: str, update: Callable[[Optional[dict]], dict],
+                    attempts: int = UPDATE_ATTEMPTS) -> dict:
+        """
+        Read a JSON object, None if it does not exist or is not valid JSON,
+        and write back what update returns for it, only if a HEAD right before the PUT still shows
+        the ETag it was read with. Otherwise update is applied again to a
+        fresh read. S3 has no compare-and-swap PUT, so a writer in another
+        process can still land between the HEAD and the PUT: the window is
+        one request long rather than the whole update, but it is not closed.
+
+        :raises ConflictError: if the object changed during every attempt.
+        """
+        for _ in range(attempts):
+            try:
+                stac_dict, etag = self.get_dict_with_etag(bucket=bucket, key=key)
+            except NoObjectError:
+                stac_dict, etag = None, None
+            except ValueError:
+                stac_dict, etag = None, (self.head(bucket=bucket, key=key) or {}).get('etag')
+            updated = update(stac_dict)
+            head = self.head(bucket=bucket, key=key)
+            if (head and head['etag']) == etag:
+                self.add_json_from_dict(bucket=bucket, key=key, stac_dict=updated, etag=etag)
+                return updated
+            S3_WRITE_CONFLICTS.inc()
+        raise ConflictError(f"{key} changed during each of {attempts} attempts to update it")
+
+    def add_object(self, bucket: str, key: str, body: bytes, content_type: str = None):
+        with span('repository.add_object', bucket=bucket, key=key, bytes=len(body)):
+            response = self.s3.put_object(
+                bucket_name=bucket,
+                key=key,
+                body=body,
+                content_type=content_type
+            )
+            return response.get('ResponseMetadata').get('HTTPStatusCode')
+
+    def copy_object(self, bucket: str, source_key: str, key: str):
+        with span('repository.copy_object', bucket=bucket, key=key):
+            response = self.s3.copy_object(bucket_name=bucket, source_key=source_key, key=key)
+            return response.get('ResponseMetadata').get('HTTPStatusCode')
+
+    def delete_objects(self, bucket: str, keys: List[str]) -> List[str]:
+        with span('repository.delete_objects', bucket=bucket, count=len(keys)):
+            return self.s3.delete_objects(bucket_name=bucket, keys=keys)
 
     def stac_read_method(self, uri):
         parsed = urlparse(uri)
         if parsed.hostname in S3_ENDPOINT:
             try:
                 bucket, key = parse_s3_url(uri)
-                body = self.s3.get_object_body(bucket_name=bucket, object_name=key)
-                return body.decode('utf-8')
+                with span('repository.stac_read_method', bucket=bucket, key=key) as current:
+                    body, _ = self.s3.get_object(bucket_name=bucket, object_name=key)
+                    current.set_attribute('bytes', len(body))
+                    return body.decode('utf-8')
             except NoObjectError:
                 raise
         else:
             return STAC_IO.default_read_text_method(uri)
+
+
+class RangedBody:
+    """
+    File-like body of a JSON object that reads its first JSON_HEAD_SIZE bytes
+    with a ranged GET, and streams the rest only once a parser reads past them.
+    Fields and links read by the services sit at the start of the documents
+    written with sorted keys, so stopping early rarely leaves a response half
+    read, which would drop its pooled connection.
+    """
+
+    def __init__(self, s3: S3, bucket: str, key: str, head_size: int = JSON_HEAD_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.head_size = head_size
+        head, _ = s3.get_object(bucket_name=bucket, object_name=key, byte_range=f"bytes=0-{head_size - 1}")
+        self.head = io.BytesIO(head or b'')
+        self.complete = head is None or len(head) < head_size
+        self.rest = None
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.head.read(size)
+        if (data and size >= 0) or self.complete:
+            return data
+        if self.rest is None:
+            self.rest, _ = self.s3.get_object_stream(bucket_name=self.bucket, object_name=self.key,
+                                                     byte_range=f"bytes={self.head_size}-")
+            if self.rest is None:
+                self.complete = True
+                return data
+        return data + (self.rest.read(size) if size >= 0 else self.rest.read())
+
+    def close(self):
+        if self.rest is not None:
+            self.rest.close()
+
+
+class StacIOScope:
+    """
+    STAC I/O bound to a repository, caching the text of the most recently
+    resolved links. The catalog and collections every item links to stay in
+    the cache, while a long backfill does not keep every document it read.
+    """
+
+    def __init__(self, repo: S3Repository, max_size: int = STAC_IO_CACHE_SIZE):
+        self.repo = repo
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def read_text(self, uri: str) -> str:
+        with self.lock:
+            if uri in self.cache:
+                self.cache.move_to_end(uri)
+                return self.cache[uri]
+        text = self.repo.stac_read_method(uri)
+        with self.lock:
+            self.cache[uri] = text
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return text
+
+
+def _scoped_read_text_method(uri):
+    scope = _stac_io_scope.get()
+    if scope is None:
+        return STAC_IO.default_read_text_method(uri)
+    return scope.read_text(uri)
+
+
+@contextmanager
+def stac_io(repo: S3Repository):
+    """
+    Route pystac reads through the given repository for the current thread or
+    task only, instead of replacing the global STAC_IO reader on every call.
+    The most recently resolved links are cached until it exits. Nested scopes
+    of the same repository share the outer cache.
+    """
+    if STAC_IO.read_text_method is not _scoped_read_text_method:
+        with _stac_io_lock:
+            STAC_IO.read_text_method = _scoped_read_text_method
+
+    current = _stac_io_scope.get()
+    if current is not None and current.repo is repo:
+        yield current
+        return
+
+    token = _stac_io_scope.set(StacIOScope(repo))
+    try:
+        yield _stac_io_scope.get()
+    finally:
+        _stac_io_scope.reset(token)
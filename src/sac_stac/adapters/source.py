@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from sac_stac.adapters.repository import S3Repository
+from sac_stac.domain.s3 import NoObjectError
+from sac_stac.load_config import get_s3_configuration
+
+S3_ENDPOINT = get_s3_configuration()["endpoint"]
+
+
+class Source:
+    """Backend acquisitions and their products are discovered and read from."""
+
+    def get_acquisition_keys(self, sensor_key: str) -> List[str]:
+        raise NotImplementedError
+
+    def get_product_fingerprints(self, acquisition_key: str) -> Dict[str, Tuple[int, str, str]]:
+        raise NotImplementedError
+
+    def get_cog_url(self, product_key: str) -> str:
+        raise NotImplementedError
+
+
+class S3Source(Source):
+    """Products read from the S3 bucket the STAC catalog is published to."""
+
+    def __init__(self, repo: S3Repository, bucket: str):
+        self.repo = repo
+        self.bucket = bucket
+
+    def get_acquisition_keys(self, sensor_key: str) -> List[str]:
+        return self.repo.get_acquisition_keys(bucket=self.bucket, acquisition_prefix=sensor_key)
+
+    def get_product_fingerprints(self, acquisition_key: str) -> Dict[str, Tuple[int, str, str]]:
+        return self.repo.get_product_fingerprints(bucket=self.bucket, products_prefix=acquisition_key)
+
+    def get_cog_url(self, product_key: str) -> str:
+        return f"{S3_ENDPOINT}/{self.bucket}/{product_key}"
+
+
+class FileSystemSource(Source):
+    """
+    Products read from a local or NFS mirror of the bucket, laid out with the
+    same keys under the given root directory.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def get_acquisition_keys(self, sensor_key: str) -> List[str]:
+        sensor_dir = self.root / sensor_key
+        if not sensor_dir.is_dir():
+            return []
+        return sorted(f"{sensor_key}{d.name}/" for d in sensor_dir.iterdir() if d.is_dir())
+
+    def get_product_fingerprints(self, acquisition_key: str) -> Dict[str, Tuple[int, str, str]]:
+        products = sorted((self.root / acquisition_key).glob('*.tif'))
+        if not products:
+            raise NoObjectError(f'Nothing found with {acquisition_key}*.tif in {self.root}')
+        fingerprints = {}
+        for product in products:
+            stat = product.stat()
+            # The modification time stands in for the ETag of the S3 listing
+            fingerprints[f"{acquisition_key}{product.name}"] = (
+                stat.st_size, str(stat.st_mtime_ns), datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat())
+        return fingerprints
+
+    def get_cog_url(self, product_key: str) -> str:
+        return str(self.root / product_key)
@@ -0,0 +1,119 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT, get_deadline_configuration
+from sac_stac.metrics import DEADLINES_EXCEEDED, HEDGED_REQUESTS
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class LatencyTracker:
+    """Rolling window of the latencies of each operation."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation: str, latency: float):
+        with self.lock:
+            self.latencies.setdefault(operation, deque(maxlen=self.window)).append(latency)
+
+    def quantile(self, operation: str, q: float):
+        """
+        Return the q quantile of the recorded latencies, None until there are enough samples.
+        """
+        with self.lock:
+            latencies = sorted(self.latencies.get(operation, []))
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(q * len(latencies)) - 1)]
+
+
+class Deadlines:
+    """
+    Bound remote reads with per-operation deadlines, optionally hedging them:
+    once a call has taken longer than the given latency quantile of its
+    operation, a duplicate is sent and whichever answers first is kept.
+    Calls left behind finish in the background, bounded by the socket
+    timeouts of the S3 client and GDAL, and their results are dropped.
+    Callers take their throttle slot around the deadline rather than inside
+    it, so an abandoned call gives its slot back as soon as it is abandoned.
+    """
+
+    def __init__(self, deadlines: dict = None, hedge: bool = False, hedge_quantile: float = 0.95,
+                 max_workers: int = 64):
+        """
+        :param deadlines: seconds allowed per operation, operations without one are called directly
+        :param hedge: whether to send hedged requests
+        :param hedge_quantile: latency quantile after which a hedged request is sent
+        :param max_workers: threads running the bounded calls
+        """
+        self.deadlines = deadlines or {}
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.latencies = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='deadline')
+
+    def submit(self, operation: str, func, *args, **kwargs):
+        def timed():
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.latencies.record(operation, time.perf_counter() - start)
+            return result
+
+        # Each attempt runs in a copy of the caller's context so spans keep their parent
+        return self.executor.submit(contextvars.copy_context().run, timed)
+
+    def call(self, operation: str, func, *args, **kwargs):
+        """
+        Call func within the deadline of the operation, raising DeadlineExceeded
+        if no attempt answered in time.
+
+        :param operation: name of the operation, e.g. 'get_object'
+        :param func: callable doing the request
+        """
+        deadline = self.deadlines.get(operation)
+        if not deadline:
+            return func(*args, **kwargs)
+
+        end = time.monotonic() + deadline
+        pending = {self.submit(operation, func, *args, **kwargs)}
+
+        hedge_after = self.latencies.quantile(operation, self.hedge_quantile) if self.hedge else None
+        if hedge_after is not None and hedge_after < deadline:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done:
+                logger.debug(f"{operation} slower than {hedge_after:.3f}s, sending a hedged request")
+                HEDGED_REQUESTS.labels(operation=operation).inc()
+                pending.add(self.submit(operation, func, *args, **kwargs))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+
+        if error is not None and not pending:
+            raise error
+        DEADLINES_EXCEEDED.labels(operation=operation).inc()
+        raise DeadlineExceeded(f"{operation} did not answer within its {deadline}s deadline")
+
+
+deadlines = Deadlines(**get_deadline_configuration())
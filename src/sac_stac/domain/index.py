@@ -0,0 +1,97 @@
+import io
+import json
+from typing import List
+
+import geopandas as gpd
+import pandas as pd
+from pystac.utils import str_to_datetime
+from shapely.geometry import shape
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+GENERIC_EPSG = 4326
+
+
+def get_index_record(item_dict: dict) -> dict:
+    """
+    Summarise an item into the record kept for it in the collection index.
+
+    :param item_dict: item as written to its JSON document
+    :return: id, href, datetime, bbox and geometry of the item.
+    """
+    return {
+        'id': item_dict.get('id'),
+        'href': next((link.get('href') for link in item_dict.get('links', []) if link.get('rel') == 'self'), None),
+        'datetime': item_dict.get('properties', {}).get('datetime'),
+        'bbox': item_dict.get('bbox'),
+        'geometry': item_dict.get('geometry')
+    }
+
+
+def append_index_records(body: bytes, records: List[dict]) -> bytes:
+    """
+    Append records to an NDJSON index, one JSON document per line.
+
+    :param body: current index, empty if there is none yet
+    :param records: records to append
+    """
+    lines = b''.join(json.dumps(record, sort_keys=True).encode('utf-8') + b'\n' for record in records)
+    return body + lines
+
+
+def read_index_records(body: bytes) -> List[dict]:
+    """
+    Read the records of an NDJSON index, keeping the last record of each item
+    as the index is appended to when an item is rewritten.
+    """
+    records = {}
+    for line in body.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            records.pop(record.get('id'), None)
+            records[record.get('id')] = record
+    return list(records.values())
+
+
+def get_collection_items(records: List[dict]) -> list:
+    """
+    Turn index records into the (item_href, bbox, item_datetime) tuples the
+    extent of their collection is computed from, sorted by href.
+    """
+    return sorted((r.get('href'), r.get('bbox'), str_to_datetime(r['datetime']) if r.get('datetime') else None)
+                  for r in records)
+
+
+def to_geoparquet(records: List[dict]):
+    """
+    Encode the index records as GeoParquet, sorted by datetime with one
+    column per bound of the EPSG:4326 geometries so readers can filter on
+    row group statistics.
+
+    :return: the GeoParquet body, None if pyarrow is not installed.
+    """
+    if pyarrow is None:
+        return None
+    records = sorted(records, key=lambda r: r.get('datetime') or '')
+    geometries = gpd.GeoSeries([shape(r.get('geometry')) if r.get('geometry') else None for r in records],
+                               crs=f"EPSG:{GENERIC_EPSG}")
+    bounds = geometries.bounds
+    frame = gpd.GeoDataFrame(
+        {
+            'id': [r.get('id') for r in records],
+            'href': [r.get('href') for r in records],
+            'datetime': pd.to_datetime([r.get('datetime') for r in records], utc=True),
+            'xmin': bounds['minx'].values,
+            'ymin': bounds['miny'].values,
+            'xmax': bounds['maxx'].values,
+            'ymax': bounds['maxy'].values
+        },
+        geometry=geometries.values,
+        crs=f"EPSG:{GENERIC_EPSG}"
+    )
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, index=False)
+    return buffer.getvalue()
@@ -1,7 +1,14 @@
-from pystac import Collection, Item, Provider, STAC_EXTENSIONS
+from datetime import datetime
+
+from dateutil import tz
+from pystac import Asset, Collection, Item, Provider, STAC_EXTENSIONS, Link, MediaType
+from pystac.utils import datetime_to_str, str_to_datetime
 
 from sac_stac.domain.extensions import register_product_definition_extension
 
+RASTER_EXTENSION = 'https://stac-extensions.github.io/raster/v1.0.0/schema.json'
+FINGERPRINTS_PROPERTY = 'sac_stac:fingerprints'
+
 
 class SacCollection(Collection):
     def add_providers(self, collection_config: dict):
@@ -13,6 +20,21 @@ class SacCollection(Collection):
 
         self.providers = providers
 
+    def add_catalog_links(self, catalog_href: str, root_href: str):
+        """
+        Link the collection to its parent catalog without loading the catalog object.
+        """
+        self.remove_links('root')
+        self.add_link(Link('root', root_href, media_type=MediaType.JSON))
+        self.add_link(Link('parent', catalog_href, media_type=MediaType.JSON))
+
+    def get_root(self):
+        """
+        Links are written with the absolute hrefs they were given, so the
+        root catalog is never loaded to make them relative.
+        """
+        return None
+
     def add_product_definition_extension(self, product_definition: dict, bands_metadata: list):
         if not STAC_EXTENSIONS.is_registered_extension('product_definition'):
             register_product_definition_extension()
@@ -25,6 +47,43 @@ class SacCollection(Collection):
 
 
 class SacItem(Item):
+    def add_collection_links(self, collection_id: str, collection_href: str, root_href: str):
+        """
+        Link the item to its collection without loading the collection object.
+        """
+        self.collection_id = collection_id
+        self.add_link(Link('root', root_href, media_type=MediaType.JSON))
+        self.add_link(Link('collection', collection_href, media_type=MediaType.JSON))
+        self.add_link(Link('parent', collection_href, media_type=MediaType.JSON))
+
+    def get_root(self):
+        """
+        Links are written with the absolute hrefs they were given, so the
+        root catalog is never loaded to make them relative.
+        """
+        return None
+
+    def add_thumbnail(self, href: str, media_type: str = MediaType.PNG):
+        """
+        Register a preview image of the item as its thumbnail asset.
+        """
+        self.add_asset(key='thumbnail', asset=Asset(href=href, media_type=media_type, roles=['thumbnail']))
+
+    def set_raster_bands(self, asset: Asset, bands: list):
+        """
+        Describe the bands of an asset with the raster extension.
+        """
+        if RASTER_EXTENSION not in self.stac_extensions:
+            self.stac_extensions.append(RASTER_EXTENSION)
+        asset.properties['raster:bands'] = bands
+
+    def set_product_fingerprints(self, product_fingerprints: dict):
+        """
+        Record the size, ETag and last modified time of the products the item
+        was built from, to detect when they are re-processed.
+        """
+        self.properties[FINGERPRINTS_PROPERTY] = fingerprints_to_dict(product_fingerprints)
+
     def add_common_metadata(self, common_metadata_config: dict):
         self.common_metadata.gsd = common_metadata_config.get('gsd')
         self.common_metadata.platform = common_metadata_config.get('platform')
@@ -35,3 +94,147 @@ class SacItem(Item):
         if extensions_config.get('eo'):
             self.ext.enable('eo')
             self.ext.eo.cloud_cover = extensions_config.get('eo').get('cloud_cover')
+
+
+def fingerprints_to_dict(product_fingerprints: dict) -> dict:
+    return {key: dict(size=size, etag=etag, last_modified=last_modified)
+            for key, (size, etag, last_modified) in product_fingerprints.items()}
+
+
+def _insert_link(links: list, rel: str, href: str) -> bool:
+    if any(link.get('rel') == rel and link.get('href') == href for link in links):
+        return False
+    self_index = next((i for i, link in enumerate(links) if link.get('rel') == 'self'), len(links))
+    links.insert(self_index, {'rel': rel, 'href': href, 'type': MediaType.JSON})
+    return True
+
+
+def add_child_to_catalog_dict(catalog_dict: dict, child_href: str) -> dict:
+    """
+    Append a child link to a raw catalog dict, without resolving the
+    existing children.
+
+    :param catalog_dict: catalog as loaded from its JSON document
+    :param child_href: absolute href of the child
+
+    :return: the updated catalog dict.
+    """
+    _insert_link(catalog_dict.setdefault('links', []), 'child', child_href)
+    return catalog_dict
+
+
+def add_item_to_collection_dict(collection_dict: dict, item_href: str, bbox: list, item_datetime: datetime) -> dict:
+    """
+    Append an item link to a raw collection dict and extend its extent to
+    cover the item, without hydrating a pystac Link object for every
+    existing item or resolving any of them. The extent of a rewritten item,
+    already linked, is extended too, as it may have moved; it is not shrunk,
+    which would take the bbox of every other item.
+
+    :param collection_dict: collection as loaded from its JSON document
+    :param item_href: absolute href of the item
+    :param bbox: item bbox
+    :param item_datetime: item datetime
+
+    :return: the updated collection dict.
+    """
+    links = collection_dict.setdefault('links', [])
+    has_items = any(link.get('rel') == 'item' for link in links)
+
+    _insert_link(links, 'item', item_href)
+
+    extent = collection_dict.setdefault('extent', {})
+    if item_datetime is not None and not item_datetime.tzinfo:
+        item_datetime = item_datetime.replace(tzinfo=tz.UTC)
+
+    if not has_items:
+        extent['spatial'] = {'bbox': [list(bbox)]}
+        extent['temporal'] = {'interval': [[datetime_to_str(item_datetime) if item_datetime else None] * 2]}
+        return collection_dict
+
+    xmin, ymin, xmax, ymax = extent['spatial']['bbox'][0]
+    extent['spatial']['bbox'][0] = [min(xmin, bbox[0]), min(ymin, bbox[1]), max(xmax, bbox[2]), max(ymax, bbox[3])]
+
+    if item_datetime is not None:
+        interval = extent['temporal']['interval'][0]
+        start, end = [str_to_datetime(dt) if dt else None for dt in interval]
+        interval[0] = datetime_to_str(min(start, item_datetime) if start else item_datetime)
+        interval[1] = datetime_to_str(max(end, item_datetime) if end else item_datetime)
+
+    return collection_dict
+
+
+def add_items_to_collection_dict(collection_dict: dict, items: list) -> dict:
+    """
+    Append the links of many items to a raw collection dict at once and
+    extend its extent to cover all of them, in a single pass over the
+    existing links.
+
+    :param collection_dict: collection as loaded from its JSON document
+    :param items: (item_href, bbox, item_datetime) tuples
+
+    :return: the updated collection dict.
+    """
+    links = collection_dict.setdefault('links', [])
+    item_hrefs = {link.get('href') for link in links if link.get('rel') == 'item'}
+    has_items = bool(item_hrefs)
+
+    new_links, bboxes, datetimes = [], [], []
+    for item_href, bbox, item_datetime in items:
+        if item_href in item_hrefs:
+            continue
+        item_hrefs.add(item_href)
+        new_links.append({'rel': 'item', 'href': item_href, 'type': MediaType.JSON})
+        bboxes.append(bbox)
+        if item_datetime is not None:
+            datetimes.append(item_datetime if item_datetime.tzinfo else item_datetime.replace(tzinfo=tz.UTC))
+
+    if not new_links:
+        return collection_dict
+
+    self_index = next((i for i, link in enumerate(links) if link.get('rel') == 'self'), len(links))
+    links[self_index:self_index] = new_links
+
+    extent = collection_dict.setdefault('extent', {})
+    bbox = [min(b[0] for b in bboxes), min(b[1] for b in bboxes), max(b[2] for b in bboxes), max(b[3] for b in bboxes)]
+    start, end = (min(datetimes), max(datetimes)) if datetimes else (None, None)
+
+    if not has_items:
+        extent['spatial'] = {'bbox': [bbox]}
+        extent['temporal'] = {'interval': [[datetime_to_str(start) if start else None,
+                                            datetime_to_str(end) if end else None]]}
+        return collection_dict
+
+    xmin, ymin, xmax, ymax = extent['spatial']['bbox'][0]
+    extent['spatial']['bbox'][0] = [min(xmin, bbox[0]), min(ymin, bbox[1]), max(xmax, bbox[2]), max(ymax, bbox[3])]
+
+    if start is not None:
+        interval = extent['temporal']['interval'][0]
+        current_start, current_end = [str_to_datetime(dt) if dt else None for dt in interval]
+        interval[0] = datetime_to_str(min(current_start, start) if current_start else start)
+        interval[1] = datetime_to_str(max(current_end, end) if current_end else end)
+
+    return collection_dict
+
+
+def remove_items_from_collection_dict(collection_dict: dict, item_hrefs: list, remaining_items: list) -> dict:
+    """
+    Remove item links from a raw collection dict and recompute its extent
+    from the items left, in a single rewrite however many are removed.
+
+    :param collection_dict: collection as loaded from its JSON document
+    :param item_hrefs: absolute hrefs of the removed items
+    :param remaining_items: (item_href, bbox, item_datetime) tuples of the items left
+
+    :return: the updated collection dict.
+    """
+    item_hrefs = set(item_hrefs)
+    collection_dict['links'] = [link for link in collection_dict.get('links', [])
+                                if not (link.get('rel') == 'item' and link.get('href') in item_hrefs)]
+
+    if not remaining_items:
+        collection_dict['extent'] = {'spatial': {'bbox': [[0, 0, 0, 0]]}, 'temporal': {'interval': [[None, None]]}}
+        return collection_dict
+
+    collection_dict['extent'] = add_items_to_collection_dict({'links': []}, remaining_items)['extent']
+    return collection_dict
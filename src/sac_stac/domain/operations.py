@@ -1,22 +1,42 @@
+import hashlib
+import json
 import logging
 import os
 import re
+import warnings
 from datetime import datetime
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
 
+import numpy as np
 import rasterio
-from rasterio import RasterioIOError
+from rasterio import RasterioIOError, features
 from rasterio.crs import CRS
-from shapely.geometry import box, Polygon
+from rasterio.errors import RasterioError, NotGeoreferencedWarning
+from rasterio.io import MemoryFile
+from rasterio.transform import Affine
+from shapely.geometry import box, mapping, shape, Polygon
+from shapely.ops import unary_union
 
-from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT
+from sac_stac.deadlines import deadlines
+from sac_stac.domain.s3 import NoObjectError
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT, get_timeout_configuration
+from sac_stac.metrics import stage
+from sac_stac.throttling import throttle
+from sac_stac.tracing import span
 from sac_stac.util import extract_common_prefix, parse_s3_url
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 
 logger = logging.getLogger(__name__)
 
+# GDAL HTTP timeouts stop hung COG reads instead of leaving them to run past their deadline
+GDAL_HTTP_OPTIONS = {
+    'GDAL_HTTP_CONNECTTIMEOUT': max(1, round(get_timeout_configuration()['connect_timeout'])),
+    'GDAL_HTTP_TIMEOUT': max(1, round(get_timeout_configuration()['read_timeout']))
+}
+
 
 def obtain_date_from_filename(file: str, regex: str, date_format: str) -> datetime:
     """
@@ -38,43 +58,354 @@ def obtain_date_from_filename(file: str, regex: str, date_format: str) -> dateti
     return date
 
 
-def get_geometry_from_cog(cog_url: str) -> Tuple[Polygon, CRS]:
+def get_band_tokens(file: str, regex: str = None) -> List[str]:
+    """
+    Return the candidate band identifiers carried by the given file name.
+
+    With a regular expression the first group of its match is the only
+    candidate. Without one, every suffix of the file stem starting at a
+    '_' or '-' separator is a candidate, longest first, both with and
+    without the leading separator.
+
+    :param file: path to file
+    :param regex: regular expression capturing the band identifier
+
+    :return: list of candidate band identifiers.
+    """
+    stem = Path(file).stem
+
+    if regex:
+        match_band = re.search(regex, stem)
+        return [match_band.group(1)] if match_band else []
+
+    tokens = []
+    for i, char in enumerate(stem):
+        if char in '_-':
+            tokens.extend([stem[i:], stem[i + 1:]])
+    return tokens
+
+
+def match_bands_to_products(product_keys: List[str], band_names: List[str], regex: str = None) -> Dict[str, str]:
+    """
+    Map each band name to the product whose file name carries it as an
+    exact token, so 'B1' never matches 'B10', 'B11' or 'B12'.
+
+    Product keys are tokenised once, making the matching linear on the
+    number of products and the lookup of each band constant.
+
+    :param product_keys: list of product keys
+    :param band_names: list of band names to look for
+    :param regex: regular expression capturing the band identifier
+
+    :return: dict with the matching product key of every found band.
+    """
+    band_names = set(band_names)
+    band_products = {}
+
+    for product_key in product_keys:
+        for token in get_band_tokens(product_key, regex):
+            if token in band_names:
+                band_products.setdefault(token, product_key)
+                break
+
+    return band_products
+
+
+def get_smallest_product_key(product_fingerprints: Dict[str, Tuple[int, str, str]]) -> str:
+    """
+    Return the key of the smallest non-empty product, the cheapest to open
+    for the geometry shared by every band of an acquisition.
+
+    :param product_fingerprints: size, ETag and last modified time of each product key
+
+    :return: A product key.
+    """
+    product_sizes = {fingerprint[0]: key for key, fingerprint in product_fingerprints.items() if fingerprint[0] > 1}
+    if not product_sizes:
+        raise NoObjectError(f"No non-empty product in {list(product_fingerprints)}")
+    return product_sizes.get(min(product_sizes))
+
+
+def get_fingerprints_digest(product_fingerprints: Dict[str, Tuple[int, str, str]]) -> str:
+    """
+    Digest the fingerprints of every product of an acquisition, changing
+    whenever a product is added, removed or rewritten.
+
+    :param product_fingerprints: size, ETag and last modified time of each product key
+
+    :return: An MD5 hex digest.
+    """
+    fingerprints = json.dumps(sorted([key, *fingerprint] for key, fingerprint in product_fingerprints.items()))
+    return hashlib.md5(fingerprints.encode('utf-8')).hexdigest()
+
+
+def get_changed_products(stored_fingerprints: dict, product_fingerprints: Dict[str, Tuple[int, str, str]]):
+    """
+    Compare the fingerprints stored in an item with those of the current
+    listing of its acquisition.
+
+    :param stored_fingerprints: fingerprints stored in the item properties
+    :param product_fingerprints: size, ETag and last modified time of each product key
+
+    :return: The keys of the rewritten products, None if products were added or removed.
+    """
+    if not stored_fingerprints or set(stored_fingerprints) != set(product_fingerprints):
+        return None
+    return sorted(key for key, fingerprint in product_fingerprints.items()
+                  if [stored_fingerprints[key].get(field) for field in ('size', 'etag', 'last_modified')]
+                  != list(fingerprint))
+
+
+def local_cog_url(cog_url: str) -> str:
+    if os.environ.get("TEST_ENV") and urlparse(cog_url).scheme:
+        bucket, key = parse_s3_url(cog_url)
+        return f"tests/data/{key}"
+    return cog_url
+
+
+def read_footprint(ds, max_size: int = 1024, simplify_tolerance: float = None) -> dict:
+    """
+    Vectorise the valid-data area of an open dataset from its mask at the
+    resolution of the smallest overview, or decimated to max_size pixels
+    if it has none.
+
+    :param ds: open rasterio dataset
+    :param max_size: largest side of the mask read without overviews
+    :param simplify_tolerance: tolerance in CRS units, one mask pixel if not set
+
+    :return: A GeoJSON geometry in the dataset CRS, None if no pixel is valid.
+    """
+    overviews = ds.overviews(1)
+    factor = overviews[-1] if overviews else max(1, max(ds.shape) // max_size)
+    out_shape = (max(1, ds.height // factor), max(1, ds.width // factor))
+    mask = ds.dataset_mask(out_shape=out_shape)
+    transform = ds.transform * Affine.scale(ds.width / out_shape[1], ds.height / out_shape[0])
+
+    polygons = [shape(geom) for geom, value in features.shapes(mask, mask=mask > 0, transform=transform)]
+    if not polygons:
+        return None
+    tolerance = simplify_tolerance if simplify_tolerance is not None else abs(transform.a)
+    return mapping(unary_union(polygons).simplify(tolerance, preserve_topology=True))
+
+
+def read_band_statistics(ds, max_size: int = 1024) -> dict:
+    """
+    Describe the first band of an open dataset in the raster:bands format,
+    with statistics from its GDAL statistics tags when stored, or computed
+    from its smallest overview otherwise.
+
+    :param ds: open rasterio dataset
+    :param max_size: largest side of the array read without overviews
+
+    :return: A raster band dict.
+    """
+    band = {'data_type': ds.dtypes[0]}
+    if ds.nodata is not None:
+        band['nodata'] = 'nan' if np.isnan(ds.nodata) else ds.nodata
+
+    tags = ds.tags(1)
+    names = {'minimum': 'STATISTICS_MINIMUM', 'maximum': 'STATISTICS_MAXIMUM', 'mean': 'STATISTICS_MEAN',
+             'stddev': 'STATISTICS_STDDEV', 'valid_percent': 'STATISTICS_VALID_PERCENT'}
+    if all(names[k] in tags for k in ('minimum', 'maximum', 'mean', 'stddev')):
+        band['statistics'] = {k: float(tags[tag]) for k, tag in names.items() if tag in tags}
+        return band
+
+    overviews = ds.overviews(1)
+    factor = overviews[-1] if overviews else max(1, max(ds.shape) // max_size)
+    data = ds.read(1, out_shape=(max(1, ds.height // factor), max(1, ds.width // factor)), masked=True)
+    valid = data.compressed()
+    band['statistics'] = {'valid_percent': 100.0 * valid.size / data.size}
+    if valid.size:
+        band['statistics'].update(minimum=float(valid.min()), maximum=float(valid.max()),
+                                  mean=float(valid.mean()), stddev=float(valid.std()))
+    return band
+
+
+def read_cog_metadata(cog_url: str, cache=None, fingerprint: Tuple[int, str, str] = None, footprint: bool = False,
+                      simplify_tolerance: float = None, statistics: bool = False) -> dict:
+    """
+    Read bounds, CRS, shape and transform of the COG file served under the
+    given url in a single open, or from the cache when its fingerprint is known.
+
+    :param cog_url: url to cog file
+    :param cache: optional CogMetadataCache
+    :param fingerprint: size, ETag and last modified time of the cog file from its listing
+    :param footprint: whether to also read the valid-data footprint
+    :param simplify_tolerance: tolerance used to simplify the footprint
+    :param statistics: whether to also read the raster:bands description of the first band
+
+    :return: A metadata dict.
+    """
+    cached = None
+    if cache is not None and fingerprint:
+        cached = cache.get(cog_url, *fingerprint[:2])
+        # A footprint is only reused when simplified with the same tolerance
+        if cached is not None \
+                and (not footprint or ('footprint' in cached
+                                       and cached.get('footprint_tolerance') == simplify_tolerance)) \
+                and (not statistics or 'raster_band' in cached):
+            return cached
+
+    local_url = local_cog_url(cog_url)
+
+    def read():
+        with span('rasterio.open', url=local_url), rasterio.Env(**GDAL_HTTP_OPTIONS), rasterio.open(local_url) as ds:
+            metadata = dict(
+                bounds=list(ds.bounds),
+                crs=ds.crs.to_wkt() if ds.crs else None,
+                shape=list(ds.shape),
+                transform=list(ds.transform)
+            )
+            if footprint:
+                try:
+                    with span('read_footprint', url=local_url):
+                        metadata['footprint'] = read_footprint(ds, simplify_tolerance=simplify_tolerance)
+                        metadata['footprint_tolerance'] = simplify_tolerance
+                except RasterioError as e:
+                    logger.warning(f"Error reading footprint from {cog_url}: {e}")
+                    metadata['footprint'] = None
+            if statistics:
+                try:
+                    with span('read_band_statistics', url=local_url):
+                        metadata['raster_band'] = read_band_statistics(ds)
+                except RasterioError as e:
+                    logger.warning(f"Error reading statistics from {cog_url}: {e}")
+                    metadata['raster_band'] = {'data_type': ds.dtypes[0]}
+            return metadata
+
+    metadata = throttle.call('cog_read', deadlines.call, 'cog_read', read)
+
+    if cache is not None and fingerprint:
+        # Fields cached by reads asking for other ones are kept, and a failed
+        # footprint read is retried next time rather than cached
+        read_fields = {k: v for k, v in metadata.items() if not (k == 'footprint' and v is None)}
+        cache.put(cog_url, *fingerprint[:2], {**(cached or {}), **read_fields})
+    return metadata
+
+
+@stage('read_lowest_overview')
+def read_lowest_overview(cog_url: str, max_size: int = 256, out_shape: Tuple[int, int] = None) -> np.ma.MaskedArray:
+    """
+    Read the first band of the COG file served under the given url at the
+    resolution of its smallest overview, decimated further to max_size.
+    GDAL reads the overview closest to the output shape.
+
+    :param cog_url: url to cog file
+    :param max_size: largest side of the returned array
+    :param out_shape: shape of the returned array, overrides max_size
+
+    :return: A masked array.
+    """
+    local_url = local_cog_url(cog_url)
+
+    def read():
+        with span('rasterio.open', url=local_url), rasterio.Env(**GDAL_HTTP_OPTIONS), rasterio.open(local_url) as ds:
+            shape = out_shape
+            if shape is None:
+                overviews = ds.overviews(1)
+                factor = max(overviews[-1] if overviews else 1, -(-max(ds.shape) // max_size))
+                shape = (max(1, ds.height // factor), max(1, ds.width // factor))
+            return ds.read(1, out_shape=shape, masked=True)
+
+    return throttle.call('cog_read', deadlines.call, 'cog_read', read)
+
+
+def render_thumbnail(bands: List[np.ma.MaskedArray], driver: str = 'PNG') -> bytes:
+    """
+    Encode red, green and blue bands as an 8 bit image, stretching each band
+    between its 2nd and 98th percentiles. Pixels masked in any band are
+    transparent in PNG images.
+
+    :param bands: red, green and blue masked arrays of the same shape
+    :param driver: GDAL driver of the image, 'PNG' or 'JPEG'
+
+    :return: The encoded image.
+    """
+    mask = np.ma.getmaskarray(bands[0])
+    for band in bands[1:]:
+        mask = mask | np.ma.getmaskarray(band)
+
+    channels = []
+    for band in bands:
+        valid = np.asarray(band)[~mask]
+        low, high = np.percentile(valid, (2, 98)) if valid.size else (0, 1)
+        scaled = (np.asarray(band, dtype='float64') - low) / max(high - low, 1e-9)
+        channels.append((np.clip(scaled, 0, 1) * 255).astype('uint8'))
+    if driver == 'PNG':
+        channels.append(np.where(mask, 0, 255).astype('uint8'))
+
+    height, width = mask.shape
+    with warnings.catch_warnings(), MemoryFile() as mem:
+        warnings.simplefilter('ignore', NotGeoreferencedWarning)
+        with mem.open(driver=driver, width=width, height=height, count=len(channels), dtype='uint8') as image:
+            image.write(np.stack(channels))
+        return mem.read()
+
+
+@stage('get_geometry_from_cog')
+def get_geometry_from_cog(cog_url: str, cache=None, fingerprint: Tuple[int, str, str] = None, footprint: bool = False,
+                          simplify_tolerance: float = None) -> Tuple[Polygon, CRS]:
     """
     Extract geometry information out of the COG file served under
     the given url.
 
     :param cog_url: url to cog file
+    :param cache: optional CogMetadataCache
+    :param fingerprint: size, ETag and last modified time of the cog file from its listing
+    :param footprint: whether to return the valid-data footprint instead of the raster bounds
+    :param simplify_tolerance: tolerance used to simplify the footprint, in CRS units
 
     :return: A Polygon and CRS objects.
     """
-    if os.environ.get("TEST_ENV"):
-        bucket, key = parse_s3_url(cog_url)
-        cog_url = f"tests/data/{key}"
     try:
-        with rasterio.open(cog_url) as ds:
-            geom = box(*ds.bounds)
-            crs = ds.crs
-        return geom, crs
+        metadata = read_cog_metadata(cog_url, cache=cache, fingerprint=fingerprint, footprint=footprint,
+                                     simplify_tolerance=simplify_tolerance)
+        crs = CRS.from_wkt(metadata['crs']) if metadata['crs'] else None
+        if footprint and metadata.get('footprint'):
+            return shape(metadata['footprint']), crs
+        return box(*metadata['bounds']), crs
     except RasterioIOError as e:
         logger.warning(f"Error extracting geometry from {cog_url}: {e}")
         return Polygon(), CRS()
 
 
-def get_projection_from_cog(cog_url: str) -> Tuple[list, list]:
+@stage('get_projection_from_cog')
+def get_projection_from_cog(cog_url: str, cache=None, fingerprint: Tuple[int, str, str] = None) -> Tuple[list, list]:
     """
     Extract projection information out of the COG file served under
     the given url.
 
     :param cog_url: url to cog file
+    :param cache: optional CogMetadataCache
+    :param fingerprint: size, ETag and last modified time of the cog file from its listing
 
     :return: A shape and transform lists.
     """
-    if os.environ.get("TEST_ENV"):
-        bucket, key = parse_s3_url(cog_url)
-        cog_url = f"tests/data/{key}"
     try:
-        with rasterio.open(cog_url) as ds:
-            return list(ds.shape), list(ds.transform)
+        metadata = read_cog_metadata(cog_url, cache=cache, fingerprint=fingerprint)
+        return metadata['shape'], metadata['transform']
     except RasterioIOError as e:
         logger.warning(f"Error extracting projection from {cog_url}: {e}")
         return [], []
+
+
+@stage('get_band_metadata_from_cog')
+def get_band_metadata_from_cog(cog_url: str, cache=None, fingerprint: Tuple[int, str, str] = None,
+                               statistics: bool = False) -> Tuple[list, list, dict]:
+    """
+    Extract projection information, and optionally a raster:bands
+    description, out of the COG file served under the given url.
+
+    :param cog_url: url to cog file
+    :param cache: optional CogMetadataCache
+    :param fingerprint: size, ETag and last modified time of the cog file from its listing
+    :param statistics: whether to read the band statistics
+
+    :return: A shape and transform lists, and a raster band dict or None.
+    """
+    try:
+        metadata = read_cog_metadata(cog_url, cache=cache, fingerprint=fingerprint, statistics=statistics)
+        return metadata['shape'], metadata['transform'], metadata.get('raster_band')
+    except RasterioIOError as e:
+        logger.warning(f"Error extracting band metadata from {cog_url}: {e}")
+        return [], [], None
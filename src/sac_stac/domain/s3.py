@@ -1,13 +1,23 @@
 import logging
+from collections import namedtuple
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT, get_timeout_configuration
+from sac_stac.deadlines import deadlines
+from sac_stac.metrics import s3_request, S3_BYTES
+from sac_stac.throttling import throttle
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 
 logger = logging.getLogger(__name__)
 
+DELETE_BATCH_SIZE = 1000
+LIST_PAGE_SIZE = 1000
+
+ObjectSummary = namedtuple('ObjectSummary', ['key', 'size', 'e_tag', 'last_modified'])
+
 
 class S3:
     """Class to handle S3 operations."""
@@ -28,6 +38,8 @@ class S3:
             region_name=region_name,
             aws_access_key_id=key,
             aws_secret_access_key=secret,
+            # Socket timeouts stop hung requests, including stalled reads of a streamed body
+            config=Config(**get_timeout_configuration())
         )
         self.buckets_exist = []
 
@@ -44,12 +56,15 @@ class S3:
             limit            (int): Limit the number of objects returned
                                     default None
         Returns:
-            An iterable of ObjectSummary resources
+            A list of ObjectSummary tuples
         """
-        if prefix:
-            objects = list(self.s3_resource.Bucket(bucket_name).objects.filter(Prefix=prefix).limit(limit))
-        else:
-            objects = list(self.s3_resource.Bucket(bucket_name).objects.all().limit(limit))
+        objects = []
+        for page in self.list_pages('list_objects', Bucket=bucket_name, **({'Prefix': prefix} if prefix else {})):
+            objects += [ObjectSummary(o.get('Key'), o.get('Size'), o.get('ETag'), o.get('LastModified'))
+                        for o in page.get('Contents', [])]
+            if limit and len(objects) >= limit:
+                objects = objects[:limit]
+                break
 
         if not objects:
             raise NoObjectError(f'Nothing found with {prefix}*{suffix} in {bucket_name} bucket')
@@ -59,27 +74,122 @@ class S3:
         else:
             return objects
 
-    def get_object_body(self, bucket_name, object_name):
+    def get_object(self, bucket_name, object_name, byte_range=None):
         """
-        Download an object from S3 and return its body.
+        Download an object from S3 and return its body and ETag.
         Params:
             bucket_name            (str): Bucket name
             object_name            (str): Object name
+            byte_range             (str): HTTP Range of the object to download
+                                          default None
         """
         try:
-            obj = self.s3_resource.Object(bucket_name=bucket_name, key=object_name).get()
-            return obj.get('Body').read()
+            def get():
+                obj = self.s3_resource.Object(bucket_name=bucket_name, key=object_name).get(
+                    **({'Range': byte_range} if byte_range else {}))
+                return obj, obj.get('Body').read()
+
+            with s3_request('get_object'):
+                obj, body = throttle.call('get_object', deadlines.call, 'get_object', get)
+            S3_BYTES.labels(direction='download').inc(len(body))
+            return body, obj.get('ETag')
         except ClientError as ex:
             if ex.response['Error']['Code'] == 'NoSuchKey':
                 raise NoObjectError(f'Nothing found with {object_name} in {bucket_name} bucket')
+            return None, None
 
-    def put_object(self, bucket_name, key, body):
+    def get_object_stream(self, bucket_name, object_name, byte_range=None):
+        """
+        Start downloading an object from S3 and return its streaming body and ETag.
+        Params:
+            bucket_name            (str): Bucket name
+            object_name            (str): Object name
+            byte_range             (str): HTTP Range of the object to download
+                                          default None
+        """
         try:
-            response = self.s3_resource.Object(bucket_name=bucket_name, key=key).put(Body=body)
-            return response
+            # The deadline covers the response headers, S3_READ_TIMEOUT every read of the body
+            with s3_request('get_object_stream'):
+                obj = throttle.call('get_object', deadlines.call, 'get_object',
+                                    self.s3_resource.Object(bucket_name=bucket_name, key=object_name).get,
+                                    **({'Range': byte_range} if byte_range else {}))
+            S3_BYTES.labels(direction='download').inc(obj.get('ContentLength', 0))
+            return obj.get('Body'), obj.get('ETag')
+        except ClientError as ex:
+            if ex.response['Error']['Code'] == 'NoSuchKey':
+                raise NoObjectError(f'Nothing found with {object_name} in {bucket_name} bucket')
+            return None, None
+
+    def get_object_body(self, bucket_name, object_name):
+        """
+        Download an object from S3 and return its body.
+        Params:
+            bucket_name            (str): Bucket name
+            object_name            (str): Object name
+        """
+        body, _ = self.get_object(bucket_name=bucket_name, object_name=object_name)
+        return body
+
+    def head_object(self, bucket_name, key):
+        """
+        Return the metadata of an object, None if it does not exist.
+        Params:
+            bucket_name            (str): Bucket name
+            key                    (str): Object key
+        """
+        try:
+            with s3_request('head_object'):
+                return throttle.call('head_object', self.s3_resource.meta.client.head_object,
+                                     Bucket=bucket_name, Key=key)
+        except ClientError as ex:
+            if ex.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def put_object(self, bucket_name, key, body, content_type=None, metadata=None):
+        extra_args = {'ContentType': content_type} if content_type else {}
+        if metadata:
+            extra_args['Metadata'] = metadata
+        try:
+            with s3_request('put_object'):
+                response = throttle.call('put_object', self.s3_resource.Object(bucket_name=bucket_name, key=key).put,
+                                         Body=body, **extra_args)
         except ClientError as ex:
             logger.warning(f"Could not put {key} in {bucket_name} bucket: {ex}")
-            return None
+            raise
+        S3_BYTES.labels(direction='upload').inc(len(body.encode('utf-8') if isinstance(body, str) else body))
+        return response
+
+    def copy_object(self, bucket_name, source_key, key):
+        """
+        Copy an object within a bucket on the server side.
+        Params:
+            bucket_name            (str): Bucket name
+            source_key             (str): Key of the object copied
+            key                    (str): Key of the copy
+        """
+        with s3_request('copy_object'):
+            return throttle.call('copy_object', self.s3_resource.meta.client.copy_object,
+                                 Bucket=bucket_name, Key=key, CopySource={'Bucket': bucket_name, 'Key': source_key})
+
+    def delete_objects(self, bucket_name, keys):
+        """
+        Delete objects in batches of the 1000 keys a DeleteObjects request accepts.
+        Params:
+            bucket_name            (str): Bucket name
+            keys                  (list): Object keys
+        Returns:
+            The keys that could not be deleted
+        """
+        errors = []
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[i:i + DELETE_BATCH_SIZE]
+            with s3_request('delete_objects'):
+                response = throttle.call('delete_objects', self.s3_resource.meta.client.delete_objects,
+                                         Bucket=bucket_name,
+                                         Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+            errors += [error.get('Key') for error in response.get('Errors', [])]
+        return errors
 
     def list_common_prefixes(self, bucket_name, prefix):
         """
@@ -89,15 +199,37 @@ class S3:
             prefix                 (str): Prefix
         """
         common_prefixes = []
-        paginator = self.s3_resource.meta.client.get_paginator('list_objects')
-
-        for result in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
-            if result.get('CommonPrefixes'):
-                common_prefixes = [p.get('Prefix') for p in result.get('CommonPrefixes')]
+        for page in self.list_pages('list_common_prefixes', Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
+            common_prefixes += [p.get('Prefix') for p in page.get('CommonPrefixes', [])]
 
         return common_prefixes
 
+    def list_pages(self, operation, **params):
+        """
+        Yield the pages of a ListObjects request one at a time, each page
+        request going through the throttle on its own.
+        Params:
+            operation              (str): Operation the requests are throttled and counted as
+            params                       : Parameters of the ListObjects request
+        """
+        client = self.s3_resource.meta.client
+        marker = None
+        while True:
+            with s3_request(operation):
+                page = throttle.call(operation, client.list_objects, MaxKeys=LIST_PAGE_SIZE,
+                                     **params, **({'Marker': marker} if marker else {}))
+            yield page
+            if not page.get('IsTruncated'):
+                return
+            # NextMarker only comes with a delimiter, the last key continues the listing otherwise
+            marker = page.get('NextMarker') or (page.get('Contents') or [{}])[-1].get('Key')
+            if not marker:
+                return
+
 
 class NoObjectError(Exception):
     pass
 
+
+class ConflictError(Exception):
+    pass
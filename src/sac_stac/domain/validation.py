@@ -0,0 +1,146 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from urllib.parse import urldefrag
+
+from jsonschema import Draft7Validator, RefResolver
+from jsonschema.exceptions import best_match
+from pystac import get_stac_version
+
+from sac_stac.domain.model import RASTER_EXTENSION
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT
+from sac_stac.metrics import VALIDATION_ERRORS, stage
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+SCHEMAS_DIR = Path(__file__).parent.parent / "schemas"
+SCHEMAS_BASE_URI = 'https://schemas.stacspec.org'
+CORE_SCHEMAS = {
+    'item': 'item-spec/json-schema/item.json',
+    'collection': 'collection-spec/json-schema/collection.json',
+    'catalog': 'catalog-spec/json-schema/catalog.json'
+}
+# Schemas of the fields stac-creator writes outside of any STAC extension
+LOCAL_SCHEMAS = {
+    'item': ['urn:sac_stac:item']
+}
+
+
+class StacValidationError(Exception):
+    pass
+
+
+class MissingSchemaError(Exception):
+    pass
+
+
+def load_schemas(schemas_dir: Path = SCHEMAS_DIR) -> dict:
+    """
+    Load every JSON schema vendored in the given directory, keyed by its $id
+    so references between them resolve without network access.
+
+    :param schemas_dir: directory of the vendored schemas
+
+    :return: schemas keyed by URI.
+    """
+    schemas = {}
+    for path in sorted(schemas_dir.glob('**/*.json')):
+        with open(path) as schema_file:
+            schema = json.load(schema_file)
+        schemas[urldefrag(schema.get('$id', path.resolve().as_uri()))[0]] = schema
+    return schemas
+
+
+def get_extension_uri(stac_version: str, extension: str) -> str:
+    """
+    Return the schema URI of an extension, given by its URI or by the short
+    name of an extension of the core specification.
+    """
+    if '/' in extension:
+        return urldefrag(extension)[0]
+    return f"{SCHEMAS_BASE_URI}/v{stac_version}/extensions/{extension}/json-schema/schema.json"
+
+
+def get_required_schema_uris(stac_version: str = None) -> list:
+    """
+    Return the URIs of the schemas the objects stac-creator writes are
+    validated against, which have to be vendored.
+    """
+    stac_version = stac_version or get_stac_version()
+    uris = [f"{SCHEMAS_BASE_URI}/v{stac_version}/{path}" for path in CORE_SCHEMAS.values()]
+    uris += [get_extension_uri(stac_version, extension) for extension in ('eo', 'projection')]
+    return uris + [RASTER_EXTENSION] + [uri for uris in LOCAL_SCHEMAS.values() for uri in uris]
+
+
+def get_stac_type(stac_dict: dict) -> str:
+    if stac_dict.get('type') == 'Feature':
+        return 'item'
+    return 'collection' if 'extent' in stac_dict else 'catalog'
+
+
+class StacValidator:
+    """
+    Validate STAC dicts against vendored schemas, compiling one validator per
+    schema URI and thread. Schemas of other extensions than the ones
+    stac-creator writes are skipped when not vendored, with a warning the
+    first time.
+    """
+
+    def __init__(self, schemas: dict = None, required: list = None):
+        """
+        :param schemas: schemas keyed by URI, the vendored schemas if not set
+        :param required: URIs of the schemas that have to be in schemas, the ones of the objects stac-creator writes
+            if not set
+
+        :raises MissingSchemaError: if any of the required schemas is not vendored.
+        """
+        self.schemas = load_schemas() if schemas is None else schemas
+        missing = [uri for uri in (get_required_schema_uris() if required is None else required)
+                   if uri not in self.schemas]
+        if missing:
+            raise MissingSchemaError(f"No vendored schema for {', '.join(missing)}. Run python -m "
+                                     f"sac_stac.entrypoints.vendor_schemas and commit {SCHEMAS_DIR.name}.")
+        # jsonschema resolvers keep a scope stack, so validators are not shared between threads
+        self.local = threading.local()
+        self.missing = set()
+
+    def get_schema_uris(self, stac_dict: dict) -> list:
+        stac_type = get_stac_type(stac_dict)
+        stac_version = stac_dict.get('stac_version')
+        uris = [f"{SCHEMAS_BASE_URI}/v{stac_version}/{CORE_SCHEMAS[stac_type]}"]
+        uris += [get_extension_uri(stac_version, extension) for extension in stac_dict.get('stac_extensions') or []]
+        return uris + LOCAL_SCHEMAS.get(stac_type, [])
+
+    def get_validator(self, schema_uri: str):
+        validators = getattr(self.local, 'validators', None)
+        if validators is None:
+            validators = self.local.validators = {}
+        if schema_uri not in validators:
+            schema = self.schemas.get(schema_uri)
+            validators[schema_uri] = Draft7Validator(
+                schema, resolver=RefResolver(schema_uri, schema, store=self.schemas)) if schema else None
+        return validators[schema_uri]
+
+    def validate(self, stac_dict: dict):
+        """
+        Validate the STAC dict against its core schema and the schemas of its
+        extensions, raising StacValidationError on the most relevant error.
+        """
+        stac_type = get_stac_type(stac_dict)
+        with stage(f'validate_{stac_type}'):
+            for schema_uri in self.get_schema_uris(stac_dict):
+                validator = self.get_validator(schema_uri)
+                if validator is None:
+                    if schema_uri not in self.missing:
+                        self.missing.add(schema_uri)
+                        logger.warning(f"No vendored schema for {schema_uri}, skipping it")
+                    continue
+                error = best_match(validator.iter_errors(stac_dict))
+                if error is not None:
+                    VALIDATION_ERRORS.labels(type=stac_type).inc()
+                    path = '/'.join(str(p) for p in error.absolute_path)
+                    raise StacValidationError(
+                        f"Invalid {stac_type} {stac_dict.get('id')} at '{path}' against {schema_uri}: {error.message}")
@@ -1,12 +1,21 @@
 import asyncio
+import inspect
 import logging
 import signal
 
 from nats.aio.client import Client as NATS
+from prometheus_client import start_http_server
 from sac_stac.adapters import repository
+from sac_stac.adapters.cog_cache import CogMetadataCache
+from sac_stac.adapters.source import FileSystemSource
 from sac_stac.domain.s3 import S3
-from sac_stac.service_layer.services import add_stac_collection, add_stac_item
-from sac_stac.load_config import get_nats_uri, LOG_LEVEL, LOG_FORMAT, get_s3_configuration
+from sac_stac.entrypoints.notifier import Notifier
+from sac_stac.entrypoints.scheduler import Scheduler
+from sac_stac.load_config import get_nats_uri, LOG_LEVEL, LOG_FORMAT, get_s3_configuration, get_metrics_port, \
+    get_tracing_configuration, get_cog_cache_path, get_scheduler_configuration, \
+    get_source_root, get_notification_configuration
+from sac_stac.metrics import MESSAGES
+from sac_stac.tracing import configure_tracing, inject_context, span
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 
@@ -18,7 +27,19 @@ S3_REGION = get_s3_configuration()["region"]
 S3_ENDPOINT = get_s3_configuration()["endpoint"]
 
 
-async def run(nc, repo, loop):
+async def publish(nc, subject, payload, headers=None):
+    """
+    Publish the payload, propagating the given or current trace context in
+    the message headers when the NATS client supports them.
+    """
+    headers = headers or inject_context()
+    if headers and 'headers' in inspect.signature(nc.publish).parameters:
+        await nc.publish(subject, payload, headers=headers)
+    else:
+        await nc.publish(subject, payload)
+
+
+async def run(nc, repo, loop, source=None):
 
     async def closed_cb():
         logger.info("Connection to NATS is closed.")
@@ -34,24 +55,28 @@ async def run(nc, repo, loop):
     await nc.connect(**options)
     logger.info(f"Connected to NATS at {nc.connected_url.netloc}...")
 
+    async def publish_key(subject, payload, headers=None):
+        await publish(nc, subject, payload, headers)
+        logger.info(f"Published a message on '{subject}': {payload.decode()}")
+
+    notifier = Notifier(publish_key, repo=repo, **get_notification_configuration())
+    scheduler = Scheduler(repo, publish_key, source=source, notifier=notifier, **get_scheduler_configuration())
+    scheduler.start(loop)
+
     async def message_handler(msg):
         subject = msg.subject
         data = msg.data.decode()
         logger.info(f"Received a message on '{subject}': {data}")
+        MESSAGES.labels(subject=subject).inc()
         r = {
-            'collection': add_stac_collection,
-            'item': add_stac_item
+            'collection': scheduler.submit_collection,
+            'item': scheduler.submit_item,
+            'delete': scheduler.submit_delete
         }
         message_type = subject.split('.')[1]
         if message_type in r.keys():
-            for k, v in r.items():
-                if k in subject:
-                    stac_type, key = v(repo, data)
-                    if key:
-                        subj = f'stac_indexer.{stac_type}'
-                        msg = key.encode()
-                        await nc.publish(subj, msg)
-                        logger.info(f"Published a message on '{subj}': {msg.decode()}")
+            with span('nats.message', context=getattr(msg, 'headers', None), subject=subject, key=data):
+                await r[message_type](data, headers=inject_context() or getattr(msg, 'headers', None))
 
     await nc.subscribe("stac_creator.*", cb=message_handler)
 
@@ -59,6 +84,7 @@ async def run(nc, repo, loop):
         if nc.is_closed:
             return
         logger.info("Disconnecting...")
+        loop.create_task(scheduler.stop())
         loop.create_task(nc.close())
 
     for sig in ('SIGINT', 'SIGTERM'):
@@ -67,13 +93,24 @@ async def run(nc, repo, loop):
 
 if __name__ == '__main__':
 
+    configure_tracing(**get_tracing_configuration())
+
+    metrics_port = get_metrics_port()
+    if metrics_port:
+        start_http_server(metrics_port)
+        logger.info(f"Serving metrics on port {metrics_port}...")
+
     s3 = S3(key=S3_ACCESS_KEY_ID, secret=S3_SECRET_ACCESS_KEY,
             s3_endpoint=S3_ENDPOINT, region_name=S3_REGION)
-    repo = repository.S3Repository(s3)
+    cog_cache_path = get_cog_cache_path()
+    cog_cache = CogMetadataCache(cog_cache_path) if cog_cache_path else None
+    repo = repository.S3Repository(s3, cog_cache=cog_cache)
+    source_root = get_source_root()
+    source = FileSystemSource(source_root) if source_root else None
     nats_client = NATS()
 
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(run(nats_client, repo, loop))
+    loop.run_until_complete(run(nats_client, repo, loop, source=source))
     try:
         loop.run_forever()
     finally:
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT, get_s3_configuration
+from sac_stac.metrics import NOTIFIED_KEYS
+from sac_stac.tracing import span
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+S3_BUCKET = get_s3_configuration()["bucket"]
+S3_STAC_KEY = get_s3_configuration()["stac_key"]
+
+SINGLE = 'single'
+BATCH = 'batch'
+MANIFEST = 'manifest'
+
+
+class Notifier:
+    """
+    Notify the stac_indexer of the STAC objects written.
+
+    In single mode every key is published on its own `stac_indexer.<type>`
+    message. In batch mode item keys are buffered and published as
+    newline-delimited keys on `stac_indexer.items`, and in manifest mode the
+    same list is uploaded as a manifest object whose key is published on
+    `stac_indexer.manifest`. Buffered items are flushed once the batch is full
+    or has waited for the flush interval, and always before a collection key
+    is published, so the indexer never sees a collection before its items.
+
+    Keys leave the buffer only once published, in batches of at most
+    batch_size keys and max_bytes, so a failed publish is retried on the next
+    flush. Each batch is published under its own span, linked to the trace of
+    every message it carries.
+    """
+
+    def __init__(self, publish, mode: str = SINGLE, batch_size: int = 500, flush_interval: float = 5.0,
+                 max_bytes: int = 512 * 1024, repo=None):
+        """
+        :param publish: coroutine function publishing a subject and payload
+        :param mode: 'single', 'batch' or 'manifest'
+        :param batch_size: number of item keys flushing the buffer
+        :param flush_interval: seconds after which buffered item keys are flushed
+        :param max_bytes: size of the buffered keys flushing the buffer, below the NATS payload limit
+        :param repo: repository the manifests are written to in manifest mode
+        """
+        if mode not in (SINGLE, BATCH, MANIFEST):
+            raise ValueError(f"Unknown notification mode {mode}")
+        if mode == MANIFEST and repo is None:
+            raise ValueError("Manifest notifications need a repository")
+        self.publish = publish
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.repo = repo
+        self.keys = []
+        self.size = 0
+        # Trace headers of each buffered key
+        self.headers = []
+        self.lock = asyncio.Lock()
+        self.flusher = None
+
+    def start(self, loop):
+        if self.mode != SINGLE:
+            self.flusher = loop.create_task(self.flush_periodically())
+
+    async def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+        await self.flush()
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Could not notify {len(self.keys)} buffered items, retrying: {e}")
+
+    async def notify(self, stac_type: str, key: str, headers: dict = None):
+        if self.mode == SINGLE or stac_type != 'item':
+            await self.flush()
+            NOTIFIED_KEYS.labels(subject=f'stac_indexer.{stac_type}').inc()
+            await self.publish(f'stac_indexer.{stac_type}', key.encode(), headers)
+            return
+
+        async with self.lock:
+            self.keys.append(key)
+            self.headers.append(headers)
+            self.size += len(key.encode()) + 1
+            if len(self.keys) >= self.batch_size or self.size >= self.max_bytes:
+                await self._flush()
+
+    async def flush(self):
+        async with self.lock:
+            await self._flush()
+
+    def next_batch(self) -> int:
+        """
+        Return the number of buffered keys fitting in the next batch: up to
+        batch_size keys whose newline-delimited body stays within max_bytes,
+        and at least one.
+        """
+        count, size = 0, 0
+        for key in self.keys[:self.batch_size]:
+            size += len(key.encode()) + 1
+            if count and size - 1 > self.max_bytes:
+                break
+            count += 1
+        return count
+
+    async def _flush(self):
+        while self.keys:
+            count = self.next_batch()
+            keys, headers = self.keys[:count], self.headers[:count]
+            body = '\n'.join(keys).encode()
+
+            subject = 'stac_indexer.manifest' if self.mode == MANIFEST else 'stac_indexer.items'
+            with span('notifier.flush', links=headers, subject=subject, keys=count):
+                if self.mode == MANIFEST:
+                    manifest_key = f"{S3_STAC_KEY}_manifests/{datetime.utcnow():%Y%m%dT%H%M%S%f}.txt"
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, lambda: self.repo.add_object(bucket=S3_BUCKET, key=manifest_key, body=body,
+                                                           content_type='text/plain'))
+                    payload = manifest_key.encode()
+                else:
+                    payload = body
+                await self.publish(subject, payload)
+
+            # Keys are only dropped once published, so a failed publish keeps them for the next flush
+            del self.keys[:count]
+            del self.headers[:count]
+            self.size -= len(body) + 1
+            NOTIFIED_KEYS.labels(subject=subject).inc(count)
+            logger.debug(f"Notified {count} items on '{subject}'")
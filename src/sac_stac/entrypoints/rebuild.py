@@ -0,0 +1,130 @@
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import List
+
+from sac_stac.adapters import repository
+from sac_stac.adapters.cog_cache import CogMetadataCache
+from sac_stac.adapters.source import Source, S3Source, FileSystemSource
+from sac_stac.domain.s3 import S3
+from sac_stac.load_config import config, LOG_LEVEL, LOG_FORMAT, get_s3_configuration, get_cog_cache_path, \
+    get_source_root, get_rebuild_configuration
+from sac_stac.service_layer import services
+from sac_stac.util import parse_s3_url
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+S3_ACCESS_KEY_ID = get_s3_configuration()["key_id"]
+S3_SECRET_ACCESS_KEY = get_s3_configuration()["access_key"]
+S3_REGION = get_s3_configuration()["region"]
+S3_ENDPOINT = get_s3_configuration()["endpoint"]
+S3_BUCKET = get_s3_configuration()["bucket"]
+S3_STAC_KEY = get_s3_configuration()["stac_key"]
+
+# Repository and source of each worker process, created by init_worker
+_repo = None
+_source = None
+
+
+def create_repository() -> repository.S3Repository:
+    s3 = S3(key=S3_ACCESS_KEY_ID, secret=S3_SECRET_ACCESS_KEY,
+            s3_endpoint=S3_ENDPOINT, region_name=S3_REGION)
+    cog_cache_path = get_cog_cache_path()
+    return repository.S3Repository(s3, cog_cache=CogMetadataCache(cog_cache_path) if cog_cache_path else None)
+
+
+def create_source():
+    source_root = get_source_root()
+    return FileSystemSource(source_root) if source_root else None
+
+
+def init_worker():
+    global _repo, _source
+    _repo, _source = create_repository(), create_source()
+
+
+def build_shard(sensor_conf: dict, acquisition_keys: List[str], staging_prefix: str):
+    return services.rebuild_stac_items(repo=_repo, sensor_conf=sensor_conf, acquisition_keys=acquisition_keys,
+                                       staging_prefix=staging_prefix, source=_source)
+
+
+def get_sensor_confs(sensor_ids: List[str] = None) -> List[dict]:
+    sensor_confs = [s for s in config.get('sensors') if not sensor_ids or s.get('id') in sensor_ids]
+    missing = set(sensor_ids or []) - {s.get('id') for s in sensor_confs}
+    if missing:
+        raise ValueError(f"No config found for {', '.join(sorted(missing))} sensors")
+    return sensor_confs
+
+
+def get_shards(sensor_confs: List[dict], source: Source, shard_size: int):
+    for sensor_conf in sensor_confs:
+        acquisition_keys = source.get_acquisition_keys(parse_s3_url(sensor_conf.get('s3_url'))[1])
+        logger.info(f"Found {len(acquisition_keys)} {sensor_conf.get('id')} acquisitions")
+        for i in range(0, len(acquisition_keys), shard_size):
+            yield sensor_conf, acquisition_keys[i:i + shard_size]
+
+
+def rebuild(repo: repository.S3Repository, sensor_ids: List[str] = None, processes: int = 1, shard_size: int = 16,
+            source: Source = None, staging_prefix: str = None) -> str:
+    """
+    Rebuild the catalog from scratch: items are built independently by a
+    pool of processes, sharded by sensor and chunks of acquisitions, and
+    written under a staging prefix. Each collection and the root catalog are
+    then assembled once and the staged objects promoted over the live ones,
+    merged with the items ingested in the meantime.
+
+    :param repo: repository the catalog is written to
+    :param sensor_ids: ids of the sensors to rebuild, all configured sensors if not set
+    :param processes: number of worker processes, items are built in this process if 1 or less
+    :param shard_size: number of acquisitions built by each work unit
+    :param source: source products are read from, the bucket of the repository if not set
+    :param staging_prefix: key prefix the catalog is built under before being promoted
+
+    :return: the key of the promoted catalog.
+    """
+    sensor_confs = get_sensor_confs(sensor_ids)
+    staging_prefix = staging_prefix or f"{S3_STAC_KEY}_staging/{datetime.utcnow():%Y%m%dT%H%M%S}"
+    shards = list(get_shards(sensor_confs, source or S3Source(repo, S3_BUCKET), shard_size))
+    logger.info(f"Rebuilding {len(sensor_confs)} collections in {len(shards)} shards under {staging_prefix}...")
+
+    items = {sensor_conf.get('id'): [] for sensor_conf in sensor_confs}
+    if processes <= 1:
+        for sensor_conf, acquisition_keys in shards:
+            items[sensor_conf.get('id')] += services.rebuild_stac_items(
+                repo=repo, sensor_conf=sensor_conf, acquisition_keys=acquisition_keys,
+                staging_prefix=staging_prefix, source=source)
+    else:
+        # Spawned workers do not inherit the threads of the S3 and deadline pools
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker) as executor:
+            futures = {executor.submit(build_shard, sensor_conf, acquisition_keys, staging_prefix):
+                       sensor_conf.get('id') for sensor_conf, acquisition_keys in shards}
+            for done, future in enumerate(as_completed(futures), start=1):
+                items[futures[future]] += future.result()
+                logger.info(f"Rebuilt {done}/{len(futures)} shards")
+
+    services.assemble_stac_catalog(repo=repo, staging_prefix=staging_prefix,
+                                   collections=[(s, items[s.get('id')]) for s in sensor_confs])
+    errors = services.promote_stac_catalog(repo=repo, staging_prefix=staging_prefix)
+    if errors:
+        logger.warning(f"Could not delete {len(errors)} staged objects under {staging_prefix}")
+
+    return services.S3_CATALOG_KEY
+
+
+if __name__ == '__main__':
+    rebuild_config = get_rebuild_configuration()
+    parser = argparse.ArgumentParser(description='Rebuild the STAC catalog from the configured sensors.')
+    parser.add_argument('sensors', nargs='*', help='ids of the sensors to rebuild, all of them if none given')
+    parser.add_argument('--processes', type=int, default=rebuild_config['processes'],
+                        help='number of worker processes')
+    parser.add_argument('--shard-size', type=int, default=rebuild_config['shard_size'],
+                        help='number of acquisitions built by each work unit')
+    args = parser.parse_args()
+
+    rebuild(create_repository(), sensor_ids=args.sensors, processes=args.processes, shard_size=args.shard_size,
+            source=create_source())
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sac_stac.entrypoints.notifier import Notifier
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT
+from sac_stac.metrics import QUEUED, RETRIED_UNITS
+from sac_stac.service_layer.services import add_stac_item, prepare_stac_collection, delete_stac_items
+from sac_stac.tracing import span, inject_context
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+ITEM_LANE = 'item'
+BACKFILL_LANE = 'backfill'
+
+
+class Scheduler:
+    """
+    Run service calls on a thread pool from two lanes with their own worker
+    shares: live item messages on the high priority item lane, and
+    collection backfills split into one work unit per acquisition on the
+    backfill lane, so backfills never hold up live items. Failed units are
+    put back on their lane after a delay instead of holding a worker.
+    Every item written, including those of a backfill, is passed to the
+    notifier as it is done, and the collection once all its units are.
+    Deletions of many items run as a single unit on the item lane.
+    """
+
+    def __init__(self, repo, publish, item_workers: int = 4, backfill_workers: int = 2,
+                 max_retries: int = 3, retry_delay: float = 5.0, source=None, notifier: Notifier = None):
+        """
+        :param repo: repository passed to the services
+        :param publish: coroutine function publishing a subject and payload
+        :param item_workers: number of workers of the item lane
+        :param backfill_workers: number of workers of the backfill lane
+        :param max_retries: number of times a failed unit is retried
+        :param retry_delay: seconds before the first retry, doubled on every attempt
+        :param source: source products are read from, the bucket of the repository if not set
+        :param notifier: notifier of the written keys, publishing each of them on its own if not set
+        """
+        self.repo = repo
+        self.source = source
+        self.notifier = notifier or Notifier(publish)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retrying = set()
+        self.shares = {ITEM_LANE: item_workers, BACKFILL_LANE: backfill_workers}
+        self.lanes = {}
+        self.workers = []
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=item_workers + backfill_workers,
+                                           thread_name_prefix='stac-creator')
+
+    def start(self, loop):
+        self.notifier.start(loop)
+        for lane, share in self.shares.items():
+            self.lanes[lane] = asyncio.Queue()
+            self.workers += [loop.create_task(self.worker(lane)) for _ in range(share)]
+
+    async def stop(self):
+        for retry in self.retrying:
+            retry.cancel()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.notifier.stop()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, lane: str, func, key: str, callback, headers: dict = None, attempt: int = 0):
+        QUEUED.labels(lane=lane).inc()
+        await self.lanes[lane].put((func, key, callback, headers, attempt))
+
+    def retry(self, lane: str, func, key: str, callback, headers: dict, attempt: int):
+        delay = self.retry_delay * 2 ** attempt
+        logger.warning(f"Retrying {func.__name__} on {key} in {delay}s")
+        RETRIED_UNITS.labels(lane=lane).inc()
+
+        async def resubmit():
+            await asyncio.sleep(delay)
+            await self.submit(lane, func, key, callback, headers, attempt + 1)
+
+        task = asyncio.get_running_loop().create_task(resubmit())
+        self.retrying.add(task)
+        task.add_done_callback(self.retrying.discard)
+
+    async def submit_item(self, acquisition_key: str, headers: dict = None):
+        await self.submit(ITEM_LANE, add_stac_item, acquisition_key, self.item_done, headers)
+
+    async def submit_collection(self, sensor_key: str, headers: dict = None):
+        await self.submit(BACKFILL_LANE, prepare_stac_collection, sensor_key, self.collection_prepared, headers)
+
+    async def submit_delete(self, payload: str, headers: dict = None):
+        acquisition_keys = [key for key in payload.splitlines() if key.strip()]
+        if acquisition_keys:
+            await self.submit(ITEM_LANE, delete_stac_items, acquisition_keys, self.items_deleted, headers)
+
+    def call(self, func, key: str, headers: dict):
+        with span('stac_creator.unit', context=headers, function=func.__name__, key=key):
+            return func(self.repo, key, source=self.source), inject_context()
+
+    async def worker(self, lane: str):
+        queue = self.lanes[lane]
+        loop = asyncio.get_running_loop()
+        while True:
+            func, key, callback, headers, attempt = await queue.get()
+            QUEUED.labels(lane=lane).dec()
+            result, context = None, headers
+            try:
+                result, context = await loop.run_in_executor(self.executor, partial(self.call, func, key, headers))
+            except Exception as e:
+                if attempt < self.max_retries:
+                    logger.warning(f"Failed to run {func.__name__} on {key}: {e}")
+                    self.retry(lane, func, key, callback, headers, attempt)
+                    queue.task_done()
+                    continue
+                logger.exception(f"Failed to run {func.__name__} on {key}: {e}")
+            try:
+                await callback(result, context)
+            except Exception as e:
+                logger.exception(f"Failed to complete {func.__name__} on {key}: {e}")
+            finally:
+                queue.task_done()
+
+    async def item_done(self, result, headers: dict):
+        if result and result[1]:
+            stac_type, key = result
+            await self.notifier.notify(stac_type, key, headers)
+
+    async def items_deleted(self, result, headers: dict):
+        if not result:
+            return
+        collection_keys, item_keys = result
+        if item_keys:
+            await self.notifier.notify('delete', '\n'.join(item_keys), headers)
+        for collection_key in collection_keys:
+            await self.notifier.notify('collection', collection_key, headers)
+
+    async def collection_prepared(self, result, headers: dict):
+        if not result or not result[0]:
+            return
+        collection_key, acquisition_keys = result
+        if not acquisition_keys:
+            await self.notifier.notify('collection', collection_key, headers)
+            return
+
+        self.pending[collection_key] = self.pending.get(collection_key, 0) + len(acquisition_keys)
+        logger.info(f"Scheduled {len(acquisition_keys)} acquisitions of {collection_key}")
+        for acquisition_key in acquisition_keys:
+            await self.submit(BACKFILL_LANE, add_stac_item, acquisition_key,
+                              partial(self.unit_done, collection_key), headers)
+
+    async def unit_done(self, collection_key: str, result, headers: dict):
+        try:
+            await self.item_done(result, headers)
+        finally:
+            self.pending[collection_key] -= 1
+            if not self.pending[collection_key]:
+                del self.pending[collection_key]
+                await self.notifier.notify('collection', collection_key, headers)
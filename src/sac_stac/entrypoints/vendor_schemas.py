@@ -0,0 +1,70 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import List
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.request import urlopen
+
+from sac_stac.domain.validation import SCHEMAS_DIR, get_required_schema_uris
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+# The local schemas are written by hand rather than downloaded
+SCHEMA_URIS = [uri for uri in get_required_schema_uris() if not uri.startswith('urn:')]
+
+
+def get_schema_path(uri: str, schemas_dir: Path = SCHEMAS_DIR) -> Path:
+    return schemas_dir / urlparse(uri).netloc / urlparse(uri).path.lstrip('/')
+
+
+def find_refs(schema) -> List[str]:
+    if isinstance(schema, dict):
+        refs = [schema['$ref']] if isinstance(schema.get('$ref'), str) else []
+        return refs + [ref for value in schema.values() for ref in find_refs(value)]
+    if isinstance(schema, list):
+        return [ref for value in schema for ref in find_refs(value)]
+    return []
+
+
+def vendor_schemas(uris: List[str] = None, schemas_dir: Path = SCHEMAS_DIR, fetch=None) -> List[str]:
+    """
+    Download the official JSON schemas, and every schema they reference,
+    into the schemas directory under paths mirroring their URIs. The bodies
+    are written unmodified, to be committed with the sources so that neither
+    validation nor the image build needs network access.
+
+    :param uris: URIs of the schemas to vendor, the core and extension schemas of the STAC version if not set
+    :param schemas_dir: directory the schemas are written to
+    :param fetch: function returning the body under a URI, an HTTP GET if not set
+
+    :return: the URIs of the vendored schemas.
+    """
+    fetch = fetch or (lambda uri: urlopen(uri, timeout=30).read())
+    queue, vendored = list(uris or SCHEMA_URIS), []
+    while queue:
+        uri = urldefrag(queue.pop(0))[0]
+        if uri in vendored:
+            continue
+        body = fetch(uri)
+        path = get_schema_path(uri, schemas_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+        vendored.append(uri)
+        logger.info(f"Vendored {uri} in {path}")
+
+        schema = json.loads(body)
+        base_uri = urljoin(uri, schema.get('$id', uri)) if isinstance(schema, dict) else uri
+        queue += [urljoin(base_uri, ref) for ref in find_refs(schema)]
+    return vendored
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vendor the official STAC JSON schemas items are validated against.')
+    parser.add_argument('uris', nargs='*', help='schema URIs to vendor, the core and extension schemas if none given')
+    args = parser.parse_args()
+
+    vendor_schemas(args.uris)
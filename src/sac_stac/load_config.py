@@ -26,3 +26,85 @@ def get_s3_configuration():
     stac_key = os.environ.get("S3_STAC_KEY", 'stac_catalogs/cs_stac')
     return dict(key_id=key_id, access_key=access_key, region=region,
                 endpoint=endpoint, bucket=bucket, stac_key=stac_key)
+
+
+def get_metrics_port():
+    port = os.environ.get("METRICS_PORT", None)
+    return int(port) if port else None
+
+
+def get_tracing_configuration():
+    exporter = os.environ.get("TRACING_EXPORTER", None)
+    path = os.environ.get("TRACING_FILE", 'traces.jsonl')
+    return dict(exporter=exporter, path=path)
+
+
+def get_cog_cache_path():
+    return os.environ.get("COG_CACHE_PATH", None)
+
+
+def get_throttling_configuration():
+    max_concurrency = int(os.environ.get("S3_MAX_CONCURRENCY", 64))
+    rate = os.environ.get("S3_RATE", None)
+    latency_target = float(os.environ.get("S3_LATENCY_TARGET", 2.0))
+    max_retries = int(os.environ.get("S3_MAX_RETRIES", 8))
+    # Only requests on a single small object are expected to answer within the target
+    latency_targets = {operation: latency_target
+                       for operation in ('head_object', 'get_object', 'put_object', 'copy_object')}
+    return dict(max_concurrency=max_concurrency, rate=float(rate) if rate else None,
+                latency_targets=latency_targets, max_retries=max_retries)
+
+
+def get_scheduler_configuration():
+    item_workers = int(os.environ.get("ITEM_WORKERS", 4))
+    backfill_workers = int(os.environ.get("BACKFILL_WORKERS", 2))
+    max_retries = int(os.environ.get("UNIT_RETRIES", 3))
+    retry_delay = float(os.environ.get("UNIT_RETRY_DELAY", 5.0))
+    return dict(item_workers=item_workers, backfill_workers=backfill_workers,
+                max_retries=max_retries, retry_delay=retry_delay)
+
+
+def get_deadline_configuration():
+    s3_get = float(os.environ.get("S3_GET_DEADLINE", 30))
+    cog_read = float(os.environ.get("COG_READ_DEADLINE", 60))
+    hedge = os.environ.get("HEDGE_REQUESTS", "false").lower() in ("true", "yes", "1")
+    hedge_quantile = float(os.environ.get("HEDGE_QUANTILE", 0.95))
+    return dict(deadlines={'get_object': s3_get, 'cog_read': cog_read},
+                hedge=hedge, hedge_quantile=hedge_quantile)
+
+
+def get_timeout_configuration():
+    connect_timeout = float(os.environ.get("S3_CONNECT_TIMEOUT", 5))
+    read_timeout = float(os.environ.get("S3_READ_TIMEOUT", 20))
+    return dict(connect_timeout=connect_timeout, read_timeout=read_timeout)
+
+
+def get_source_root():
+    return os.environ.get("SOURCE_ROOT", None)
+
+
+def get_rebuild_configuration():
+    processes = int(os.environ.get("REBUILD_PROCESSES", os.cpu_count() or 1))
+    shard_size = int(os.environ.get("REBUILD_SHARD_SIZE", 16))
+    return dict(processes=processes, shard_size=shard_size)
+
+
+def get_notification_configuration():
+    mode = os.environ.get("NOTIFICATION_MODE", "single")
+    batch_size = int(os.environ.get("NOTIFICATION_BATCH_SIZE", 500))
+    flush_interval = float(os.environ.get("NOTIFICATION_FLUSH_INTERVAL", 5.0))
+    return dict(mode=mode, batch_size=batch_size, flush_interval=flush_interval)
+
+
+def get_validation_configuration():
+    return os.environ.get("STAC_VALIDATION", "false").lower() in ("true", "yes", "1")
+
+
+def get_item_index_configuration():
+    enabled = os.environ.get("ITEM_INDEX", "true").lower() in ("true", "yes", "1")
+    compaction_interval = int(os.environ.get("ITEM_INDEX_COMPACTION_INTERVAL", 100))
+    return dict(enabled=enabled, compaction_interval=compaction_interval)
+
+
+def get_update_configuration():
+    return os.environ.get("UPDATE_ITEMS", "false").lower() in ("true", "yes", "1")
@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_SECONDS = Histogram(
+    'sac_stac_stage_seconds',
+    'Time spent on each ingestion stage.',
+    ['stage'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+)
+IN_FLIGHT = Gauge(
+    'sac_stac_in_flight',
+    'Number of ingestion stages currently in progress.',
+    ['stage']
+)
+QUEUED = Gauge(
+    'sac_stac_queued',
+    'Number of work units waiting in each scheduler lane.',
+    ['lane']
+)
+MESSAGES = Counter(
+    'sac_stac_messages_total',
+    'Number of NATS messages received.',
+    ['subject']
+)
+S3_REQUESTS = Counter(
+    'sac_stac_s3_requests_total',
+    'Number of requests sent to S3.',
+    ['operation']
+)
+S3_ERRORS = Counter(
+    'sac_stac_s3_errors_total',
+    'Number of failed requests sent to S3.',
+    ['operation']
+)
+S3_SKIPPED_WRITES = Counter(
+    'sac_stac_s3_skipped_writes_total',
+    'Number of PUTs skipped because the stored object already had the same content.'
+)
+S3_WRITE_CONFLICTS = Counter(
+    'sac_stac_s3_write_conflicts_total',
+    'Number of conditional writes applied again because the object changed since it was read.'
+)
+S3_RETRIES = Counter(
+    'sac_stac_s3_retries_total',
+    'Number of requests retried after the endpoint throttled them.',
+    ['operation']
+)
+S3_CONCURRENCY_LIMIT = Gauge(
+    'sac_stac_s3_concurrency_limit',
+    'Current adaptive limit of concurrent S3 requests and COG reads.'
+)
+DEADLINES_EXCEEDED = Counter(
+    'sac_stac_deadlines_exceeded_total',
+    'Number of remote reads abandoned after their deadline.',
+    ['operation']
+)
+HEDGED_REQUESTS = Counter(
+    'sac_stac_hedged_requests_total',
+    'Number of duplicate requests sent after a remote read exceeded the hedging latency.',
+    ['operation']
+)
+RETRIED_UNITS = Counter(
+    'sac_stac_retried_units_total',
+    'Number of failed work units sent to the retry queue.',
+    ['lane']
+)
+NOTIFIED_KEYS = Counter(
+    'sac_stac_notified_keys_total',
+    'Number of STAC keys notified to the indexer, by subject.',
+    ['subject']
+)
+VALIDATION_ERRORS = Counter(
+    'sac_stac_validation_errors_total',
+    'Number of STAC objects rejected by schema validation.',
+    ['type']
+)
+S3_BYTES = Counter(
+    'sac_stac_s3_bytes_total',
+    'Number of bytes transferred to or from S3.',
+    ['direction']
+)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the wrapped block or function under the given stage and track it as in flight.
+    """
+    with STAGE_SECONDS.labels(stage=name).time(), IN_FLIGHT.labels(stage=name).track_inprogress():
+        yield
+
+
+@contextmanager
+def s3_request(operation: str):
+    """
+    Count and time the wrapped S3 request, counting it as failed if it raises.
+    """
+    S3_REQUESTS.labels(operation=operation).inc()
+    with stage(f"s3_{operation}"), S3_ERRORS.labels(operation=operation).count_exceptions():
+        yield
@@ -1,16 +1,35 @@
+import copy
 import json
 import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 from geopandas import GeoSeries
-from pystac import Catalog, Extent, SpatialExtent, TemporalExtent, Asset, MediaType, STAC_IO
+from pystac import Catalog, Extent, SpatialExtent, TemporalExtent, Asset, MediaType
 from pystac.extensions.eo import Band
-
-from sac_stac.adapters.repository import S3Repository, NoObjectError
-from sac_stac.domain.model import SacCollection, SacItem
+from pystac.utils import str_to_datetime
+from rasterio.errors import RasterioError
+
+from sac_stac.adapters.repository import S3Repository, NoObjectError, ConflictError, stac_io
+from sac_stac.adapters.source import Source, S3Source
+from sac_stac.domain.index import get_index_record, append_index_records, read_index_records, to_geoparquet, \
+    get_collection_items
+from sac_stac.domain.model import SacCollection, SacItem, add_item_to_collection_dict, add_items_to_collection_dict, \
+    add_child_to_catalog_dict, remove_items_from_collection_dict, FINGERPRINTS_PROPERTY, fingerprints_to_dict
 from sac_stac.domain.operations import obtain_date_from_filename, get_geometry_from_cog, \
-    get_projection_from_cog
-from sac_stac.load_config import config, LOG_LEVEL, LOG_FORMAT, get_s3_configuration
+    get_band_metadata_from_cog, match_bands_to_products, get_smallest_product_key, read_lowest_overview, \
+    render_thumbnail, get_fingerprints_digest, get_changed_products
+from sac_stac.domain.validation import StacValidator, StacValidationError
+from sac_stac.load_config import config, LOG_LEVEL, LOG_FORMAT, get_s3_configuration, get_validation_configuration, \
+    get_item_index_configuration, get_update_configuration
+from sac_stac.metrics import stage
+from sac_stac.tracing import in_current_context
+from sac_stac.util import get_rel_links
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
@@ -21,181 +40,539 @@ S3_STAC_KEY = get_s3_configuration()["stac_key"]
 S3_CATALOG_KEY = f"{S3_STAC_KEY}/catalog.json"
 S3_HREF = f"{S3_ENDPOINT}/{S3_BUCKET}"
 GENERIC_EPSG = 4326
+BAND_READ_WORKERS = 8
+COPY_WORKERS = 16
+THUMBNAIL_FORMATS = {'PNG': ('png', MediaType.PNG), 'JPEG': ('jpg', MediaType.JPEG)}
+ITEM_INDEX = get_item_index_configuration()["enabled"]
+ITEM_INDEX_COMPACTION_INTERVAL = get_item_index_configuration()["compaction_interval"]
+UPDATE_ITEMS = get_update_configuration()
+
+validator = StacValidator() if get_validation_configuration() else None
+
+# One pool bounds the raster reads of every item built concurrently, rather than one pool per item
+band_read_executor = ThreadPoolExecutor(max_workers=BAND_READ_WORKERS, thread_name_prefix='band-read')
+
+_object_locks = {}
+_object_locks_lock = threading.Lock()
+# Index parts written by this process for each collection since its last compaction
+_index_parts = {}
+_index_parts_lock = threading.Lock()
+
+
+def get_collection_key(collection_id: str) -> str:
+    return f"{S3_STAC_KEY}/{collection_id}/collection.json"
+
+
+def get_item_key(collection_id: str, item_id: str) -> str:
+    return f"{S3_STAC_KEY}/{collection_id}/{item_id}/{item_id}.json"
+
+
+def get_item_index_parts_prefix(collection_id: str) -> str:
+    return f"{S3_STAC_KEY}/{collection_id}/items/"
+
+
+def get_item_index_key(collection_id: str, extension: str = 'ndjson') -> str:
+    return f"{S3_STAC_KEY}/{collection_id}/items.{extension}"
+
+
+def get_item_fingerprints(item_dict: dict) -> dict:
+    return {key: (f.get('size'), f.get('etag'), f.get('last_modified'))
+            for key, f in item_dict.get('properties', {}).get(FINGERPRINTS_PROPERTY, {}).items()}
+
+
+def get_href(key: str) -> str:
+    return f"{S3_HREF}/{key}"
+
+
+def get_staging_key(key: str, staging_prefix: str = None) -> str:
+    if not staging_prefix:
+        return key
+    return f"{staging_prefix}{key[len(S3_STAC_KEY):]}"
+
+
+def validate(stac_dict: dict):
+    if validator is not None:
+        validator.validate(stac_dict)
+
+
+def object_lock(key: str) -> threading.Lock:
+    """
+    Return the lock serialising read-modify-writes of the given STAC object
+    within this process.
+    """
+    with _object_locks_lock:
+        return _object_locks.setdefault(key, threading.Lock())
+
+
+def stac_io_scope(func):
+    """
+    Run the service function with pystac reads scoped to its repository.
+    """
+    @wraps(func)
+    def wrapper(repo: S3Repository, *args, **kwargs):
+        with stac_io(repo):
+            return func(repo, *args, **kwargs)
+    return wrapper
+
 
+@stage('add_thumbnail')
+def add_thumbnail(repo: S3Repository, source: Source, item: SacItem, item_key: str, rgb_products: dict,
+                  thumbnail_conf: dict, staging_prefix: str = None):
+    rgb_keys = [rgb_products.get(common_name, (None, None))[0] for common_name in ('red', 'green', 'blue')]
+    if not all(rgb_keys):
+        logger.warning(f"No red, green and blue bands to build the {item.id} thumbnail.")
+        return
 
-def add_stac_collection(repo: S3Repository, sensor_key: str):
-    STAC_IO.read_text_method = repo.stac_read_method
+    max_size = thumbnail_conf.get('max_size', 256)
+    height, width = rgb_products['red'][1]
+    factor = max(1, -(-max(height, width) // max_size))
+    out_shape = (max(1, height // factor), max(1, width // factor))
+    extension, media_type = THUMBNAIL_FORMATS[thumbnail_conf.get('format', 'PNG')]
 
     try:
-        catalog_dict = repo.get_dict(bucket=S3_BUCKET, key=S3_CATALOG_KEY)
-        catalog = Catalog.from_dict(catalog_dict)
-    except NoObjectError:
-        logger.info(f"No catalog found in {S3_CATALOG_KEY}")
-        logger.info("Creating new catalog...")
-        catalog = Catalog(
-            id=config.get('id'),
-            title=config.get('title'),
-            description=config.get('description'),
-            stac_extensions=config.get('stac_extensions')
+        bands = list(band_read_executor.map(in_current_context(
+            lambda key: read_lowest_overview(source.get_cog_url(key), out_shape=out_shape)), rgb_keys))
+        image = render_thumbnail(bands, driver=thumbnail_conf.get('format', 'PNG'))
+    except (RasterioError, TimeoutError, ValueError) as e:
+        logger.warning(f"Could not build the {item.id} thumbnail: {e}")
+        return
+
+    thumbnail_key = f"{item_key.rsplit('/', 1)[0]}/{item.id}_thumbnail.{extension}"
+    repo.add_object(bucket=S3_BUCKET, key=get_staging_key(thumbnail_key, staging_prefix), body=image,
+                    content_type=media_type)
+    item.add_thumbnail(href=get_href(thumbnail_key), media_type=media_type)
+
+
+@stage('write_item_index')
+def write_item_index(repo: S3Repository, collection_id: str, records: List[dict], staging_prefix: str = None):
+    repo.add_object(
+        bucket=S3_BUCKET,
+        key=get_staging_key(get_item_index_key(collection_id), staging_prefix),
+        body=append_index_records(b'', records),
+        content_type='application/x-ndjson'
+    )
+    parquet = to_geoparquet(records)
+    if parquet is not None:
+        repo.add_object(
+            bucket=S3_BUCKET,
+            key=get_staging_key(get_item_index_key(collection_id, 'parquet'), staging_prefix),
+            body=parquet,
+            content_type='application/vnd.apache.parquet'
         )
 
+
+@stage('update_item_index')
+def update_item_index(repo: S3Repository, collection_id: str, records: List[dict]):
+    """
+    Record items in the collection index by writing their records to a new
+    part object, one PUT whatever the size of the index, and compact the
+    parts every ITEM_INDEX_COMPACTION_INTERVAL parts written by this process.
+    """
+    part_key = f"{get_item_index_parts_prefix(collection_id)}" \
+               f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.ndjson"
+    repo.add_object(bucket=S3_BUCKET, key=part_key, body=append_index_records(b'', records),
+                    content_type='application/x-ndjson')
+
+    with _index_parts_lock:
+        _index_parts[collection_id] = _index_parts.get(collection_id, 0) + 1
+        compact = _index_parts[collection_id] >= ITEM_INDEX_COMPACTION_INTERVAL
+        if compact:
+            _index_parts[collection_id] = 0
+    if compact:
+        compact_item_index(repo=repo, collection_id=collection_id)
+
+
+def get_item_index_part_keys(repo: S3Repository, collection_id: str) -> List[str]:
+    try:
+        # Part keys start with their write time, so they list in write order
+        return sorted(repo.get_keys(bucket=S3_BUCKET, prefix=get_item_index_parts_prefix(collection_id)))
+    except NoObjectError:
+        return []
+
+
+def read_item_index(repo: S3Repository, collection_id: str) -> Tuple[Optional[List[dict]], List[str]]:
+    """
+    Read the records of a collection index, its parts merged over its last
+    compaction, the last record of an item winning.
+
+    :return: the records, None if there is no index, and the keys of the merged parts.
+    """
+    part_keys = get_item_index_part_keys(repo=repo, collection_id=collection_id)
+    try:
+        body = repo.get_object(bucket=S3_BUCKET, key=get_item_index_key(collection_id))
+    except NoObjectError:
+        if not part_keys:
+            return None, []
+        body = b''
+    parts = band_read_executor.map(in_current_context(
+        lambda key: repo.get_object(bucket=S3_BUCKET, key=key)), part_keys)
+    return read_index_records(body + b''.join(parts)), part_keys
+
+
+def replace_item_index(repo: S3Repository, collection_id: str, records: List[dict], part_keys: List[str]):
+    """
+    Write the records as the compacted index of a collection, then delete the
+    parts they were merged from. Callers hold the lock of the index.
+    """
+    write_item_index(repo=repo, collection_id=collection_id, records=records)
+    errors = repo.delete_objects(bucket=S3_BUCKET, keys=part_keys)
+    if errors:
+        logger.warning(f"Could not delete {len(errors)} index parts of {collection_id}: {sorted(errors)}")
+
+
+@stage('compact_item_index')
+def compact_item_index(repo: S3Repository, collection_id: str):
+    with object_lock(get_item_index_key(collection_id)):
+        records, part_keys = read_item_index(repo=repo, collection_id=collection_id)
+        if records is not None:
+            replace_item_index(repo=repo, collection_id=collection_id, records=records, part_keys=part_keys)
+
+
+@stage('prepare_stac_collection')
+@stac_io_scope
+def prepare_stac_collection(repo: S3Repository, sensor_key: str, source: Source = None) -> Tuple[str, List[str]]:
+    source = source or S3Source(repo, S3_BUCKET)
     sensor_name = sensor_key.split('/')[-2]
     sensor_configs = [s for s in config.get('sensors')]
     try:
         sensor_conf = [s for s in sensor_configs if s.get('id') == sensor_name][0]
     except IndexError:
         logger.warning(f"No config found for {sensor_name} sensor")
-        return 'collection', None
+        return None, []
 
-    collection_key = f"{S3_STAC_KEY}/{sensor_name}/collection.json"
+    collection_key = get_collection_key(sensor_name)
     try:
-        repo.get_dict(bucket=S3_BUCKET, key=collection_key)
+        with object_lock(S3_CATALOG_KEY), object_lock(collection_key):
+            add_collection_to_catalog(repo=repo, sensor_conf=sensor_conf, collection_key=collection_key)
+    except StacValidationError as e:
+        logger.error(f"Could not add {sensor_name} collection: {e}")
+        return None, []
+
+    acquisition_keys = source.get_acquisition_keys(sensor_key)
+    return collection_key, acquisition_keys
+
+
+def new_catalog_dict() -> dict:
+    catalog = Catalog(
+        id=config.get('id'),
+        title=config.get('title'),
+        description=config.get('description'),
+        stac_extensions=config.get('stac_extensions'),
+        href=get_href(S3_CATALOG_KEY)
+    )
+    return catalog.to_dict()
+
+
+def build_stac_collection(sensor_conf: dict, collection_key: str, catalog_dict: dict) -> SacCollection:
+    collection = SacCollection(
+        id=sensor_conf.get('id'),
+        title=sensor_conf.get('title'),
+        description=sensor_conf.get('description'),
+        extent=Extent(SpatialExtent([[0, 0, 0, 0]]), TemporalExtent([["", ""]])),
+        properties={}
+    )
+
+    collection.add_providers(sensor_conf)
+    collection.add_product_definition_extension(
+        product_definition=sensor_conf.get('extensions').get('product_definition'),
+        bands_metadata=sensor_conf.get('extensions').get('eo').get('bands')
+    )
+
+    catalog_href = get_href(S3_CATALOG_KEY)
+    collection.add_catalog_links(
+        catalog_href=catalog_href,
+        root_href=next(iter(get_rel_links(catalog_dict, 'root')), catalog_href)
+    )
+    collection.set_self_href(get_href(collection_key))
+    return collection
+
+
+def add_collection_to_catalog(repo: S3Repository, sensor_conf: dict, collection_key: str):
+    sensor_name = sensor_conf.get('id')
+    if repo.exists(bucket=S3_BUCKET, key=collection_key):
         logger.info(f"Collection {sensor_name} already exists in {collection_key}")
-    except NoObjectError:
-        logger.info(f"Creating {sensor_name} collection...")
-        collection = SacCollection(
-            id=sensor_conf.get('id'),
-            title=sensor_conf.get('title'),
-            description=sensor_conf.get('description'),
-            extent=Extent(SpatialExtent([[0, 0, 0, 0]]), TemporalExtent([["", ""]])),
-            properties={}
-        )
-
-        collection.add_providers(sensor_conf)
-        collection.add_product_definition_extension(
-            product_definition=sensor_conf.get('extensions').get('product_definition'),
-            bands_metadata=sensor_conf.get('extensions').get('eo').get('bands')
-        )
+    else:
+        try:
+            catalog_dict, catalog_etag = repo.get_dict_with_etag(bucket=S3_BUCKET, key=S3_CATALOG_KEY)
+        except NoObjectError:
+            logger.info(f"No catalog found in {S3_CATALOG_KEY}")
+            logger.info("Creating new catalog...")
+            catalog_dict, catalog_etag = new_catalog_dict(), None
 
-        catalog.add_child(collection)
-        catalog.normalize_hrefs(f"{S3_HREF}/{S3_STAC_KEY}")
+        logger.info(f"Creating {sensor_name} collection...")
+        collection = build_stac_collection(sensor_conf=sensor_conf, collection_key=collection_key,
+                                           catalog_dict=catalog_dict)
+        collection_dict = collection.to_dict()
+        validate(collection_dict)
+        add_child_to_catalog_dict(catalog_dict=catalog_dict, child_href=collection.get_self_href())
 
         # TODO: Replace STAC_IO.write_text_method
         repo.add_json_from_dict(
             bucket=S3_BUCKET,
             key=S3_CATALOG_KEY,
-            stac_dict=catalog.to_dict()
+            stac_dict=catalog_dict,
+            etag=catalog_etag
         )
 
         repo.add_json_from_dict(
             bucket=S3_BUCKET,
             key=collection_key,
-            stac_dict=collection.to_dict()
+            stac_dict=collection_dict
         )
         logger.info(f"{sensor_name} collection added to {S3_CATALOG_KEY}")
 
-    acquisition_keys = repo.get_acquisition_keys(bucket=S3_BUCKET,
-                                                 acquisition_prefix=sensor_key)
+
+@stage('add_stac_collection')
+@stac_io_scope
+def add_stac_collection(repo: S3Repository, sensor_key: str, source: Source = None):
+    collection_key, acquisition_keys = prepare_stac_collection(repo=repo, sensor_key=sensor_key, source=source)
     for acquisition_key in acquisition_keys:
-        add_stac_item(repo=repo, acquisition_key=acquisition_key)
+        add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source)
 
     return 'collection', collection_key
 
 
-def add_stac_item(repo: S3Repository, acquisition_key: str):
-    STAC_IO.read_text_method = repo.stac_read_method
+def build_stac_item(repo: S3Repository, source: Source, acquisition_key: str, sensor_conf: dict, collection_id: str,
+                    collection_href: str, root_href: str, item_key: str, staging_prefix: str = None,
+                    product_fingerprints: dict = None) -> SacItem:
+    # Get date from acquisition name
+    date = obtain_date_from_filename(
+        file=acquisition_key,
+        regex=sensor_conf.get('formatting').get('date').get('regex'),
+        date_format=sensor_conf.get('formatting').get('date').get('format')
+    )
+
+    # Get sample product and extract geometry
+    try:
+        product_fingerprints = product_fingerprints or source.get_product_fingerprints(acquisition_key)
+        product_sample_key = get_smallest_product_key(product_fingerprints)
+        geometry, crs = get_geometry_from_cog(
+            source.get_cog_url(product_sample_key),
+            cache=repo.cog_cache,
+            fingerprint=product_fingerprints.get(product_sample_key),
+            footprint=sensor_conf.get('footprint', {}).get('enabled', False),
+            simplify_tolerance=sensor_conf.get('footprint', {}).get('simplify_tolerance')
+        )
+    except NoObjectError:
+        logger.error(f"No bands found on {acquisition_key} acquisition.")
+        raise
+
+    with stage('reproject'):
+        item_geometry = json.loads(
+            GeoSeries([geometry], crs=crs).to_crs(GENERIC_EPSG).to_json()).get('features')[0].get('geometry')
+
+    item = SacItem(
+        id=Path(acquisition_key).stem,
+        datetime=date,
+        geometry=item_geometry,
+        bbox=list(geometry.bounds),
+        properties={}
+    )
+
+    item.ext.enable('projection')
+    item.ext.projection.epsg = GENERIC_EPSG
+    item.set_product_fingerprints(product_fingerprints)
+
+    item.add_extensions(sensor_conf.get('extensions'))
+    item.add_common_metadata(sensor_conf.get('common_metadata'))
+
+    bands_metadata = sensor_conf.get('extensions').get('eo').get('bands')
+    band_products = match_bands_to_products(
+        product_keys=list(product_fingerprints),
+        band_names=[b.get('name') for b in bands_metadata],
+        regex=sensor_conf.get('formatting').get('band', {}).get('regex')
+    )
+
+    # Read the metadata of every band concurrently, reused below when building the assets
+    product_keys = sorted(set(band_products.values()))
+    band_metadata = dict(zip(product_keys, band_read_executor.map(in_current_context(
+        lambda key: get_band_metadata_from_cog(
+            source.get_cog_url(key),
+            cache=repo.cog_cache,
+            fingerprint=product_fingerprints.get(key),
+            statistics=sensor_conf.get('statistics', {}).get('enabled', False)
+        )), product_keys)))
+
+    rgb_products = {}
+    for band_name, band_common_name in [(b.get('name'), b.get('common_name')) for b in bands_metadata]:
+        asset_href = ''
+        proj_shp = [0, 0]
+        proj_tran = [0, 0, 0, 0, 0, 0]
+        raster_band = None
+
+        product_key = band_products.get(band_name)
+
+        if product_key:
+            asset_href = get_href(product_key)
+            proj_shp, proj_tran, raster_band = band_metadata.get(product_key)
+            if band_common_name in ('red', 'green', 'blue') and proj_shp:
+                rgb_products[band_common_name] = (product_key, proj_shp)
+        else:
+            logger.warning(f"{band_name} band not found on {collection_id}/{item.id} acquisition.")
+
+        asset = Asset(
+            href=asset_href,
+            media_type=MediaType.COG
+        )
+
+        # Set Projection
+        item.ext.projection.set_transform(proj_tran, asset)
+        item.ext.projection.set_shape(proj_shp, asset)
 
+        # Set bands
+        item.ext.eo.set_bands([Band.create(
+            name=band_common_name, common_name=band_common_name)],
+            asset
+        )
+        if raster_band:
+            item.set_raster_bands(asset, [raster_band])
+        logger.debug(f"[Asset] Adding {asset_href} asset to {acquisition_key}...")
+        item.add_asset(key=band_common_name, asset=asset)
+
+    if sensor_conf.get('thumbnail', {}).get('enabled'):
+        add_thumbnail(repo=repo, source=source, item=item, item_key=item_key, rgb_products=rgb_products,
+                      thumbnail_conf=sensor_conf.get('thumbnail'), staging_prefix=staging_prefix)
+
+    item.add_collection_links(
+        collection_id=collection_id,
+        collection_href=collection_href,
+        root_href=root_href
+    )
+    item.set_self_href(get_href(item_key))
+
+    return item
+
+
+@stage('patch_stac_item')
+def patch_stac_item(repo: S3Repository, source: Source, item_dict: dict, sensor_conf: dict,
+                    product_fingerprints: dict) -> Optional[dict]:
+    """
+    Patch the assets of an existing item whose products were rewritten in
+    place, returning None when the item has to be built again: products were
+    added or removed, or the product the geometry or thumbnail is read from
+    changed.
+    """
+    changed_keys = get_changed_products(item_dict.get('properties', {}).get(FINGERPRINTS_PROPERTY),
+                                        product_fingerprints)
+    if changed_keys is None or get_smallest_product_key(product_fingerprints) in changed_keys:
+        return None
+
+    changed_assets = {asset_key: product_key for product_key in changed_keys
+                      for asset_key, asset in item_dict.get('assets', {}).items()
+                      if asset.get('href') == get_href(product_key)}
+    if sensor_conf.get('thumbnail', {}).get('enabled') and {'red', 'green', 'blue'} & set(changed_assets):
+        return None
+
+    logger.info(f"Patching {sorted(changed_assets)} assets of {item_dict.get('id')}")
+    band_metadata = dict(zip(changed_assets, band_read_executor.map(in_current_context(
+        lambda key: get_band_metadata_from_cog(
+            source.get_cog_url(key),
+            cache=repo.cog_cache,
+            fingerprint=product_fingerprints.get(key),
+            statistics=sensor_conf.get('statistics', {}).get('enabled', False)
+        )), changed_assets.values())))
+
+    for asset_key, (proj_shp, proj_tran, raster_band) in band_metadata.items():
+        asset = item_dict['assets'][asset_key]
+        asset['proj:shape'] = proj_shp
+        asset['proj:transform'] = proj_tran
+        if raster_band:
+            asset['raster:bands'] = [raster_band]
+
+    item_dict['properties'][FINGERPRINTS_PROPERTY] = fingerprints_to_dict(product_fingerprints)
+    return item_dict
+
+
+@stage('add_stac_item')
+@stac_io_scope
+def add_stac_item(repo: S3Repository, acquisition_key: str, source: Source = None, update: bool = None):
+    source = source or S3Source(repo, S3_BUCKET)
+    update = UPDATE_ITEMS if update is None else update
     sensor_name = acquisition_key.split('/')[-3]
-    collection_key = f"{S3_STAC_KEY}/{sensor_name}/collection.json"
+    collection_key = get_collection_key(sensor_name)
     logger.debug(f"[Item] Adding {acquisition_key} item to {sensor_name}...")
 
     try:
-        collection_dict = repo.get_dict(bucket=S3_BUCKET, key=collection_key)
-        collection = SacCollection.from_dict(collection_dict)
+        # The id and root link come in a single read of the start of the collection
+        collection_fields = repo.get_dict_fields(bucket=S3_BUCKET, key=collection_key, fields=['id'],
+                                                 link_rels=['root'])
+        collection_id = collection_fields['id']
 
         item_id = acquisition_key.split('/')[-2]
-        item_key = f"{S3_STAC_KEY}/{collection.id}/{item_id}/{item_id}.json"
-        try:
-            repo.get_dict(bucket=S3_BUCKET, key=item_key)
+        item_key = get_item_key(collection_id, item_id)
+        head = repo.head(bucket=S3_BUCKET, key=item_key)
+        exists = head is not None
+        if exists and not update:
             logger.info(f"Item {item_id} already exists in {item_key}")
-        except NoObjectError:
-            sensor_conf = [s for s in config.get('sensors') if s.get('id') == collection.id][0]
+            return 'item', item_key
+
+        sensor_conf = [s for s in config.get('sensors') if s.get('id') == collection_id][0]
+        product_fingerprints = source.get_product_fingerprints(acquisition_key)
+        fingerprints_digest = get_fingerprints_digest(product_fingerprints)
+
+        item_dict = None
+        if exists:
+            # The digest kept in the object metadata comes with the HEAD above
+            if head['metadata'].get('fingerprint') == fingerprints_digest:
+                logger.info(f"Item {item_id} is up to date in {item_key}")
+                return 'item', None
+            stored_dict = repo.get_dict(bucket=S3_BUCKET, key=item_key)
+            if 'fingerprint' not in head['metadata'] and get_changed_products(
+                    stored_dict.get('properties', {}).get(FINGERPRINTS_PROPERTY), product_fingerprints) == []:
+                # Items written without the digest are compared on their fingerprints property once,
+                # and given the digest so the next passes only need the HEAD
+                repo.add_json_from_dict(bucket=S3_BUCKET, key=item_key, stac_dict=stored_dict,
+                                        metadata={'fingerprint': fingerprints_digest})
+                logger.info(f"Item {item_id} is up to date in {item_key}, recorded its fingerprint digest")
+                return 'item', None
+            item_dict = patch_stac_item(repo=repo, source=source, item_dict=stored_dict,
+                                        sensor_conf=sensor_conf, product_fingerprints=product_fingerprints)
+
+        if item_dict is None:
             logger.debug(f"[Item] Creating {item_id} item...")
-            # Get date from acquisition name
-            date = obtain_date_from_filename(
-                file=acquisition_key,
-                regex=sensor_conf.get('formatting').get('date').get('regex'),
-                date_format=sensor_conf.get('formatting').get('date').get('format')
+            collection_href = get_href(collection_key)
+            item = build_stac_item(
+                repo=repo,
+                source=source,
+                acquisition_key=acquisition_key,
+                sensor_conf=sensor_conf,
+                collection_id=collection_id,
+                collection_href=collection_href,
+                root_href=next((link.get('href') for link in collection_fields['links']), collection_href),
+                item_key=item_key,
+                product_fingerprints=product_fingerprints
             )
 
-            # Get sample product and extract geometry
-            try:
-                product_sample_key = repo.get_smallest_product_key(
-                    bucket=S3_BUCKET,
-                    products_prefix=acquisition_key
+            with stage('to_dict'):
+                item_dict = item.to_dict()
+        validate(item_dict)
+
+        def add_item(collection_dict: Optional[dict]) -> dict:
+            if collection_dict is None:
+                raise NoObjectError(f"No valid collection in {collection_key}")
+            with stage('update_collection'):
+                add_item_to_collection_dict(
+                    collection_dict=collection_dict,
+                    item_href=get_href(item_key),
+                    bbox=item_dict.get('bbox'),
+                    item_datetime=str_to_datetime(item_dict['properties']['datetime'])
                 )
-                product_sample_href = f"{S3_HREF}/{product_sample_key}"
-                geometry, crs = get_geometry_from_cog(product_sample_href)
-            except NoObjectError:
-                logger.error(f"No bands found on {acquisition_key} acquisition.")
-                raise
-
-            item = SacItem(
-                id=Path(acquisition_key).stem,
-                datetime=date,
-                geometry=json.loads(GeoSeries([geometry], crs=crs).to_crs(GENERIC_EPSG).to_json()).get('features')[0].get(
-                    'geometry'),
-                bbox=list(geometry.bounds),
-                properties={}
-            )
-
-            item.ext.enable('projection')
-            item.ext.projection.epsg = GENERIC_EPSG
+            return collection_dict
 
-            item.add_extensions(sensor_conf.get('extensions'))
-            item.add_common_metadata(sensor_conf.get('common_metadata'))
+        with object_lock(collection_key):
+            # Other workers, here or in other processes, may have added items since the collection was read
+            repo.update_dict(bucket=S3_BUCKET, key=collection_key, update=add_item)
 
-            bands_metadata = sensor_conf.get('extensions').get('eo').get('bands')
-            product_keys = repo.get_product_keys(bucket=S3_BUCKET, products_prefix=acquisition_key)
-
-            for band_name, band_common_name in [(b.get('name'), b.get('common_name')) for b in bands_metadata]:
-                asset_href = ''
-                proj_shp = [0, 0]
-                proj_tran = [0, 0, 0, 0, 0, 0]
-
-                band_name_in_product_keys = [p for p in product_keys if band_name in p]
-
-                if band_name_in_product_keys:
-                    product_key = band_name_in_product_keys[0]
-                    asset_href = f"{S3_HREF}/{product_key}"
-                    proj_shp, proj_tran = get_projection_from_cog(asset_href)
-                else:
-                    logger.warning(f"{band_name} band not found on {collection.id}/{item.id} acquisition.")
-
-                asset = Asset(
-                    href=asset_href,
-                    media_type=MediaType.COG
-                )
-
-                # Set Projection
-                item.ext.projection.set_transform(proj_tran, asset)
-                item.ext.projection.set_shape(proj_shp, asset)
-
-                # Set bands
-                item.ext.eo.set_bands([Band.create(
-                    name=band_common_name, common_name=band_common_name)],
-                    asset
-                )
-                logger.debug(f"[Asset] Adding {asset_href} asset to {acquisition_key}...")
-                item.add_asset(key=band_common_name, asset=asset)
-
-            collection.add_item(item)
-            collection.update_extent_from_items()
-            collection.normalize_hrefs(f"{S3_HREF}/{S3_STAC_KEY}/{collection.id}")
-
-            # TODO: Replace STAC_IO.write_text_method
-            repo.add_json_from_dict(
-                bucket=S3_BUCKET,
-                key=collection_key,
-                stac_dict=collection.to_dict()
-            )
-
-            repo.add_json_from_dict(
-                bucket=S3_BUCKET,
-                key=item_key,
-                stac_dict=item.to_dict()
-            )
-            logger.info(f"{item.id} item added to {collection.id}")
+        repo.add_json_from_dict(
+            bucket=S3_BUCKET,
+            key=item_key,
+            stac_dict=item_dict,
+            metadata={'fingerprint': fingerprints_digest}
+        )
+        # Only indexed once written, so a failed item PUT leaves no index record behind
+        if ITEM_INDEX:
+            update_item_index(repo=repo, collection_id=collection_id, records=[get_index_record(item_dict)])
+        logger.info(f"{item_id} item {'updated in' if exists else 'added to'} {collection_id}")
 
         return 'item', item_key
 
@@ -210,3 +587,267 @@ def add_stac_item(repo: S3Repository, acquisition_key: str):
     except NoObjectError as e:
         logger.error(f"Could not find object in S3: {e}")
         return 'item', None
+    except (StacValidationError, ConflictError) as e:
+        logger.error(f"Could not add {acquisition_key}: {e}")
+        return 'item', None
+
+
+@stage('delete_stac_items')
+@stac_io_scope
+def delete_stac_items(repo: S3Repository, acquisition_keys: List[str],
+                      source: Source = None) -> Tuple[List[str], List[str]]:
+    """
+    Delete the items of many acquisitions, rewriting each collection once
+    for all of its removed items rather than once per item.
+
+    :return: keys of the rewritten collections and of the deleted items they linked to.
+    """
+    item_ids = {}
+    for acquisition_key in acquisition_keys:
+        item_ids.setdefault(acquisition_key.split('/')[-3], set()).add(acquisition_key.split('/')[-2])
+
+    collection_keys, deleted_keys = [], []
+    for sensor_name, sensor_item_ids in item_ids.items():
+        collection_key = get_collection_key(sensor_name)
+        try:
+            collection_id = repo.get_dict_fields(bucket=S3_BUCKET, key=collection_key, fields=['id'])['id']
+        except (NoObjectError, KeyError, TypeError) as e:
+            logger.error(f"No collection found in {collection_key}, could not delete its items: {e}")
+            continue
+
+        item_keys = sorted(get_item_key(collection_id, item_id) for item_id in sensor_item_ids)
+        item_hrefs = {get_href(item_key) for item_key in item_keys}
+
+        with object_lock(collection_key), object_lock(get_item_index_key(collection_id)):
+            records, part_keys = None, []
+            if ITEM_INDEX:
+                records, part_keys = read_item_index(repo=repo, collection_id=collection_id)
+                if records is None:
+                    logger.warning(f"No item index found for {collection_id}")
+                else:
+                    records = [r for r in records if r.get('href') not in item_hrefs]
+
+            linked_hrefs = set()
+
+            def remove_items(collection_dict: Optional[dict]) -> dict:
+                if collection_dict is None:
+                    raise NoObjectError(f"No valid collection in {collection_key}")
+                # Items added while waiting for the lock, or by other processes, are in the collection read here
+                linked_hrefs.clear()
+                linked_hrefs.update(get_rel_links(collection_dict, 'item'))
+                remaining_hrefs = linked_hrefs - item_hrefs
+                if records is not None and remaining_hrefs <= {r.get('href') for r in records}:
+                    items = get_collection_items([r for r in records if r.get('href') in remaining_hrefs])
+                else:
+                    # Without a complete index the extent is read back from the remaining items
+                    items = sorted(band_read_executor.map(in_current_context(
+                        lambda href: get_collection_item(repo, href)), remaining_hrefs))
+                with stage('update_collection'):
+                    remove_items_from_collection_dict(collection_dict=collection_dict, item_hrefs=item_hrefs,
+                                                      remaining_items=items)
+                validate(collection_dict)
+                return collection_dict
+
+            try:
+                repo.update_dict(bucket=S3_BUCKET, key=collection_key, update=remove_items)
+            except (NoObjectError, ConflictError, StacValidationError) as e:
+                logger.error(f"Could not remove items from {collection_key}: {e}")
+                continue
+            if records is not None:
+                replace_item_index(repo=repo, collection_id=collection_id, records=records, part_keys=part_keys)
+
+            # Objects go only once no collection links to them anymore, with whatever assets, such as
+            # thumbnails, were written next to the item JSON. They are deleted before the lock is released,
+            # so an ingestion of the same acquisition in this process waits for the deletion to finish
+            object_keys = set()
+            for item_key in item_keys:
+                try:
+                    object_keys.update(repo.get_keys(bucket=S3_BUCKET, prefix=f"{item_key.rsplit('/', 1)[0]}/"))
+                except NoObjectError:
+                    logger.debug(f"No objects found for {item_key}")
+            errors = set(repo.delete_objects(bucket=S3_BUCKET, keys=sorted(object_keys)))
+            if errors:
+                logger.error(f"Could not delete {len(errors)} objects of {collection_id}: {sorted(errors)}")
+
+        collection_keys.append(collection_key)
+        removed_keys = [k for k in item_keys if get_href(k) in linked_hrefs and k not in errors]
+        deleted_keys += removed_keys
+        logger.info(f"{len(removed_keys)} items deleted from {collection_id}")
+
+    return collection_keys, deleted_keys
+
+
+def get_collection_item(repo: S3Repository, item_href: str) -> tuple:
+    item = repo.get_dict_fields(bucket=S3_BUCKET, key=item_href[len(S3_HREF) + 1:], fields=['bbox', 'properties'])
+    item_datetime = item.get('properties', {}).get('datetime')
+    return item_href, item.get('bbox'), str_to_datetime(item_datetime) if item_datetime else None
+
+
+@stage('rebuild_stac_items')
+@stac_io_scope
+def rebuild_stac_items(repo: S3Repository, sensor_conf: dict, acquisition_keys: List[str], staging_prefix: str,
+                       source: Source = None) -> List[dict]:
+    source = source or S3Source(repo, S3_BUCKET)
+    collection_id = sensor_conf.get('id')
+    collection_href = get_href(get_collection_key(collection_id))
+
+    records = []
+    for acquisition_key in acquisition_keys:
+        item_key = get_item_key(collection_id, acquisition_key.split('/')[-2])
+        try:
+            item = build_stac_item(
+                repo=repo,
+                source=source,
+                acquisition_key=acquisition_key,
+                sensor_conf=sensor_conf,
+                collection_id=collection_id,
+                collection_href=collection_href,
+                root_href=get_href(S3_CATALOG_KEY),
+                item_key=item_key,
+                staging_prefix=staging_prefix
+            )
+            with stage('to_dict'):
+                item_dict = item.to_dict()
+            validate(item_dict)
+        except (NoObjectError, StacValidationError) as e:
+            logger.error(f"Could not rebuild {acquisition_key}: {e}")
+            continue
+
+        repo.add_json_from_dict(
+            bucket=S3_BUCKET,
+            key=get_staging_key(item_key, staging_prefix),
+            stac_dict=item_dict,
+            metadata={'fingerprint': get_fingerprints_digest(get_item_fingerprints(item_dict))}
+        )
+        records.append(get_index_record(item_dict))
+
+    return records
+
+
+@stage('assemble_stac_catalog')
+def assemble_stac_catalog(repo: S3Repository, collections: List[Tuple[dict, List[dict]]], staging_prefix: str):
+    catalog_dict = new_catalog_dict()
+    for sensor_conf, records in collections:
+        collection_key = get_collection_key(sensor_conf.get('id'))
+        items = get_collection_items(records)
+        collection = build_stac_collection(sensor_conf=sensor_conf, collection_key=collection_key,
+                                           catalog_dict=catalog_dict)
+        collection_dict = collection.to_dict()
+        with stage('update_collection'):
+            add_items_to_collection_dict(collection_dict=collection_dict, items=items)
+        validate(collection_dict)
+
+        repo.add_json_from_dict(
+            bucket=S3_BUCKET,
+            key=get_staging_key(collection_key, staging_prefix),
+            stac_dict=collection_dict
+        )
+        if ITEM_INDEX:
+            write_item_index(repo=repo, collection_id=sensor_conf.get('id'), records=records,
+                             staging_prefix=staging_prefix)
+        add_child_to_catalog_dict(catalog_dict=catalog_dict, child_href=collection.get_self_href())
+        logger.info(f"{sensor_conf.get('id')} collection assembled with {len(items)} items")
+
+    repo.add_json_from_dict(
+        bucket=S3_BUCKET,
+        key=get_staging_key(S3_CATALOG_KEY, staging_prefix),
+        stac_dict=catalog_dict
+    )
+
+
+def promote_stac_collection(repo: S3Repository, staged_key: str, staging_prefix: str):
+    """
+    Write a staged collection over the live one, keeping the live items that
+    are missing from it: those ingested while the catalog was rebuilt, and
+    those that were not rebuilt. Their links are added back and the extent
+    and item index extended to cover them, so they are neither dropped nor
+    orphaned.
+    """
+    collection_key = f"{S3_STAC_KEY}{staged_key[len(staging_prefix):]}"
+    staged_dict = repo.get_dict(bucket=S3_BUCKET, key=staged_key)
+    collection_id = staged_dict.get('id')
+    staged_hrefs = set(get_rel_links(staged_dict, 'item'))
+    # Index records of the live items missing from the staged collection, None for dangling links
+    live_records = {}
+
+    def merge(live_dict: Optional[dict]) -> dict:
+        missing_hrefs = [href for href in get_rel_links(live_dict or {'links': []}, 'item')
+                         if href not in staged_hrefs]
+        for href in missing_hrefs:
+            if href not in live_records:
+                try:
+                    live_records[href] = get_index_record(
+                        repo.get_dict(bucket=S3_BUCKET, key=href[len(S3_HREF) + 1:]))
+                except NoObjectError:
+                    live_records[href] = None
+        collection_dict = copy.deepcopy(staged_dict)
+        with stage('update_collection'):
+            add_items_to_collection_dict(collection_dict=collection_dict, items=get_collection_items(
+                [dict(live_records[href], href=href) for href in missing_hrefs if live_records[href]]))
+        validate(collection_dict)
+        return collection_dict
+
+    with object_lock(collection_key), object_lock(get_item_index_key(collection_id)):
+        # Parts written from here on are for items the merge below may miss, and stay
+        part_keys = get_item_index_part_keys(repo=repo, collection_id=collection_id) if ITEM_INDEX else []
+        collection_dict = repo.update_dict(bucket=S3_BUCKET, key=collection_key, update=merge)
+        if ITEM_INDEX:
+            try:
+                records = read_index_records(repo.get_object(
+                    bucket=S3_BUCKET, key=get_staging_key(get_item_index_key(collection_id), staging_prefix)))
+            except NoObjectError:
+                records = []
+            kept_hrefs = set(get_rel_links(collection_dict, 'item')) - staged_hrefs
+            records += [dict(live_records[href], href=href) for href in sorted(kept_hrefs)]
+            replace_item_index(repo=repo, collection_id=collection_id, records=records, part_keys=part_keys)
+
+    kept = len(get_rel_links(collection_dict, 'item')) - len(staged_hrefs)
+    if kept:
+        logger.info(f"Kept {kept} live items of {collection_id} missing from the rebuilt collection")
+
+
+@stage('promote_stac_catalog')
+def promote_stac_catalog(repo: S3Repository, staging_prefix: str) -> List[str]:
+    """
+    Promote a staged catalog over the live one while ingestion keeps running.
+
+    S3 has no atomic rename, so the swap is ordered, not atomic: items and
+    thumbnails are copied first, then each collection linking to them and the
+    catalog last, so readers following links from the root never reach an
+    object that is not there yet, but may see old and new objects side by
+    side until it completes. Collections and the catalog are merged with
+    their live versions rather than copied over them, see
+    promote_stac_collection, with a conditional write that is applied again
+    if the consumer wrote them in the meantime.
+
+    :return: keys of the staged objects that could not be deleted.
+    """
+    staged_keys = repo.get_keys(bucket=S3_BUCKET, prefix=f"{staging_prefix}/")
+    catalog_key = get_staging_key(S3_CATALOG_KEY, staging_prefix)
+
+    collections = [k for k in staged_keys if k.endswith('/collection.json')]
+    # Item indexes are written once merged with their collection
+    items = [k for k in staged_keys if k != catalog_key and k not in collections
+             and k.rsplit('/', 1)[-1] not in ('items.ndjson', 'items.parquet')]
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        list(executor.map(in_current_context(
+            lambda key: repo.copy_object(bucket=S3_BUCKET, source_key=key,
+                                         key=f"{S3_STAC_KEY}{key[len(staging_prefix):]}")), items))
+
+    for staged_key in collections:
+        promote_stac_collection(repo=repo, staged_key=staged_key, staging_prefix=staging_prefix)
+
+    staged_catalog = repo.get_dict(bucket=S3_BUCKET, key=catalog_key)
+
+    def merge(live_dict: Optional[dict]) -> dict:
+        # Collections of the sensors that were not rebuilt stay in the catalog
+        catalog_dict = copy.deepcopy(staged_catalog)
+        for child_href in get_rel_links(live_dict or {'links': []}, 'child'):
+            add_child_to_catalog_dict(catalog_dict=catalog_dict, child_href=child_href)
+        return catalog_dict
+
+    with object_lock(S3_CATALOG_KEY):
+        repo.update_dict(bucket=S3_BUCKET, key=S3_CATALOG_KEY, update=merge)
+    logger.info(f"Promoted {len(staged_keys)} objects from {staging_prefix} to {S3_STAC_KEY}")
+
+    return repo.delete_objects(bucket=S3_BUCKET, keys=staged_keys)
@@ -0,0 +1,161 @@
+import logging
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from rasterio import RasterioIOError
+
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT, get_throttling_configuration
+from sac_stac.metrics import S3_CONCURRENCY_LIMIT, S3_RETRIES
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_CODES = {'SlowDown', 'ServiceUnavailable', 'RequestLimitExceeded', 'Throttling', 'ThrottlingException',
+                    'TooManyRequests', '503', '429'}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Tell whether the error is the endpoint asking to slow down, either from
+    boto3 or from a GDAL HTTP read of a COG.
+    """
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return code in THROTTLING_CODES or status in (429, 503)
+    if isinstance(error, RasterioIOError):
+        message = str(error)
+        return any(code in message for code in ('SlowDown', '503', '429'))
+    return False
+
+
+class TokenBucket:
+    """Token bucket refilled at an adjustable rate, blocking until a token is available."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def increase(self, step: float):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + step)
+
+    def decrease(self, factor: float, minimum: float):
+        with self.lock:
+            self.rate = max(minimum, self.rate * factor)
+
+
+class Throttle:
+    """
+    Adaptive limiter shared by every S3 request and COG read.
+
+    Concurrency is bounded by a window grown additively on every fast success
+    and shrunk multiplicatively on throttling errors, or on latency above the
+    target of the operations that have one (AIMD). Listings and COG reads
+    take as long as their size, so they only back off on throttling errors.
+    Each operation also draws from its own token bucket, whose rate follows
+    the same AIMD rule, and throttled calls are retried with full jitter
+    exponential backoff.
+    """
+
+    def __init__(self, max_concurrency: int = 64, min_concurrency: int = 1, rate: float = None,
+                 latency_targets: dict = None, max_retries: int = 8, base_delay: float = 0.1,
+                 max_delay: float = 20.0, decrease_factor: float = 0.5):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.rate = rate
+        self.latency_targets = latency_targets or {}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.buckets = {}
+        self.condition = threading.Condition()
+        S3_CONCURRENCY_LIMIT.set(self.limit)
+
+    def bucket(self, operation: str) -> TokenBucket:
+        with self.condition:
+            if operation not in self.buckets:
+                self.buckets[operation] = TokenBucket(rate=self.rate, capacity=max(1.0, self.rate))
+            return self.buckets[operation]
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, operation: str, latency: float, throttled: bool):
+        latency_target = self.latency_targets.get(operation)
+        slow = latency_target is not None and latency > latency_target
+        with self.condition:
+            self.in_flight -= 1
+            if throttled or slow:
+                factor = self.decrease_factor if throttled else (1 + self.decrease_factor) / 2
+                self.limit = max(float(self.min_concurrency), self.limit * factor)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            S3_CONCURRENCY_LIMIT.set(self.limit)
+            self.condition.notify_all()
+
+        if self.rate:
+            if throttled:
+                self.bucket(operation).decrease(self.decrease_factor, minimum=self.rate / 100)
+            else:
+                self.bucket(operation).increase(self.rate / 100)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, operation: str, func, *args, **kwargs):
+        """
+        Call func within the concurrency window and the operation's token
+        bucket, retrying it while the endpoint keeps throttling.
+
+        :param operation: name of the operation, e.g. 'put_object'
+        :param func: callable doing the request
+        """
+        attempt = 0
+        while True:
+            if self.rate:
+                self.bucket(operation).acquire()
+            self.acquire()
+            start = time.perf_counter()
+            throttled = False
+            try:
+                return func(*args, **kwargs)
+            except (ClientError, RasterioIOError) as e:
+                throttled = is_throttling_error(e)
+                if not throttled or attempt >= self.max_retries:
+                    raise
+                logger.debug(f"{operation} throttled, retrying: {e}")
+            finally:
+                self.release(operation, time.perf_counter() - start, throttled)
+
+            S3_RETRIES.labels(operation=operation).inc()
+            time.sleep(self.backoff(attempt))
+            attempt += 1
+
+
+throttle = Throttle(**get_throttling_configuration())
@@ -0,0 +1,109 @@
+import contextvars
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from sac_stac.load_config import LOG_LEVEL, LOG_FORMAT
+
+try:
+    from opentelemetry import propagate
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.trace import Link, get_current_span
+except ImportError:
+    TracerProvider = None
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+_provider = None
+_tracer = None
+
+
+class NoopSpan:
+    """Span returned while tracing is disabled."""
+
+    def set_attribute(self, key, value):
+        pass
+
+
+def configure_tracing(exporter: str = None, path: str = None):
+    """
+    Enable tracing with an OpenTelemetry console exporter writing one JSON
+    span per line to stdout, or to the given file. Tracing stays a no-op
+    without an exporter or when opentelemetry-sdk is not installed.
+
+    :param exporter: 'console' or 'file'
+    :param path: file the 'file' exporter appends spans to
+    """
+    global _provider, _tracer
+
+    if not exporter:
+        return
+    if TracerProvider is None:
+        logger.warning("opentelemetry-sdk is not installed, tracing disabled.")
+        return
+
+    out = open(path, 'a') if exporter == 'file' else sys.stdout
+    _provider = TracerProvider(resource=Resource.create({'service.name': 'stac-creator'}))
+    _provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(
+        out=out, formatter=lambda s: s.to_json(indent=None) + os.linesep)))
+    _tracer = _provider.get_tracer(__name__)
+    logger.info(f"Tracing enabled with {exporter} exporter.")
+
+
+def flush_tracing():
+    if _provider:
+        _provider.force_flush()
+
+
+@contextmanager
+def span(name: str, context: dict = None, links: list = None, **attributes):
+    """
+    Open a span around the wrapped block, recording the given attributes and
+    its latency in milliseconds.
+
+    :param name: span name
+    :param context: carrier with a propagated parent context
+    :param links: carriers of the contexts the span is linked to, such as the messages of a batch
+    :param attributes: span attributes, None values are skipped
+    """
+    if _tracer is None:
+        yield NoopSpan()
+        return
+
+    parent = propagate.extract(context) if context else None
+    span_links = [Link(get_current_span(propagate.extract(carrier)).get_span_context())
+                  for carrier in links or [] if carrier]
+    with _tracer.start_as_current_span(name, context=parent, links=span_links) as current:
+        for key, value in attributes.items():
+            if value is not None:
+                current.set_attribute(key, value)
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current.set_attribute('latency_ms', (time.perf_counter() - start) * 1000)
+
+
+def inject_context() -> dict:
+    """
+    Return the current trace context as message headers, empty if tracing is disabled.
+    """
+    headers = {}
+    if _tracer is not None:
+        propagate.inject(headers)
+    return headers
+
+
+def in_current_context(func):
+    """
+    Wrap func to run in a copy of the calling context, so spans it opens on
+    another thread keep the current span as their parent.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
@@ -1,5 +1,5 @@
 import json
-from difflib import SequenceMatcher
+import os
 from typing import List, Tuple
 from pathlib import Path
 from urllib.parse import urlparse
@@ -14,12 +14,12 @@ def get_files_from_dir(directory: str, extension: str) -> List[str]:
     return [str(x.absolute()) for x in Path(directory).glob(f'**/*.{extension}')]
 
 
-def extract_common_prefix(strings: List[str]) -> str:
-    matches = []
-    for s in strings[1:]:
-        match = SequenceMatcher(None, s, strings[0]).get_matching_blocks()
-        matches.append(s[match[0].a:match[0].b + match[0].size])
-    return min(matches, key=len)
+def extract_common_prefix(strings: List[str], delimiter: str = None) -> str:
+    # commonprefix only compares the lexicographic min and max, every other string sorts between them
+    prefix = os.path.commonprefix(strings)
+    if delimiter:
+        prefix = prefix[:prefix.rfind(delimiter) + 1]
+    return prefix
 
 
 def parse_s3_url(url: str) -> Tuple[str, str]:
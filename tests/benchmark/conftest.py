@@ -0,0 +1,103 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from moto import mock_s3
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+
+from sac_stac.adapters import repository
+from sac_stac.domain.s3 import S3
+
+BUCKET = 'public-eo-data'
+BENCHMARK_KEY = 'benchmark/'
+BENCHMARK_DATA = Path(f'tests/data/{BENCHMARK_KEY}')
+LANDSAT_8_BANDS = ['sr_band1', 'sr_band2', 'sr_band3', 'sr_band4', 'sr_band5', 'sr_band6', 'sr_band7',
+                   'bt_band10', 'bt_band11', 'pixel_qa', 'radsat_qa', 'sr_aerosol']
+
+
+def write_cog(path: Path, size: int = 512, nodata: int = 0):
+    """
+    Write a synthetic uint16 COG with a nodata collar and internal overviews.
+    """
+    data = np.random.default_rng(0).integers(1, 10000, (size, size), dtype='uint16')
+    collar = size // 8
+    data[:collar, :] = nodata
+    data[:, :collar] = nodata
+
+    profile = dict(driver='GTiff', width=size, height=size, count=1, dtype='uint16', nodata=nodata,
+                   crs='EPSG:32660', transform=from_origin(289185.0, -1642485.0, 30.0, 30.0))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with MemoryFile() as mem:
+        with mem.open(**profile) as ds:
+            ds.write(data, 1)
+        with mem.open() as ds:
+            rio_copy(ds, str(path), driver='COG', compress='DEFLATE', blocksize=256)
+
+
+def landsat_8_acquisitions(sensor_key: str, count: int):
+    """
+    Generate count Landsat-8 like acquisitions under tests/data/{sensor_key}.
+    """
+    acquisitions = []
+    for i in range(count):
+        acquisition = f"LC08_L1TP_076{i:03d}_20200622"
+        for band in LANDSAT_8_BANDS:
+            file = Path(f'tests/data/{sensor_key}{acquisition}/'
+                        f'LC08_L1GT_076{i:03d}_20200622_20200707_01_T2_{band}.tif')
+            if not file.exists():
+                write_cog(file)
+        acquisitions.append(f"{sensor_key}{acquisition}/")
+    return acquisitions
+
+
+@pytest.fixture(scope='session')
+def benchmark_data():
+    """
+    Remove the generated COGs once every benchmark has run.
+    """
+    try:
+        yield BENCHMARK_DATA
+    finally:
+        shutil.rmtree(BENCHMARK_DATA, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def test_env(monkeypatch, benchmark_data):
+    """
+    Serve generated COGs through the TEST_ENV local path rewrite, for the benchmarks only.
+    """
+    monkeypatch.setenv("TEST_ENV", "Yes")
+
+
+@pytest.fixture
+def s3():
+    with mock_s3():
+        s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+        s3.s3_resource.create_bucket(Bucket=BUCKET)
+        yield s3
+
+
+@pytest.fixture
+def repo(s3):
+    return repository.S3Repository(s3)
+
+
+@pytest.fixture
+def landsat_8_sensor(s3):
+    """
+    Return a function generating and uploading Landsat-8 acquisitions under a sensor key.
+    """
+    def make_sensor(sensor_key: str, count: int):
+        acquisition_keys = landsat_8_acquisitions(sensor_key, count)
+        for file in Path(f'tests/data/{sensor_key}').glob('**/*.tif'):
+            s3.s3_resource.Bucket(BUCKET).upload_file(
+                Filename=str(file),
+                Key=f"{sensor_key}{file.parent.name}/{file.name}"
+            )
+        return acquisition_keys
+
+    return make_sensor
@@ -0,0 +1,52 @@
+import pytest
+
+from sac_stac.domain.operations import get_geometry_from_cog, get_projection_from_cog
+
+BUCKET = 'public-eo-data'
+
+
+def put_acquisitions(s3_client, bucket_name, sensor_key, acquisitions, products):
+    for i in range(acquisitions):
+        for j in range(products):
+            s3_client.put_object(Bucket=bucket_name, Key=f"{sensor_key}LC08_L1TP_{i:06d}_20200622/band_{j}.tif",
+                                 Body=b'0' * (j + 2))
+
+
+@pytest.mark.parametrize('acquisitions', [100, pytest.param(1500, marks=pytest.mark.slow)])
+def test_list_common_prefixes(benchmark, s3, acquisitions):
+    sensor_key = 'benchmark/listing/landsat_8/'
+    put_acquisitions(s3.s3_resource.meta.client, BUCKET, sensor_key, acquisitions, 1)
+
+    benchmark.extra_info['acquisitions'] = acquisitions
+    prefixes = benchmark(s3.list_common_prefixes, bucket_name=BUCKET, prefix=sensor_key)
+
+    assert len(prefixes) == acquisitions
+
+
+@pytest.mark.parametrize('products', [12, pytest.param(1200, marks=pytest.mark.slow)])
+def test_list_objects(benchmark, s3, products):
+    sensor_key = 'benchmark/listing/landsat_8/'
+    put_acquisitions(s3.s3_resource.meta.client, BUCKET, sensor_key, 1, products)
+
+    benchmark.extra_info['products'] = products
+    objects = benchmark(s3.list_objects, bucket_name=BUCKET, prefix=sensor_key, suffix='.tif')
+
+    assert len(objects) == products
+
+
+def test_get_geometry_from_cog(benchmark, landsat_8_sensor):
+    acquisition_key, = landsat_8_sensor('benchmark/cog/landsat_8/', 1)
+    cog_url = f'tests/data/{acquisition_key}LC08_L1GT_076000_20200622_20200707_01_T2_sr_band1.tif'
+
+    geometry, crs = benchmark(get_geometry_from_cog, cog_url)
+
+    assert crs.is_valid
+
+
+def test_get_projection_from_cog(benchmark, landsat_8_sensor):
+    acquisition_key, = landsat_8_sensor('benchmark/cog/landsat_8/', 1)
+    cog_url = f'tests/data/{acquisition_key}LC08_L1GT_076000_20200622_20200707_01_T2_sr_band1.tif'
+
+    proj_shp, proj_tran = benchmark(get_projection_from_cog, cog_url)
+
+    assert proj_shp == [512, 512]
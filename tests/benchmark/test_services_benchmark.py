@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from sac_stac.service_layer import services
+
+BUCKET = 'public-eo-data'
+STAC_KEY = 'stac_catalogs/cs_stac/'
+
+
+def reset_stac_s3(s3_resource, bucket_name, sensor_name=None):
+    s3_resource.Bucket(bucket_name).objects.filter(Prefix=STAC_KEY).delete()
+    if sensor_name:
+        s3_resource.Bucket(bucket_name).upload_file(
+            Filename='tests/output/catalog.json',
+            Key=f'{STAC_KEY}catalog.json'
+        )
+        s3_resource.Bucket(bucket_name).upload_file(
+            Filename=f'tests/output/{sensor_name}/collection.json',
+            Key=f'{STAC_KEY}{sensor_name}/collection.json'
+        )
+        for file in Path(f'tests/output/{sensor_name}').glob('**/*.json'):
+            if 'collection' not in file.name:
+                s3_resource.Bucket(bucket_name).upload_file(
+                    Filename=str(file),
+                    Key=f"{STAC_KEY}{sensor_name}/{file.stem}/{file.name}"
+                )
+
+
+def test_add_stac_item(benchmark, s3, repo, landsat_8_sensor):
+    acquisition_key, = landsat_8_sensor('benchmark/item/landsat_8/', 1)
+
+    stac_type, item_key = benchmark.pedantic(
+        services.add_stac_item,
+        kwargs=dict(repo=repo, acquisition_key=acquisition_key),
+        setup=lambda: reset_stac_s3(s3.s3_resource, BUCKET, 'landsat_8'),
+        rounds=10
+    )
+
+    assert item_key
+
+
+@pytest.mark.parametrize('acquisitions', [1, 4, pytest.param(16, marks=pytest.mark.slow)])
+def test_add_stac_collection(benchmark, s3, repo, landsat_8_sensor, acquisitions):
+    sensor_key = f'benchmark/collection_{acquisitions}/landsat_8/'
+    landsat_8_sensor(sensor_key, acquisitions)
+
+    benchmark.extra_info['acquisitions'] = acquisitions
+    stac_type, collection_key = benchmark.pedantic(
+        services.add_stac_collection,
+        kwargs=dict(repo=repo, sensor_key=sensor_key),
+        setup=lambda: reset_stac_s3(s3.s3_resource, BUCKET),
+        rounds=3
+    )
+
+    collection = repo.get_dict(bucket=BUCKET, key=collection_key)
+    assert len([link for link in collection.get('links') if link.get('rel') == 'item']) == acquisitions
@@ -0,0 +1,25 @@
+import pytest
+
+from sac_stac.util import extract_common_prefix
+
+
+def s3_keys(n):
+    return [f'common_sensing/fiji/sentinel_2/S2B_MSIL2A_2019{i % 12 + 1:02d}23T220919_T01K{i:05d}/'
+            f'S2B_MSIL2A_2019{i % 12 + 1:02d}23T220919_T01K{i:05d}_B02_10m.tif' for i in range(n)]
+
+
+def test_extract_common_prefix_1k_keys(benchmark):
+    keys = s3_keys(1000)
+
+    prefix = benchmark(extract_common_prefix, keys, delimiter='/')
+
+    assert prefix == 'common_sensing/fiji/sentinel_2/'
+
+
+@pytest.mark.slow
+def test_extract_common_prefix_100k_keys(benchmark):
+    keys = s3_keys(100000)
+
+    prefix = benchmark(extract_common_prefix, keys, delimiter='/')
+
+    assert prefix == 'common_sensing/fiji/sentinel_2/'
@@ -44,7 +44,8 @@ async def client(nc, sensor_key):
         data = msg.data.decode()
         future.set_result(data)
 
-    await nc.subscribe("stac_indexer.*", cb=message_handler)
+    # Backfilled items are notified before their collection
+    await nc.subscribe("stac_indexer.collection", cb=message_handler)
     await nc.publish("stac_creator.collection", sensor_key.encode())
     return await asyncio.wait_for(future, 1)
 
@@ -1,9 +1,12 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 from moto import mock_s3
+from pystac import STAC_IO
 from sac_stac.adapters import repository
-from sac_stac.domain.s3 import S3, NoObjectError
+from sac_stac.domain.s3 import S3, NoObjectError, ConflictError
 from pathlib import Path
 
 from sac_stac.util import load_json
@@ -75,6 +78,24 @@ def test_get_product_keys():
                         'S2A_MSIL2A_20151022T222102_T01KBU_WVP_10m.tif']
 
 
+@mock_s3
+def test_get_product_fingerprints():
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    initialise_cs_bucket(s3_resource=s3.s3_resource, bucket_name=BUCKET)
+
+    repo = repository.S3Repository(s3)
+    key = 'common_sensing/fiji/sentinel_2/S2A_MSIL2A_20151022T222102_T01KBU/' \
+          'S2A_MSIL2A_20151022T222102_T01KBU_B01_60m.tif'
+    fingerprints = repo.get_product_fingerprints(bucket=BUCKET,
+                                                 products_prefix='common_sensing/fiji/sentinel_2/'
+                                                                 'S2A_MSIL2A_20151022T222102_T01KBU/')
+
+    assert len(fingerprints) == 15
+    assert fingerprints[key] == (Path(f"tests/data/{key}").stat().st_size,
+                                 s3.s3_resource.Object(BUCKET, key).e_tag,
+                                 s3.s3_resource.Object(BUCKET, key).last_modified.isoformat())
+
+
 @mock_s3
 def test_get_smallest_product_key():
     s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
@@ -142,6 +163,59 @@ def test_get_dict_does_not_exist():
         repo.get_dict(bucket=BUCKET, key=catalog_s3_key)
 
 
+@mock_s3
+def test_get_dict_fields():
+    collection_file_path = 'tests/output/landsat_5/collection.json'
+    collection_s3_key = 'stac_catalogs/cs_stac/landsat_5/collection.json'
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+    s3.s3_resource.Bucket(BUCKET).upload_file(Filename=collection_file_path, Key=collection_s3_key)
+
+    repo = repository.S3Repository(s3)
+    fields = repo.get_dict_fields(bucket=BUCKET, key=collection_s3_key, fields=['id', 'extent'])
+
+    collection_file = load_json(collection_file_path)
+    assert fields == {'id': collection_file['id'], 'extent': collection_file['extent']}
+
+    root_link = next(link for link in collection_file['links'] if link['rel'] == 'root')
+    assert repo.get_dict_fields(bucket=BUCKET, key=collection_s3_key, fields=['id'], link_rels=['root', 'missing']) \
+        == {'id': collection_file['id'], 'links': [root_link]}
+
+
+@mock_s3
+def test_ranged_body_reads_past_head():
+    collection_file_path = 'tests/output/landsat_5/collection.json'
+    collection_s3_key = 'stac_catalogs/cs_stac/landsat_5/collection.json'
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+    s3.s3_resource.Bucket(BUCKET).upload_file(Filename=collection_file_path, Key=collection_s3_key)
+
+    body = repository.RangedBody(s3, bucket=BUCKET, key=collection_s3_key, head_size=16)
+    with open(collection_file_path, 'rb') as f:
+        assert body.read(8) + body.read() == f.read()
+    body.close()
+
+
+@mock_s3
+def test_find_link():
+    collection_file_path = 'tests/output/landsat_5/collection.json'
+    collection_s3_key = 'stac_catalogs/cs_stac/landsat_5/collection.json'
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+    s3.s3_resource.Bucket(BUCKET).upload_file(Filename=collection_file_path, Key=collection_s3_key)
+
+    repo = repository.S3Repository(s3)
+    item_link = next(link for link in load_json(collection_file_path)['links'] if link['rel'] == 'item')
+
+    assert repo.find_link(bucket=BUCKET, key=collection_s3_key, rel='item', href=item_link['href']) == item_link
+    assert repo.find_link(bucket=BUCKET, key=collection_s3_key, rel='item', href='missing.json') is None
+    assert repo.exists(bucket=BUCKET, key=collection_s3_key)
+    assert not repo.exists(bucket=BUCKET, key='stac_catalogs/cs_stac/missing/collection.json')
+
+
 @mock_s3
 def test_add_json_from_dict():
     catalog_s3_key = 'stac_catalogs/cs_stac/catalog.json'
@@ -158,3 +232,128 @@ def test_add_json_from_dict():
 
     assert resp == 200
     assert catalog == uploaded_catalog
+
+
+class StubS3:
+    """
+    S3 serving the same document, with its own id, under every key.
+    """
+
+    def __init__(self, stub_id: str):
+        self.stub_id = stub_id
+        self.reads = []
+
+    def get_object(self, bucket_name: str, object_name: str, byte_range: str = None):
+        self.reads.append(f"{bucket_name}/{object_name}")
+        return json.dumps({'id': self.stub_id}).encode(), None
+
+
+def test_stac_io_scoped_per_repository():
+    uri = f'https://s3-uk-1.sa-catapult.co.uk/{BUCKET}/stac_catalogs/cs_stac/catalog.json'
+    stubs = {stub_id: StubS3(stub_id) for stub_id in ['a', 'b']}
+    repos = {stub_id: repository.S3Repository(stub) for stub_id, stub in stubs.items()}
+    # Every reader enters its scope before any of them reads, so a reader set
+    # globally by the last scope entered would serve all of them
+    scoped = threading.Barrier(16)
+
+    def read(stub_id):
+        with repository.stac_io(repos[stub_id]):
+            scoped.wait(timeout=10)
+            return json.loads(STAC_IO.read_text(uri)).get('id')
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(read, ['a', 'b'] * 8))
+
+    assert results == ['a', 'b'] * 8
+    assert stubs['a'].reads == stubs['b'].reads == [f'{BUCKET}/stac_catalogs/cs_stac/catalog.json'] * 8
+
+
+@mock_s3
+def test_stac_io_caches_resolved_links():
+    key = 'stac_catalogs/cs_stac/catalog.json'
+    uri = f'https://s3-uk-1.sa-catapult.co.uk/{BUCKET}/{key}'
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+    s3.put_object(bucket_name=BUCKET, key=key, body=json.dumps({'id': 'old'}))
+    repo = repository.S3Repository(s3)
+
+    with repository.stac_io(repo):
+        assert json.loads(STAC_IO.read_text(uri)).get('id') == 'old'
+        s3.put_object(bucket_name=BUCKET, key=key, body=json.dumps({'id': 'new'}))
+        assert json.loads(STAC_IO.read_text(uri)).get('id') == 'old'
+
+    with repository.stac_io(repo):
+        assert json.loads(STAC_IO.read_text(uri)).get('id') == 'new'
+
+
+@mock_s3
+def test_stac_io_cache_is_bounded():
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+    uris = []
+    for i in range(3):
+        key = f'stac_catalogs/cs_stac/{i}.json'
+        s3.put_object(bucket_name=BUCKET, key=key, body=json.dumps({'id': i}))
+        uris.append(f'https://s3-uk-1.sa-catapult.co.uk/{BUCKET}/{key}')
+
+    scope = repository.StacIOScope(repository.S3Repository(s3), max_size=2)
+    for uri in (uris[0], uris[1], uris[0], uris[2]):
+        scope.read_text(uri)
+
+    assert list(scope.cache) == [uris[0], uris[2]]
+
+
+@mock_s3
+def test_add_json_from_dict_skips_identical():
+    catalog_s3_key = 'stac_catalogs/cs_stac/catalog.json'
+    catalog = load_json('tests/output/catalog.json')
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+
+    repo = repository.S3Repository(s3)
+    assert repo.add_json_from_dict(bucket=BUCKET, key=catalog_s3_key, stac_dict=catalog) == 200
+
+    # Only the ETag read in the same operation lets a write be skipped
+    stored, etag = repo.get_dict_with_etag(bucket=BUCKET, key=catalog_s3_key)
+    reordered_catalog = dict(reversed(list(catalog.items())))
+    assert repo.add_json_from_dict(bucket=BUCKET, key=catalog_s3_key, stac_dict=reordered_catalog, etag=etag) == 304
+    assert repo.add_json_from_dict(bucket=BUCKET, key=catalog_s3_key, stac_dict=catalog) == 200
+    assert repo.add_json_from_dict(bucket=BUCKET, key=catalog_s3_key, stac_dict=catalog, etag=etag,
+                                   metadata={'fingerprint': 'a'}) == 200
+
+    catalog['title'] = 'New title'
+    assert repo.add_json_from_dict(bucket=BUCKET, key=catalog_s3_key, stac_dict=catalog, etag=etag) == 200
+    assert repo.get_dict(bucket=BUCKET, key=catalog_s3_key) == catalog
+    assert repo.skipped_writes == 1
+
+
+@mock_s3
+def test_update_dict_retries_on_conflict():
+    key = 'stac_catalogs/cs_stac/catalog.json'
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+    repo = repository.S3Repository(s3)
+    repo.add_json_from_dict(bucket=BUCKET, key=key, stac_dict={'id': 'catalog', 'links': []})
+
+    seen = []
+
+    def update(stac_dict):
+        seen.append(stac_dict)
+        if len(seen) == 1:
+            # Another writer lands between the read and the write
+            repo.add_json_from_dict(bucket=BUCKET, key=key, stac_dict={'id': 'catalog', 'links': ['concurrent']})
+        return dict(stac_dict, links=stac_dict['links'] + ['updated'])
+
+    assert repo.update_dict(bucket=BUCKET, key=key, update=update)['links'] == ['concurrent', 'updated']
+    assert repo.get_dict(bucket=BUCKET, key=key)['links'] == ['concurrent', 'updated']
+    assert len(seen) == 2
+
+    def conflicting_update(stac_dict):
+        repo.add_json_from_dict(bucket=BUCKET, key=key,
+                                stac_dict=dict(stac_dict, links=stac_dict['links'] + ['again']))
+        return stac_dict
+
+    with pytest.raises(ConflictError):
+        repo.update_dict(bucket=BUCKET, key=key, update=conflicting_update, attempts=2)
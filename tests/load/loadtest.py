@@ -0,0 +1,340 @@
+"""
+Load test of the NATS consumer.
+
+Starts a local nats-server, moto in server mode and the real consumer entry
+point in its own process, generates synthetic COG acquisitions, publishes
+stac_creator.item and stac_creator.collection messages at the given rates
+and reports the throughput, end-to-end latency percentiles, S3 request counts
+and peak RSS of the consumer. Needs the nats-server binary on the PATH and
+moto's server extra:
+
+    pip install "moto[server]~=2.0.0"
+    python tests/load/loadtest.py --item-rate 5 --duration 60
+
+Tuning variables of the consumer, e.g. ITEM_WORKERS or NOTIFICATION_MODE,
+are passed through from the environment.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import deque
+from pathlib import Path
+
+import boto3
+import numpy as np
+from nats.aio.client import Client as NATS
+from prometheus_client.parser import text_string_to_metric_families
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+BUCKET = 'public-eo-data'
+STAC_KEY = 'stac_catalogs/cs_stac'
+SENSOR_NAME = 'landsat_8'
+LANDSAT_8_BANDS = ['sr_band1', 'sr_band2', 'sr_band3', 'sr_band4', 'sr_band5', 'sr_band6', 'sr_band7',
+                   'bt_band10', 'bt_band11', 'pixel_qa', 'radsat_qa', 'sr_aerosol']
+NATS_PORT = 4222
+
+
+def write_cog(path: Path, size: int = 512, nodata: int = 0):
+    """
+    Write a synthetic uint16 COG with a nodata collar and internal overviews.
+    """
+    data = np.random.default_rng(0).integers(1, 10000, (size, size), dtype='uint16')
+    collar = size // 8
+    data[:collar, :] = nodata
+    data[:, :collar] = nodata
+
+    profile = dict(driver='GTiff', width=size, height=size, count=1, dtype='uint16', nodata=nodata,
+                   crs='EPSG:32660', transform=from_origin(289185.0, -1642485.0, 30.0, 30.0))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with MemoryFile() as mem:
+        with mem.open(**profile) as ds:
+            ds.write(data, 1)
+        with mem.open() as ds:
+            rio_copy(ds, str(path), driver='COG', compress='DEFLATE', blocksize=256)
+
+
+def generate_acquisitions(root: Path, sensor_key: str, count: int, size: int) -> list:
+    """
+    Generate count Landsat-8 like acquisitions under root, all bands sharing one COG.
+    """
+    template = root / 'template.tif'
+    write_cog(template, size=size)
+    acquisition_keys = []
+    for i in range(count):
+        acquisition = f"LC08_L1TP_{i // 1000:03d}{i % 1000:03d}_20200622"
+        for band in LANDSAT_8_BANDS:
+            file = root / sensor_key / acquisition / \
+                f"LC08_L1GT_{i // 1000:03d}{i % 1000:03d}_20200622_20200707_01_T2_{band}.tif"
+            file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(template, file)
+        acquisition_keys.append(f"{sensor_key}{acquisition}/")
+    template.unlink()
+    return acquisition_keys
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def seed_bucket(endpoint: str, root: Path, acquisition_keys: list, local_source: bool):
+    """
+    Create the bucket with the catalog and an empty collection, and upload the products unless read locally.
+    """
+    s3 = boto3.resource('s3', endpoint_url=endpoint, region_name='us-east-1',
+                        aws_access_key_id='testing', aws_secret_access_key='testing')
+    bucket = s3.create_bucket(Bucket=BUCKET)
+    bucket.upload_file(Filename=str(REPO_ROOT / 'tests/output/catalog.json'), Key=f'{STAC_KEY}/catalog.json')
+
+    collection = json.loads((REPO_ROOT / f'tests/output/{SENSOR_NAME}/collection.json').read_text())
+    collection['links'] = [link for link in collection['links'] if link.get('rel') != 'item']
+    bucket.put_object(Key=f'{STAC_KEY}/{SENSOR_NAME}/collection.json', Body=json.dumps(collection).encode(),
+                      ContentType='application/json')
+
+    if not local_source:
+        for acquisition_key in acquisition_keys:
+            for file in (root / acquisition_key).glob('*.tif'):
+                bucket.upload_file(Filename=str(file), Key=f"{acquisition_key}{file.name}")
+
+
+def scrape_metrics(port: int) -> dict:
+    """
+    Read the S3 request counts of the consumer by operation.
+    """
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+        text = response.read().decode()
+    requests = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == 'sac_stac_s3_requests_total':
+                requests[sample.labels['operation']] = int(sample.value)
+    return requests
+
+
+def peak_rss(pid: int):
+    """
+    Return the peak resident set size of the process in MiB, None where /proc is not available.
+    """
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def percentile(values: list, q: float):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, math.ceil(q * len(values)) - 1)]
+
+
+class LoadGenerator:
+    """
+    Publish messages at fixed rates and match the stac_indexer notifications
+    to them, oldest first, to measure their end-to-end latency.
+    """
+
+    def __init__(self, nc, acquisition_keys: list, sensor_key: str):
+        self.nc = nc
+        self.acquisition_keys = acquisition_keys
+        self.sensor_key = sensor_key
+        self.pending = {}
+        self.latencies = {'item': [], 'collection': []}
+        self.published = {'item': 0, 'collection': 0}
+        self.first_published = None
+        self.last_done = None
+
+    async def start(self):
+        await self.nc.subscribe('stac_indexer.>', cb=self.notified)
+
+    async def notified(self, msg):
+        now = time.perf_counter()
+        subject = msg.subject.split('.', 1)[1]
+        if subject == 'collection':
+            self.done('collection', msg.data.decode().split('/')[-2], now)
+        elif subject in ('item', 'items'):
+            # Item keys end with {item_id}/{item_id}.json, batches are newline-delimited
+            for key in msg.data.decode().splitlines():
+                self.done('item', key.split('/')[-2], now)
+
+    def done(self, message_type: str, key: str, now: float):
+        published = self.pending.get((message_type, key))
+        if published:
+            self.latencies[message_type].append(now - published.popleft())
+            self.last_done = now
+
+    async def publish(self, message_type: str, key: str, match: str):
+        now = time.perf_counter()
+        self.first_published = self.first_published or now
+        self.pending.setdefault((message_type, match), deque()).append(now)
+        self.published[message_type] += 1
+        await self.nc.publish(f'stac_creator.{message_type}', key.encode())
+
+    async def run_at_rate(self, message_type: str, rate: float, duration: float):
+        if not rate:
+            return
+        start = time.perf_counter()
+        for i in range(int(rate * duration)):
+            await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+            if message_type == 'item':
+                acquisition_key = self.acquisition_keys[i % len(self.acquisition_keys)]
+                await self.publish('item', acquisition_key, acquisition_key.split('/')[-2])
+            else:
+                await self.publish('collection', self.sensor_key, SENSOR_NAME)
+
+    def outstanding(self) -> int:
+        return sum(len(published) for published in self.pending.values())
+
+    async def drain(self, timeout: float):
+        end = time.monotonic() + timeout
+        while self.outstanding() and time.monotonic() < end:
+            await asyncio.sleep(0.1)
+
+
+async def generate_load(args, acquisition_keys: list, sensor_key: str) -> LoadGenerator:
+    nc = NATS()
+    await nc.connect(servers=[f'nats://127.0.0.1:{NATS_PORT}'])
+    generator = LoadGenerator(nc, acquisition_keys, sensor_key)
+    await generator.start()
+    await asyncio.gather(generator.run_at_rate('item', args.item_rate, args.duration),
+                         generator.run_at_rate('collection', args.collection_rate, args.duration))
+    await nc.flush()
+    await generator.drain(args.drain_timeout)
+    await nc.close()
+    return generator
+
+
+def report(generator: LoadGenerator, s3_requests: dict, rss) -> dict:
+    completed = sum(len(latencies) for latencies in generator.latencies.values())
+    elapsed = (generator.last_done or generator.first_published or 0) - (generator.first_published or 0)
+    return {
+        'published': generator.published,
+        'completed': {message_type: len(latencies) for message_type, latencies in generator.latencies.items()},
+        'outstanding': generator.outstanding(),
+        'messages_per_second': completed / elapsed if elapsed else None,
+        'latency_seconds': {
+            message_type: {f'p{int(q * 100)}': percentile(latencies, q) for q in (0.5, 0.9, 0.99, 1.0)}
+            for message_type, latencies in generator.latencies.items() if latencies
+        },
+        's3_requests': s3_requests,
+        's3_requests_per_message': sum(s3_requests.values()) / completed if completed else None,
+        'peak_rss_mib': rss
+    }
+
+
+def print_report(results: dict):
+    def line(label: str, value: str):
+        print(f"{label + ':':<20}{value}")
+
+    line('Published', results['published'])
+    line('Completed', f"{results['completed']} ({results['outstanding']} outstanding)")
+    if results['messages_per_second']:
+        line('Throughput', f"{results['messages_per_second']:.2f} msgs/s")
+    for message_type, latencies in results['latency_seconds'].items():
+        line(f'{message_type.capitalize()} latency', ', '.join(f"{q} {v:.3f}s" for q, v in latencies.items()))
+    line('S3 requests', f"{sum(results['s3_requests'].values())} {results['s3_requests']}")
+    if results['s3_requests_per_message']:
+        line('S3 per message', f"{results['s3_requests_per_message']:.1f}")
+    if results['peak_rss_mib']:
+        line('Peak RSS', f"{results['peak_rss_mib']:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--item-rate', type=float, default=5.0, help='stac_creator.item messages per second')
+    parser.add_argument('--collection-rate', type=float, default=0.0,
+                        help='stac_creator.collection messages per second')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds to publish for')
+    parser.add_argument('--drain-timeout', type=float, default=120.0,
+                        help='seconds to wait for outstanding messages once publishing stopped')
+    parser.add_argument('--acquisitions', type=int, default=None,
+                        help='synthetic acquisitions, one per item message by default')
+    parser.add_argument('--cog-size', type=int, default=512, help='width and height of the synthetic COGs')
+    parser.add_argument('--local-source', action='store_true',
+                        help='read products from the local mirror through SOURCE_ROOT instead of S3')
+    parser.add_argument('--nats-server', default='nats-server', help='nats-server binary')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    sensor_key = f'loadtest/fiji/{SENSOR_NAME}/'
+    count = args.acquisitions or max(1, int(args.item_rate * args.duration))
+    workdir = Path(tempfile.mkdtemp(prefix='sac-stac-loadtest-'))
+    moto_port, metrics_port = free_port(), free_port()
+    endpoint = f'http://127.0.0.1:{moto_port}'
+    processes = []
+    try:
+        print(f"Generating {count} acquisitions in {workdir}...")
+        acquisition_keys = generate_acquisitions(workdir, sensor_key, count, args.cog_size)
+
+        nats_server = subprocess.Popen([args.nats_server, '-a', '127.0.0.1', '-p', str(NATS_PORT)])
+        processes.append(nats_server)
+        moto_server = subprocess.Popen([sys.executable, '-m', 'moto.server', '-H', '127.0.0.1', '-p', str(moto_port)],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(moto_server)
+        wait_for_port(NATS_PORT, nats_server)
+        wait_for_port(moto_port, moto_server)
+        seed_bucket(endpoint, workdir, acquisition_keys, args.local_source)
+
+        env = dict(os.environ, S3_ENDPOINT=endpoint, S3_BUCKET=BUCKET, S3_STAC_KEY=STAC_KEY,
+                   S3_ACCESS_KEY_ID='testing', S3_SECRET_ACCESS_KEY='testing', S3_REGION='us-east-1',
+                   NATS_HOST='127.0.0.1', METRICS_PORT=str(metrics_port),
+                   PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT / 'src'), os.environ.get('PYTHONPATH')])))
+        env.pop('TEST_ENV', None)
+        if args.local_source:
+            env['SOURCE_ROOT'] = str(workdir)
+        consumer = subprocess.Popen([sys.executable, '-m', 'sac_stac.entrypoints.nats_eventconsumer'], env=env)
+        processes.append(consumer)
+        wait_for_port(metrics_port, consumer)
+        # The consumer subscribes right after serving its metrics
+        time.sleep(1)
+
+        print(f"Publishing for {args.duration}s at {args.item_rate} items/s "
+              f"and {args.collection_rate} collections/s...")
+        generator = asyncio.run(generate_load(args, acquisition_keys, sensor_key))
+
+        results = report(generator, scrape_metrics(metrics_port), peak_rss(consumer.pid))
+        print_report(results)
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=2))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
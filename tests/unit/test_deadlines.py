@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from sac_stac.deadlines import Deadlines, DeadlineExceeded, LatencyTracker
+from sac_stac.throttling import Throttle
+
+
+def test_latency_tracker_quantile():
+    tracker = LatencyTracker(min_samples=10)
+    for latency in range(1, 10):
+        tracker.record('get_object', latency)
+    assert tracker.quantile('get_object', 0.95) is None
+
+    tracker.record('get_object', 100)
+    assert tracker.quantile('get_object', 0.95) == 100
+    assert tracker.quantile('get_object', 0.5) == 5
+
+
+def test_deadlines_call_without_deadline():
+    deadlines = Deadlines()
+
+    assert deadlines.call('get_object', lambda: threading.current_thread()) is threading.current_thread()
+
+
+def test_deadlines_call_exceeded():
+    deadlines = Deadlines(deadlines={'get_object': 0.05})
+
+    with pytest.raises(DeadlineExceeded):
+        deadlines.call('get_object', time.sleep, 1)
+
+
+def test_deadlines_call_exceeded_releases_throttle():
+    deadlines = Deadlines(deadlines={'get_object': 0.05})
+    throttle = Throttle(max_concurrency=1)
+
+    with pytest.raises(DeadlineExceeded):
+        throttle.call('get_object', deadlines.call, 'get_object', time.sleep, 1)
+
+    assert throttle.in_flight == 0
+    assert throttle.call('get_object', deadlines.call, 'get_object', int, '1') == 1
+
+
+def test_deadlines_call_raises_error():
+    deadlines = Deadlines(deadlines={'get_object': 1})
+
+    with pytest.raises(ValueError):
+        deadlines.call('get_object', int, 'not a number')
+
+
+def test_deadlines_hedged_call():
+    deadlines = Deadlines(deadlines={'get_object': 5}, hedge=True)
+    for _ in range(deadlines.latencies.min_samples):
+        deadlines.latencies.record('get_object', 0.01)
+    calls = []
+
+    def get():
+        calls.append(1)
+        # Only the first attempt is slow
+        if len(calls) == 1:
+            time.sleep(2)
+            return 'slow'
+        return 'hedged'
+
+    start = time.perf_counter()
+    assert deadlines.call('get_object', get) == 'hedged'
+    assert time.perf_counter() - start < 1
+    assert len(calls) == 2
@@ -0,0 +1,40 @@
+import io
+
+import pytest
+
+from sac_stac.domain.index import get_index_record, append_index_records, read_index_records, to_geoparquet
+from sac_stac.util import load_json
+
+ITEM_PATH = 'tests/output/landsat_5/LT05_L1TP_075073_19911225/LT05_L1TP_075073_19911225.json'
+
+
+def test_get_index_record():
+    item = load_json(ITEM_PATH)
+
+    record = get_index_record(item)
+
+    assert record['id'] == 'LT05_L1TP_075073_19911225'
+    assert record['href'].endswith('/landsat_5/LT05_L1TP_075073_19911225/LT05_L1TP_075073_19911225.json')
+    assert record['datetime'] == item['properties']['datetime']
+    assert record['bbox'] == item['bbox']
+    assert record['geometry'] == item['geometry']
+
+
+def test_read_index_records_keeps_last_record():
+    body = append_index_records(b'', [{'id': 'a', 'datetime': '1'}, {'id': 'b', 'datetime': '2'}])
+    body = append_index_records(body, [{'id': 'a', 'datetime': '3'}])
+
+    assert body.count(b'\n') == 3
+    assert read_index_records(body) == [{'id': 'b', 'datetime': '2'}, {'id': 'a', 'datetime': '3'}]
+
+
+def test_to_geoparquet():
+    gpd = pytest.importorskip('geopandas')
+    pytest.importorskip('pyarrow')
+    record = get_index_record(load_json(ITEM_PATH))
+
+    frame = gpd.read_parquet(io.BytesIO(to_geoparquet([record])))
+
+    assert list(frame['id']) == ['LT05_L1TP_075073_19911225']
+    assert frame.crs.to_epsg() == 4326
+    assert frame['xmin'][0] == frame.geometry.bounds['minx'][0]
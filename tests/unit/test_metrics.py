@@ -0,0 +1,46 @@
+import pytest
+from moto import mock_s3
+from prometheus_client import REGISTRY
+from sac_stac.domain.s3 import S3, NoObjectError
+from sac_stac.metrics import stage
+
+BUCKET = 'test'
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_stage():
+    count = sample('sac_stac_stage_seconds_count', stage='test_stage')
+
+    @stage('test_stage')
+    def in_flight():
+        return sample('sac_stac_in_flight', stage='test_stage')
+
+    assert in_flight() == 1
+    assert sample('sac_stac_in_flight', stage='test_stage') == 0
+    assert sample('sac_stac_stage_seconds_count', stage='test_stage') == count + 1
+
+
+@mock_s3
+def test_s3_request_metrics():
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=BUCKET)
+
+    puts = sample('sac_stac_s3_requests_total', operation='put_object')
+    gets = sample('sac_stac_s3_requests_total', operation='get_object')
+    get_errors = sample('sac_stac_s3_errors_total', operation='get_object')
+    uploaded = sample('sac_stac_s3_bytes_total', direction='upload')
+    downloaded = sample('sac_stac_s3_bytes_total', direction='download')
+
+    s3.put_object(bucket_name=BUCKET, key='key/test/file.txt', body='hello world')
+    s3.get_object_body(bucket_name=BUCKET, object_name='key/test/file.txt')
+    with pytest.raises(NoObjectError):
+        s3.get_object_body(bucket_name=BUCKET, object_name='nothing')
+
+    assert sample('sac_stac_s3_requests_total', operation='put_object') == puts + 1
+    assert sample('sac_stac_s3_requests_total', operation='get_object') == gets + 2
+    assert sample('sac_stac_s3_errors_total', operation='get_object') == get_errors + 1
+    assert sample('sac_stac_s3_bytes_total', direction='upload') == uploaded + 11
+    assert sample('sac_stac_s3_bytes_total', direction='download') == downloaded + 11
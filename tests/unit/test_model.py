@@ -0,0 +1,146 @@
+from datetime import datetime
+
+from pystac import STAC_IO
+
+from sac_stac.domain.model import SacItem, add_item_to_collection_dict, add_items_to_collection_dict, \
+    add_child_to_catalog_dict, remove_items_from_collection_dict
+
+STAC_HREF = 'https://s3-uk-1.sa-catapult.co.uk/public-eo-data/stac_catalogs/cs_stac'
+
+
+def new_collection_dict():
+    return {
+        'id': 'landsat_5',
+        'links': [
+            {'rel': 'root', 'href': f'{STAC_HREF}/catalog.json', 'type': 'application/json'},
+            {'rel': 'self', 'href': f'{STAC_HREF}/landsat_5/collection.json', 'type': 'application/json'}
+        ],
+        'extent': {'spatial': {'bbox': [[0, 0, 0, 0]]}, 'temporal': {'interval': [['', '']]}}
+    }
+
+
+def test_add_item_to_collection_dict_first_item():
+    collection = add_item_to_collection_dict(
+        collection_dict=new_collection_dict(),
+        item_href=f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json',
+        bbox=[289185.0, -1874415.0, 517515.0, -1642485.0],
+        item_datetime=datetime(1991, 12, 25)
+    )
+
+    assert [link.get('rel') for link in collection.get('links')] == ['root', 'item', 'self']
+    assert collection.get('extent') == {
+        'spatial': {'bbox': [[289185.0, -1874415.0, 517515.0, -1642485.0]]},
+        'temporal': {'interval': [['1991-12-25T00:00:00Z', '1991-12-25T00:00:00Z']]}
+    }
+
+
+def test_add_item_to_collection_dict_extends_extent():
+    collection = new_collection_dict()
+    add_item_to_collection_dict(collection, f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json',
+                                [10.0, 10.0, 20.0, 20.0], datetime(1991, 12, 25))
+    add_item_to_collection_dict(collection, f'{STAC_HREF}/landsat_5/LT05_2/LT05_2.json',
+                                [15.0, 5.0, 30.0, 15.0], datetime(1992, 1, 25))
+    add_item_to_collection_dict(collection, f'{STAC_HREF}/landsat_5/LT05_0/LT05_0.json',
+                                [12.0, 12.0, 13.0, 13.0], datetime(1990, 1, 1))
+
+    assert [link.get('href') for link in collection.get('links') if link.get('rel') == 'item'] == [
+        f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json',
+        f'{STAC_HREF}/landsat_5/LT05_2/LT05_2.json',
+        f'{STAC_HREF}/landsat_5/LT05_0/LT05_0.json'
+    ]
+    assert collection.get('extent') == {
+        'spatial': {'bbox': [[10.0, 5.0, 30.0, 20.0]]},
+        'temporal': {'interval': [['1990-01-01T00:00:00Z', '1992-01-25T00:00:00Z']]}
+    }
+
+
+def test_add_item_to_collection_dict_existing_item():
+    collection = new_collection_dict()
+    add_item_to_collection_dict(collection, f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json',
+                                [10.0, 10.0, 20.0, 20.0], datetime(1991, 12, 25))
+    add_item_to_collection_dict(collection, f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json',
+                                [0.0, 0.0, 50.0, 50.0], datetime(1991, 12, 25))
+
+    # A rewritten item keeps its single link, and the extent covers where it moved
+    assert len(collection.get('links')) == 3
+    assert collection.get('extent').get('spatial') == {'bbox': [[0.0, 0.0, 50.0, 50.0]]}
+
+
+def test_add_items_to_collection_dict():
+    collection = new_collection_dict()
+    add_item_to_collection_dict(collection, f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json',
+                                [10.0, 10.0, 20.0, 20.0], datetime(1991, 12, 25))
+
+    add_items_to_collection_dict(collection, [
+        (f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json', [0.0, 0.0, 50.0, 50.0], datetime(1991, 12, 25)),
+        (f'{STAC_HREF}/landsat_5/LT05_2/LT05_2.json', [15.0, 5.0, 30.0, 15.0], datetime(1992, 1, 25)),
+        (f'{STAC_HREF}/landsat_5/LT05_0/LT05_0.json', [12.0, 12.0, 13.0, 13.0], datetime(1990, 1, 1))
+    ])
+
+    assert [link.get('rel') for link in collection.get('links')] == ['root', 'item', 'item', 'item', 'self']
+    assert collection.get('extent') == {
+        'spatial': {'bbox': [[10.0, 5.0, 30.0, 20.0]]},
+        'temporal': {'interval': [['1990-01-01T00:00:00Z', '1992-01-25T00:00:00Z']]}
+    }
+
+
+def test_remove_items_from_collection_dict():
+    items = [
+        (f'{STAC_HREF}/landsat_5/LT05_1/LT05_1.json', [10.0, 10.0, 20.0, 20.0], datetime(1991, 12, 25)),
+        (f'{STAC_HREF}/landsat_5/LT05_2/LT05_2.json', [15.0, 5.0, 30.0, 15.0], datetime(1992, 1, 25)),
+        (f'{STAC_HREF}/landsat_5/LT05_0/LT05_0.json', [12.0, 12.0, 13.0, 13.0], datetime(1990, 1, 1))
+    ]
+    collection = add_items_to_collection_dict(new_collection_dict(), items)
+
+    remove_items_from_collection_dict(collection, [items[1][0], items[2][0]], remaining_items=items[:1])
+
+    assert [link.get('rel') for link in collection.get('links')] == ['root', 'item', 'self']
+    assert collection.get('extent') == {
+        'spatial': {'bbox': [[10.0, 10.0, 20.0, 20.0]]},
+        'temporal': {'interval': [['1991-12-25T00:00:00Z', '1991-12-25T00:00:00Z']]}
+    }
+
+    remove_items_from_collection_dict(collection, [items[0][0]], remaining_items=[])
+
+    assert [link.get('rel') for link in collection.get('links')] == ['root', 'self']
+    assert collection.get('extent').get('spatial') == {'bbox': [[0, 0, 0, 0]]}
+
+
+def test_add_child_to_catalog_dict():
+    catalog = {
+        'id': 'cs-stac',
+        'links': [
+            {'rel': 'root', 'href': f'{STAC_HREF}/catalog.json', 'type': 'application/json'},
+            {'rel': 'child', 'href': f'{STAC_HREF}/landsat_5/collection.json', 'type': 'application/json'},
+            {'rel': 'self', 'href': f'{STAC_HREF}/catalog.json', 'type': 'application/json'}
+        ]
+    }
+
+    add_child_to_catalog_dict(catalog, f'{STAC_HREF}/landsat_7/collection.json')
+    add_child_to_catalog_dict(catalog, f'{STAC_HREF}/landsat_5/collection.json')
+
+    assert [(link.get('rel'), link.get('href')) for link in catalog.get('links')] == [
+        ('root', f'{STAC_HREF}/catalog.json'),
+        ('child', f'{STAC_HREF}/landsat_5/collection.json'),
+        ('child', f'{STAC_HREF}/landsat_7/collection.json'),
+        ('self', f'{STAC_HREF}/catalog.json')
+    ]
+
+
+def test_item_links_written_without_loading_root(monkeypatch):
+    def read_text(uri):
+        raise AssertionError(f"{uri} read")
+
+    monkeypatch.setattr(STAC_IO, 'read_text_method', read_text)
+    item = SacItem(id='LT05_L1TP_075073_19911225', geometry=None, bbox=None,
+                   datetime=datetime(1991, 12, 25), properties={})
+    item.add_collection_links(collection_id='landsat_5', collection_href=f'{STAC_HREF}/landsat_5/collection.json',
+                              root_href=f'{STAC_HREF}/catalog.json')
+    item.set_self_href(f'{STAC_HREF}/landsat_5/LT05_L1TP_075073_19911225/LT05_L1TP_075073_19911225.json')
+
+    assert [(link.get('rel'), link.get('href')) for link in item.to_dict().get('links')] == [
+        ('root', f'{STAC_HREF}/catalog.json'),
+        ('collection', f'{STAC_HREF}/landsat_5/collection.json'),
+        ('parent', f'{STAC_HREF}/landsat_5/collection.json'),
+        ('self', f'{STAC_HREF}/landsat_5/LT05_L1TP_075073_19911225/LT05_L1TP_075073_19911225.json')
+    ]
@@ -0,0 +1,103 @@
+import asyncio
+
+from sac_stac.entrypoints.notifier import Notifier
+
+
+class Repository:
+
+    def __init__(self):
+        self.objects = {}
+
+    def add_object(self, bucket, key, body, content_type=None):
+        self.objects[key] = body
+
+
+def run_notifier(notifications, **kwargs):
+    published = []
+
+    async def publish(subject, payload, headers=None):
+        published.append((subject, payload.decode()))
+
+    async def main():
+        notifier = Notifier(publish, **kwargs)
+        notifier.start(asyncio.get_running_loop())
+        for stac_type, key in notifications:
+            await notifier.notify(stac_type, key)
+        await notifier.stop()
+
+    asyncio.run(main())
+    return published
+
+
+def test_notifier_single():
+    published = run_notifier([('item', 'a.json'), ('collection', 'collection.json')])
+
+    assert published == [('stac_indexer.item', 'a.json'), ('stac_indexer.collection', 'collection.json')]
+
+
+def test_notifier_batch():
+    published = run_notifier([('item', 'a.json'), ('item', 'b.json'), ('item', 'c.json'),
+                              ('collection', 'collection.json')], mode='batch', batch_size=2)
+
+    assert published == [('stac_indexer.items', 'a.json\nb.json'),
+                         ('stac_indexer.items', 'c.json'),
+                         ('stac_indexer.collection', 'collection.json')]
+
+
+def test_notifier_batch_flushes_on_interval():
+    published = []
+
+    async def publish(subject, payload, headers=None):
+        published.append((subject, payload.decode()))
+
+    async def main():
+        notifier = Notifier(publish, mode='batch', flush_interval=0.01)
+        notifier.start(asyncio.get_running_loop())
+        await notifier.notify('item', 'a.json')
+        await asyncio.sleep(0.1)
+        assert published == [('stac_indexer.items', 'a.json')]
+        await notifier.stop()
+
+    asyncio.run(main())
+
+
+def test_notifier_manifest():
+    repo = Repository()
+
+    published = run_notifier([('item', 'a.json'), ('item', 'b.json')], mode='manifest', repo=repo)
+
+    assert [subject for subject, _ in published] == ['stac_indexer.manifest']
+    assert repo.objects[published[0][1]] == b'a.json\nb.json'
+
+
+def test_notifier_batch_max_bytes():
+    published = run_notifier([('item', 'a.json'), ('item', 'b.json'), ('item', 'c.json')],
+                             mode='batch', max_bytes=14)
+
+    assert published == [('stac_indexer.items', 'a.json\nb.json'), ('stac_indexer.items', 'c.json')]
+    assert all(len(payload) <= 14 for _, payload in published)
+
+
+def test_notifier_batch_keeps_keys_on_failed_publish():
+    published = []
+    failures = [ConnectionError('NATS unavailable')]
+
+    async def publish(subject, payload, headers=None):
+        if failures:
+            raise failures.pop()
+        published.append((subject, payload.decode(), headers))
+
+    async def main():
+        notifier = Notifier(publish, mode='batch')
+        await notifier.notify('item', 'a.json', headers={'traceparent': 'a'})
+        try:
+            await notifier.flush()
+        except ConnectionError:
+            pass
+        await notifier.notify('item', 'b.json', headers={'traceparent': 'b'})
+        await notifier.stop()
+
+    asyncio.run(main())
+
+    # Batches do not carry the trace headers of any one of their messages
+    assert published == [('stac_indexer.items', 'a.json\nb.json', None)]
@@ -1,10 +1,19 @@
 import os
-
-from shapely.geometry import Polygon
+from unittest import mock
+
+import numpy as np
+import rasterio
+from rasterio import RasterioIOError
+from rasterio.errors import RasterioError
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon, box
 from datetime import datetime
 
 from sac_stac.domain.operations import obtain_date_from_filename, \
-    get_geometry_from_cog, get_projection_from_cog
+    get_geometry_from_cog, get_projection_from_cog, match_bands_to_products, get_smallest_product_key, \
+    get_band_metadata_from_cog, get_changed_products, get_fingerprints_digest
+from sac_stac.adapters.cog_cache import CogMetadataCache
+from sac_stac.load_config import config
 
 
 def test_obtain_date_from_filename_sentinel():
@@ -126,3 +135,179 @@ def test_get_projection_from_cog_from_tests():
 
     finally:
         os.environ.pop("TEST_ENV")
+
+
+def test_get_projection_from_cog_cached(tmp_path):
+
+    file = 'tests/data/common_sensing/fiji/sentinel_2/S2A_MSIL2A_20151022T222102_T01KBU/' \
+           'S2A_MSIL2A_20151022T222102_T01KBU_B01_60m.tif'
+    cache = CogMetadataCache(str(tmp_path / 'cog_cache.sqlite'))
+
+    get_projection_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'))
+
+    with mock.patch('sac_stac.domain.operations.rasterio.open', side_effect=RasterioIOError) as rasterio_open:
+        proj_shp, proj_tran = get_projection_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'))
+        geometry, crs = get_geometry_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'))
+        rasterio_open.assert_not_called()
+
+        get_projection_from_cog(file, cache=cache, fingerprint=(1000, '"changed"'))
+        rasterio_open.assert_called_once()
+
+    assert proj_shp == [1830, 1830]
+    assert proj_tran == [60.0, 0.0, 199980.0, 0.0, -60.0, 7900000.0, 0.0, 0.0, 1.0]
+    assert geometry == Polygon(
+        [(309780, 7790200), (309780, 7900000), (199980, 7900000), (199980, 7790200), (309780, 7790200)])
+    assert crs.is_valid
+
+
+def test_match_bands_to_products_exact_tokens():
+    product_keys = [
+        'common_sensing/fiji/landsat_8/LC08_L1TP_076071_20200622/'
+        'LC08_L1GT_076071_20200622_20200707_01_T2_bt_band10.tif',
+        'common_sensing/fiji/landsat_8/LC08_L1TP_076071_20200622/'
+        'LC08_L1GT_076071_20200622_20200707_01_T2_bt_band11.tif',
+        'common_sensing/fiji/landsat_8/LC08_L1TP_076071_20200622/'
+        'LC08_L1GT_076071_20200622_20200707_01_T2_sr_band1.tif'
+    ]
+
+    band_products = match_bands_to_products(product_keys, ['sr_band1', 'bt_band10', 'bt_band1'])
+
+    assert band_products == {
+        'sr_band1': product_keys[2],
+        'bt_band10': product_keys[0]
+    }
+
+
+def test_match_bands_to_products_leading_separator():
+    product_keys = [
+        'common_sensing/fiji/landsat_8_mlwater/LC08_L1TP_076071_20200622/'
+        'LC08_L1TP_076071_20200622_watermask.tif',
+        'common_sensing/fiji/landsat_8_wofs/LC08_L1TP_076071_20200622/'
+        'LC08_L1TP_076071_20200622_water.tif'
+    ]
+
+    band_products = match_bands_to_products(product_keys, ['_water', '_waterprob'])
+
+    assert band_products == {'_water': product_keys[1]}
+
+
+def test_match_bands_to_products_regex():
+    product_keys = [
+        'common_sensing/fiji/sentinel_2/S2A_MSIL2A_20151022T222102_T01KBU/'
+        'S2A_MSIL2A_20151022T222102_T01KBU_B01_60m.tif',
+        'common_sensing/fiji/sentinel_2/S2A_MSIL2A_20151022T222102_T01KBU/'
+        'S2A_MSIL2A_20151022T222102_T01KBU_B8A_20m.tif'
+    ]
+
+    band_products = match_bands_to_products(product_keys, ['B01_60m', 'B8A_20m', '60m'],
+                                            regex=r'_T\d{2}[A-Z]{3}_(\w+)$')
+
+    assert band_products == {
+        'B01_60m': product_keys[0],
+        'B8A_20m': product_keys[1]
+    }
+
+
+def test_match_bands_to_products_spot():
+    spot_ms, spot_pan = [next(s for s in config.get('sensors') if s.get('id') == sensor_id)
+                         for sensor_id in ('SPOT5_MS', 'SPOT5_PAN')]
+    product_keys = [
+        'common_sensing/fiji/SPOT5_MS/55123760405122223122J-Ortho_cog/55123760405122223122J-Ortho_cog_XS1.tif',
+        'common_sensing/fiji/SPOT5_MS/55123760405122223122J-Ortho_cog/55123760405122223122J-Ortho_cog_XS2.tif',
+        'common_sensing/fiji/SPOT5_MS/55123760405122223122J-Ortho_cog/55123760405122223122J-Ortho_cog_XS3.tif',
+        'common_sensing/fiji/SPOT5_MS/55123760405122223122J-Ortho_cog/55123760405122223122J-Ortho_cog_XS4.tif'
+    ]
+    pan_keys = ['common_sensing/fiji/SPOT5_PAN/55123760405122223122A-Ortho_cog/'
+                '55123760405122223122A-Ortho_cog_PAN.tif']
+
+    band_names = [band.get('name') for band in spot_ms['extensions']['eo']['bands']]
+
+    band_products = match_bands_to_products(product_keys, band_names, regex=spot_ms['formatting']['band']['regex'])
+    pan_products = match_bands_to_products(pan_keys, ['PAN'], regex=spot_pan['formatting']['band']['regex'])
+
+    assert band_products == {'XS1': product_keys[0], 'XS2': product_keys[1],
+                             'XS3': product_keys[2], 'XS4': product_keys[3]}
+    assert pan_products == {'PAN': pan_keys[0]}
+
+
+def test_get_smallest_product_key():
+    fingerprints = {'a_B01.tif': (300, '"a"'), 'a_B02.tif': (200, '"b"'), 'a_empty.tif': (0, '"c"')}
+
+    assert get_smallest_product_key(fingerprints) == 'a_B02.tif'
+
+
+def test_get_changed_products():
+    fingerprints = {'a_B01.tif': (300, '"a"', '2021-01-01T00:00:00+00:00'),
+                    'a_B02.tif': (200, '"b"', '2021-01-01T00:00:00+00:00')}
+    stored = {key: dict(size=size, etag=etag, last_modified=last_modified)
+              for key, (size, etag, last_modified) in fingerprints.items()}
+
+    assert get_changed_products(stored, fingerprints) == []
+    assert get_changed_products(stored, {**fingerprints, 'a_B02.tif': (200, '"c"', '2021-02-01T00:00:00+00:00')}) == [
+        'a_B02.tif']
+    assert get_changed_products(stored, {'a_B01.tif': fingerprints['a_B01.tif']}) is None
+    assert get_changed_products(None, fingerprints) is None
+
+
+def test_get_fingerprints_digest():
+    fingerprints = {'a_B01.tif': (300, '"a"', '2021-01-01T00:00:00+00:00')}
+
+    assert get_fingerprints_digest(fingerprints) == get_fingerprints_digest(dict(fingerprints))
+    assert get_fingerprints_digest(fingerprints) != get_fingerprints_digest({'a_B01.tif': (300, '"b"', None)})
+
+
+def test_get_geometry_from_cog_footprint(tmp_path):
+    file = str(tmp_path / 'collar.tif')
+    data = np.ones((512, 512), dtype='uint16')
+    data[:, :128] = 0
+    with rasterio.open(file, 'w', driver='GTiff', width=512, height=512, count=1, dtype='uint16', nodata=0,
+                       crs='EPSG:32660', transform=from_origin(0, 15360, 30, 30), tiled=True) as ds:
+        ds.write(data, 1)
+        ds.build_overviews([2, 4, 8])
+
+    bounds, _ = get_geometry_from_cog(file)
+    footprint, crs = get_geometry_from_cog(file, footprint=True)
+
+    assert bounds == box(0, 0, 15360, 15360)
+    assert footprint.equals(box(3840, 0, 15360, 15360))
+    assert crs.is_valid
+
+
+def test_get_geometry_from_cog_footprint_cached_per_tolerance(tmp_path):
+    file = str(tmp_path / 'collar.tif')
+    data = np.ones((512, 512), dtype='uint16')
+    data[:, :128] = 0
+    with rasterio.open(file, 'w', driver='GTiff', width=512, height=512, count=1, dtype='uint16', nodata=0,
+                       crs='EPSG:32660', transform=from_origin(0, 15360, 30, 30), tiled=True) as ds:
+        ds.write(data, 1)
+    cache = CogMetadataCache(str(tmp_path / 'cog_cache.sqlite'))
+
+    with mock.patch('sac_stac.domain.operations.read_footprint', side_effect=RasterioError):
+        bounds, _ = get_geometry_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'), footprint=True)
+    footprint, _ = get_geometry_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'), footprint=True)
+
+    with mock.patch('sac_stac.domain.operations.rasterio.open', side_effect=RasterioIOError) as rasterio_open:
+        get_geometry_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'), footprint=True)
+        rasterio_open.assert_not_called()
+
+    simplified, _ = get_geometry_from_cog(file, cache=cache, fingerprint=(1000, '"etag"'), footprint=True,
+                                          simplify_tolerance=60)
+
+    assert bounds == box(0, 0, 15360, 15360)
+    assert footprint.equals(box(3840, 0, 15360, 15360))
+    assert simplified.equals(footprint)
+    assert cache.get(file, 1000, '"etag"')['footprint_tolerance'] == 60
+
+
+def test_get_band_metadata_from_cog_statistics_tags(tmp_path):
+    file = str(tmp_path / 'statistics.tif')
+    with rasterio.open(file, 'w', driver='GTiff', width=64, height=64, count=1, dtype='float32', nodata=-1,
+                       crs='EPSG:32660', transform=from_origin(0, 1920, 30, 30)) as ds:
+        ds.write(np.full((64, 64), 2, dtype='float32'), 1)
+        ds.update_tags(1, STATISTICS_MINIMUM=1, STATISTICS_MAXIMUM=3, STATISTICS_MEAN=2, STATISTICS_STDDEV=0.5)
+
+    proj_shp, proj_tran, raster_band = get_band_metadata_from_cog(file, statistics=True)
+
+    assert proj_shp == [64, 64]
+    assert raster_band == {'data_type': 'float32', 'nodata': -1,
+                           'statistics': {'minimum': 1, 'maximum': 3, 'mean': 2, 'stddev': 0.5}}
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+
+from moto.s3 import mock_s3
+from sac_stac.adapters import repository
+from sac_stac.domain.index import get_index_record, read_index_records
+from sac_stac.domain.s3 import S3
+from sac_stac.entrypoints import rebuild
+from sac_stac.util import get_rel_links, load_json
+
+STAC_HREF = 'https://s3-uk-1.sa-catapult.co.uk/public-eo-data/stac_catalogs/cs_stac'
+ITEM_ID = 'LT05_L1TP_075073_19911225'
+
+
+@mock_s3
+def test_rebuild():
+    sensor_key = 'common_sensing/fiji/landsat_5/'
+    try:
+        os.environ["TEST_ENV"] = "Yes"
+
+        s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+        s3.s3_resource.create_bucket(Bucket='public-eo-data')
+        for file in Path(f'tests/data/{sensor_key}').glob('**/*.tif'):
+            s3.s3_resource.Bucket('public-eo-data').upload_file(
+                Filename=str(file),
+                Key=f"{sensor_key}{file.parent.stem}/{file.name}"
+            )
+        s3.put_object('public-eo-data', 'stac_catalogs/cs_stac/catalog.json', b'{"id": "corrupt')
+        repo = repository.S3Repository(s3)
+
+        catalog_key = rebuild.rebuild(repo, sensor_ids=['landsat_5'], shard_size=1,
+                                      staging_prefix='stac_catalogs/cs_stac_staging/test')
+
+        catalog = repo.get_dict('public-eo-data', catalog_key)
+        collection = repo.get_dict('public-eo-data', 'stac_catalogs/cs_stac/landsat_5/collection.json')
+        item = repo.get_dict('public-eo-data', f'stac_catalogs/cs_stac/landsat_5/{ITEM_ID}/{ITEM_ID}.json')
+
+        assert get_rel_links(catalog, 'child') == [f'{STAC_HREF}/landsat_5/collection.json']
+        assert get_rel_links(collection, 'item') == [f'{STAC_HREF}/landsat_5/{ITEM_ID}/{ITEM_ID}.json']
+        assert collection.get('extent').get('spatial').get('bbox') == [item.get('bbox')]
+        index = repo.get_object('public-eo-data', 'stac_catalogs/cs_stac/landsat_5/items.ndjson')
+        assert read_index_records(index) == [get_index_record(item)]
+        assert not list(s3.s3_resource.Bucket('public-eo-data').objects.filter(Prefix='stac_catalogs/cs_stac_staging'))
+    finally:
+        os.environ.pop("TEST_ENV")
+
+
+@mock_s3
+def test_rebuild_keeps_live_items_and_collections():
+    sensor_key = 'common_sensing/fiji/landsat_5/'
+    live_id = 'LT05_L1TP_075073_19920125'
+    live_key = f'stac_catalogs/cs_stac/landsat_5/{live_id}/{live_id}.json'
+    try:
+        os.environ["TEST_ENV"] = "Yes"
+
+        s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+        s3.s3_resource.create_bucket(Bucket='public-eo-data')
+        for file in Path(f'tests/data/{sensor_key}').glob('**/*.tif'):
+            s3.s3_resource.Bucket('public-eo-data').upload_file(
+                Filename=str(file),
+                Key=f"{sensor_key}{file.parent.stem}/{file.name}"
+            )
+        repo = repository.S3Repository(s3)
+
+        # A live catalog with every collection, and an item ingested while the rebuild runs
+        repo.add_json_from_dict('public-eo-data', 'stac_catalogs/cs_stac/catalog.json',
+                                load_json('tests/output/catalog.json'))
+        live_item = load_json(f'tests/output/landsat_5/{ITEM_ID}/{ITEM_ID}.json')
+        live_item['id'] = live_id
+        live_item['properties']['datetime'] = '1992-01-25T00:00:00Z'
+        live_item['links'] = [dict(link, href=f'{STAC_HREF}/landsat_5/{live_id}/{live_id}.json')
+                              if link['rel'] == 'self' else link for link in live_item['links']]
+        repo.add_json_from_dict('public-eo-data', live_key, live_item)
+        collection = load_json('tests/output/landsat_5/collection.json')
+        collection['links'].insert(1, {'rel': 'item', 'href': f'{STAC_HREF}/landsat_5/{live_id}/{live_id}.json',
+                                       'type': 'application/json'})
+        repo.add_json_from_dict('public-eo-data', 'stac_catalogs/cs_stac/landsat_5/collection.json', collection)
+
+        catalog_key = rebuild.rebuild(repo, sensor_ids=['landsat_5'], shard_size=1,
+                                      staging_prefix='stac_catalogs/cs_stac_staging/test')
+
+        catalog = repo.get_dict('public-eo-data', catalog_key)
+        collection = repo.get_dict('public-eo-data', 'stac_catalogs/cs_stac/landsat_5/collection.json')
+
+        assert sorted(get_rel_links(catalog, 'child')) == sorted(
+            get_rel_links(load_json('tests/output/catalog.json'), 'child'))
+        assert sorted(get_rel_links(collection, 'item')) == [
+            f'{STAC_HREF}/landsat_5/{ITEM_ID}/{ITEM_ID}.json', f'{STAC_HREF}/landsat_5/{live_id}/{live_id}.json']
+        assert collection['extent']['temporal']['interval'][0][1] == '1992-01-25T00:00:00Z'
+        index = repo.get_object('public-eo-data', 'stac_catalogs/cs_stac/landsat_5/items.ndjson')
+        assert sorted(r['id'] for r in read_index_records(index)) == [ITEM_ID, live_id]
+    finally:
+        os.environ.pop("TEST_ENV")
@@ -2,7 +2,9 @@ import json
 from pathlib import Path
 
 import pytest
+from botocore.exceptions import ClientError
 from moto import mock_s3
+from sac_stac.domain import s3 as s3_module
 from sac_stac.domain.s3 import S3, NoObjectError
 
 BUCKET = 'test'
@@ -62,6 +64,38 @@ def test_list_common_prefixes_not_exist():
     assert not objs
 
 
+def test_s3_timeouts(monkeypatch):
+    monkeypatch.setenv('S3_READ_TIMEOUT', '7')
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+
+    assert s3.s3_resource.meta.client.meta.config.read_timeout == 7
+    assert s3.s3_resource.meta.client.meta.config.connect_timeout == 5
+
+
+@mock_s3
+def test_list_pages(monkeypatch):
+    monkeypatch.setattr(s3_module, 'LIST_PAGE_SIZE', 2)
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    initialise_bucket(s3_resource=s3.s3_resource, bucket_name=BUCKET)
+
+    prefixes = s3.list_common_prefixes(bucket_name=BUCKET, prefix='common_sensing/fiji/sentinel_2/')
+    objects = s3.list_objects(bucket_name=BUCKET, prefix='common_sensing/fiji/sentinel_2/', suffix='.tif')
+    limited = s3.list_objects(bucket_name=BUCKET, prefix='common_sensing/fiji/sentinel_2/', limit=3)
+
+    assert len(prefixes) == 3
+    assert len(objects) == len(list(Path('tests/data/common_sensing/fiji/sentinel_2').glob('**/*.tif')))
+    assert len({o.key for o in objects}) == len(objects)
+    assert [o.key for o in limited] == [o.key for o in objects[:3]]
+
+
+@mock_s3
+def test_put_object_raises():
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+
+    with pytest.raises(ClientError):
+        s3.put_object(bucket_name='missing', key='key/test/file.txt', body='hello world')
+
+
 @mock_s3
 def test_put_object():
     s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
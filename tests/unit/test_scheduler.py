@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from sac_stac.entrypoints import scheduler
+
+
+def run_scheduler(monkeypatch, prepare_stac_collection, add_stac_item, submissions, expected, **kwargs):
+    monkeypatch.setattr(scheduler, 'prepare_stac_collection', prepare_stac_collection)
+    monkeypatch.setattr(scheduler, 'add_stac_item', add_stac_item)
+
+    async def main():
+        published = []
+        done = asyncio.Event()
+
+        async def publish(subject, payload, headers=None):
+            published.append((subject, payload.decode()))
+            if len(published) == expected:
+                done.set()
+
+        s = scheduler.Scheduler(repo=None, publish=publish, item_workers=1, backfill_workers=1, **kwargs)
+        s.start(asyncio.get_running_loop())
+        for submit, key in submissions:
+            await getattr(s, submit)(key)
+        await asyncio.wait_for(done.wait(), 5)
+        await s.stop()
+        return published
+
+    return asyncio.run(main())
+
+
+def test_scheduler_publishes_collection_after_its_units(monkeypatch):
+    added = []
+
+    def prepare_stac_collection(repo, sensor_key, source=None):
+        return 'landsat_8/collection.json', [f'{sensor_key}a/', f'{sensor_key}b/', f'{sensor_key}c/']
+
+    def add_stac_item(repo, acquisition_key, source=None):
+        added.append(acquisition_key)
+        if acquisition_key.endswith('b/'):
+            raise ValueError('Invalid acquisition')
+        return 'item', f'{acquisition_key}item.json'
+
+    published = run_scheduler(monkeypatch, prepare_stac_collection, add_stac_item,
+                              [('submit_collection', 'landsat_8/')], expected=3, max_retries=1, retry_delay=0)
+
+    assert sorted(added) == ['landsat_8/a/', 'landsat_8/b/', 'landsat_8/b/', 'landsat_8/c/']
+    assert published == [('stac_indexer.item', 'landsat_8/a/item.json'),
+                         ('stac_indexer.item', 'landsat_8/c/item.json'),
+                         ('stac_indexer.collection', 'landsat_8/collection.json')]
+
+
+def test_scheduler_items_not_blocked_by_backfill(monkeypatch):
+    release = threading.Event()
+
+    def prepare_stac_collection(repo, sensor_key, source=None):
+        return 'landsat_8/collection.json', ['landsat_8/a/']
+
+    def add_stac_item(repo, acquisition_key, source=None):
+        if acquisition_key == 'landsat_8/a/':
+            release.wait(5)
+        else:
+            release.set()
+        return 'item', f'{acquisition_key}item.json'
+
+    published = run_scheduler(monkeypatch, prepare_stac_collection, add_stac_item,
+                              [('submit_collection', 'landsat_8/'), ('submit_item', 'landsat_8/live/')], expected=3)
+
+    assert published == [('stac_indexer.item', 'landsat_8/live/item.json'),
+                         ('stac_indexer.item', 'landsat_8/a/item.json'),
+                         ('stac_indexer.collection', 'landsat_8/collection.json')]
+
+
+def test_scheduler_retries_failed_units(monkeypatch):
+    attempts = []
+
+    def add_stac_item(repo, acquisition_key, source=None):
+        attempts.append(acquisition_key)
+        if len(attempts) < 3:
+            raise TimeoutError('Deadline exceeded')
+        return 'item', f'{acquisition_key}item.json'
+
+    published = run_scheduler(monkeypatch, None, add_stac_item, [('submit_item', 'landsat_8/live/')],
+                              expected=1, max_retries=3, retry_delay=0)
+
+    assert len(attempts) == 3
+    assert published == [('stac_indexer.item', 'landsat_8/live/item.json')]
+
+
+def test_scheduler_deletes_items_in_one_unit(monkeypatch):
+    deleted = []
+
+    def delete_stac_items(repo, acquisition_keys, source=None):
+        deleted.append(acquisition_keys)
+        return ['landsat_8/collection.json'], [f'{key}item.json' for key in acquisition_keys]
+
+    monkeypatch.setattr(scheduler, 'delete_stac_items', delete_stac_items)
+    published = run_scheduler(monkeypatch, None, None, [('submit_delete', 'landsat_8/a/\nlandsat_8/b/\n')],
+                              expected=2)
+
+    assert deleted == [['landsat_8/a/', 'landsat_8/b/']]
+    assert published == [('stac_indexer.delete', 'landsat_8/a/item.json\nlandsat_8/b/item.json'),
+                         ('stac_indexer.collection', 'landsat_8/collection.json')]
@@ -1,12 +1,25 @@
+import json
 import os
 import shutil
 from pathlib import Path
+from unittest import mock
 
+import numpy as np
+import rasterio
 from moto.s3 import mock_s3
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
 from sac_stac.adapters import repository
+from sac_stac.adapters.cog_cache import CogMetadataCache
+from sac_stac.adapters.source import FileSystemSource
+from sac_stac.util import get_rel_links, load_json
+from sac_stac.domain.index import read_index_records
 from sac_stac.domain.s3 import S3
+from sac_stac.domain.validation import StacValidator, load_schemas
 from sac_stac.service_layer import services
 
+TEST_SCHEMAS = {**load_schemas(), **load_schemas(Path('tests/data/schemas'))}
+
 
 def initialise_s3_bucket(sensor_key, s3_resource, bucket_name):
     s3_resource.create_bucket(Bucket=bucket_name)
@@ -53,6 +66,62 @@ def test_add_stac_collection():
         os.environ.pop("TEST_ENV")
 
 
+@mock_s3
+def test_add_stac_collection_validated(monkeypatch):
+    sensor_key = 'common_sensing/fiji/landsat_5/'
+    monkeypatch.setattr(services, 'validator', StacValidator(TEST_SCHEMAS, required=[]))
+    try:
+        os.environ["TEST_ENV"] = "Yes"
+
+        s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+        initialise_s3_bucket(sensor_key, s3.s3_resource, 'public-eo-data')
+
+        repo = repository.S3Repository(s3)
+
+        _, collection_key = services.add_stac_collection(repo=repo, sensor_key=sensor_key)
+
+        collection = repo.get_dict(bucket='public-eo-data', key=collection_key)
+        assert len(get_rel_links(collection, 'item')) == 1
+        records, part_keys = services.read_item_index(repo=repo, collection_id='landsat_5')
+        assert [r['href'] for r in records] == get_rel_links(collection, 'item')
+        assert len(part_keys) == 1
+    finally:
+        os.environ.pop("TEST_ENV")
+
+
+@mock_s3
+def test_add_stac_collection_existing_catalog():
+    sensor_key = 'common_sensing/fiji/landsat_5/'
+    bucket_name = 'public-eo-data'
+    try:
+        os.environ["TEST_ENV"] = "Yes"
+
+        s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+        initialise_s3_bucket(sensor_key, s3.s3_resource, bucket_name)
+        # Only the catalog is uploaded, its children must not need resolving
+        s3.s3_resource.Bucket(bucket_name).upload_file(
+            Filename='tests/output/catalog.json',
+            Key='stac_catalogs/cs_stac/catalog.json'
+        )
+
+        repo = repository.S3Repository(s3)
+
+        stac_type, collection_key = services.add_stac_collection(repo=repo, sensor_key=sensor_key)
+
+        catalog = repo.get_dict(bucket=bucket_name, key='stac_catalogs/cs_stac/catalog.json')
+        collection = repo.get_dict(bucket=bucket_name, key=collection_key)
+        stac_href = 'https://s3-uk-1.sa-catapult.co.uk/public-eo-data/stac_catalogs/cs_stac'
+
+        assert get_rel_links(catalog, 'child') == get_rel_links(load_json('tests/output/catalog.json'), 'child')
+        assert get_rel_links(collection, 'root') == [f'{stac_href}/catalog.json']
+        assert get_rel_links(collection, 'parent') == [f'{stac_href}/catalog.json']
+        assert get_rel_links(collection, 'self') == [f'{stac_href}/landsat_5/collection.json']
+        assert get_rel_links(collection, 'item') == [
+            f'{stac_href}/landsat_5/LT05_L1TP_075073_19911225/LT05_L1TP_075073_19911225.json']
+    finally:
+        os.environ.pop("TEST_ENV")
+
+
 @mock_s3
 def test_add_stac_item():
     sensor_name = 'landsat_5'
@@ -80,6 +149,244 @@ def test_add_stac_item():
         os.environ.pop("TEST_ENV")
 
 
+@mock_s3
+def test_add_stac_item_from_file_system_source():
+    sensor_name = 'landsat_5'
+    sensor_key = f'common_sensing/fiji/{sensor_name}/'
+    acquisition_key = f'{sensor_key}LT05_L1TP_075073_19920125/'
+    bucket_name = 'public-eo-data'
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=bucket_name)
+    add_stac_s3(sensor_name, s3.s3_resource, bucket_name)
+
+    repo = repository.S3Repository(s3)
+    source = FileSystemSource('tests/data/test_add_stac_item')
+
+    stac_type, item_key = services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source)
+
+    item = repo.get_dict(bucket=bucket_name, key=item_key)
+    assert item_key == 'stac_catalogs/cs_stac/landsat_5/LT05_L1TP_075073_19920125/LT05_L1TP_075073_19920125.json'
+    assert item['assets']['blue']['href'] == \
+        f"{services.S3_HREF}/{acquisition_key}LT05_L1GS_075073_19920125_20170124_01_T2_sr_band1.tif"
+    assert item['assets']['blue']['proj:shape'] != [0, 0]
+    assert item['bbox']
+
+
+@mock_s3
+def test_add_stac_item_thumbnail_and_statistics(tmp_path, monkeypatch):
+    sensor_name = 'landsat_5'
+    sensor_conf = next(s for s in services.config.get('sensors') if s.get('id') == sensor_name)
+    monkeypatch.setitem(sensor_conf, 'thumbnail', {'enabled': True, 'format': 'PNG', 'max_size': 256})
+    monkeypatch.setitem(sensor_conf, 'statistics', {'enabled': True})
+    sensor_key = f'common_sensing/fiji/{sensor_name}/'
+    acquisition_key = f'{sensor_key}LT05_L1TP_075073_19920125/'
+    bucket_name = 'public-eo-data'
+
+    (tmp_path / acquisition_key).mkdir(parents=True)
+    for band in ('sr_band1', 'sr_band2', 'sr_band3'):
+        file = tmp_path / acquisition_key / f'LT05_L1GS_075073_19920125_20170124_01_T2_{band}.tif'
+        with rasterio.open(file, 'w', driver='GTiff', width=1024, height=512, count=1, dtype='uint16', nodata=0,
+                           crs='EPSG:32660', transform=from_origin(0, 15360, 30, 30), tiled=True) as ds:
+            ds.write(np.random.default_rng(0).integers(1, 10000, (512, 1024), dtype='uint16'), 1)
+            ds.build_overviews([2, 4, 8])
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=bucket_name)
+    add_stac_s3(sensor_name, s3.s3_resource, bucket_name)
+
+    repo = repository.S3Repository(s3)
+    stac_type, item_key = services.add_stac_item(repo=repo, acquisition_key=acquisition_key,
+                                                 source=FileSystemSource(str(tmp_path)))
+
+    thumbnail_key = 'stac_catalogs/cs_stac/landsat_5/LT05_L1TP_075073_19920125/LT05_L1TP_075073_19920125_thumbnail.png'
+    item = repo.get_dict(bucket=bucket_name, key=item_key)
+    thumbnail = item['assets']['thumbnail']
+    raster_band = item['assets']['red']['raster:bands'][0]
+    assert raster_band['data_type'] == 'uint16'
+    assert raster_band['nodata'] == 0
+    assert raster_band['statistics']['valid_percent'] == 100
+    assert 1 <= raster_band['statistics']['minimum'] < raster_band['statistics']['maximum'] < 10000
+    assert thumbnail == {'href': f"{services.S3_HREF}/{thumbnail_key}", 'type': 'image/png', 'roles': ['thumbnail']}
+
+    body = s3.s3_resource.Object(bucket_name, thumbnail_key).get()['Body'].read()
+    with MemoryFile(body) as mem, mem.open() as image:
+        assert image.driver == 'PNG'
+        assert image.count == 4
+        assert image.shape == (128, 256)
+
+
+@mock_s3
+def test_update_item_index_compacts_parts(monkeypatch):
+    bucket_name = 'public-eo-data'
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=bucket_name)
+    repo = repository.S3Repository(s3)
+    monkeypatch.setattr(services, 'ITEM_INDEX_COMPACTION_INTERVAL', 3)
+    monkeypatch.setattr(services, '_index_parts', {})
+
+    records = [{'id': item_id, 'href': f'{item_id}.json', 'datetime': f'2020-01-0{day}T00:00:00Z',
+                'bbox': [0, 0, 0, 0], 'geometry': {'type': 'Point', 'coordinates': [0, 0]}}
+               for day, item_id in enumerate(('a', 'b', 'a'), start=1)]
+    for record in records[:2]:
+        services.update_item_index(repo=repo, collection_id='landsat_5', records=[record])
+
+    assert not repo.exists(bucket=bucket_name, key=services.get_item_index_key('landsat_5'))
+    assert len(services.read_item_index(repo=repo, collection_id='landsat_5')[1]) == 2
+
+    services.update_item_index(repo=repo, collection_id='landsat_5', records=[records[2]])
+
+    body = repo.get_object(bucket=bucket_name, key=services.get_item_index_key('landsat_5'))
+    assert read_index_records(body) == records[1:]
+    assert services.read_item_index(repo=repo, collection_id='landsat_5')[1] == []
+
+
+def write_band(path, width, height):
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='uint16', nodata=0,
+                       crs='EPSG:32660', transform=from_origin(0, 15360, 30, 30), tiled=True) as ds:
+        ds.write(np.ones((height, width), dtype='uint16'), 1)
+
+
+@mock_s3
+def test_add_stac_item_cached_cog_metadata(tmp_path, monkeypatch):
+    sensor_name = 'landsat_5'
+    sensor_conf = next(s for s in services.config.get('sensors') if s.get('id') == sensor_name)
+    monkeypatch.setitem(sensor_conf, 'thumbnail', {'enabled': False})
+    monkeypatch.setitem(sensor_conf, 'footprint', {'enabled': True, 'simplify_tolerance': 30})
+    monkeypatch.setitem(sensor_conf, 'statistics', {'enabled': True})
+    acquisition_key = f'common_sensing/fiji/{sensor_name}/LT05_L1TP_075073_19920125/'
+    bucket_name = 'public-eo-data'
+
+    (tmp_path / acquisition_key).mkdir(parents=True)
+    for band, width in (('sr_band1', 512), ('sr_band2', 1024)):
+        write_band(tmp_path / acquisition_key / f'LT05_L1GS_075073_19920125_20170124_01_T2_{band}.tif', width, 512)
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=bucket_name)
+    add_stac_s3(sensor_name, s3.s3_resource, bucket_name)
+    repo = repository.S3Repository(s3, cog_cache=CogMetadataCache(str(tmp_path / 'cog_cache.sqlite')))
+    source = FileSystemSource(str(tmp_path))
+
+    _, item_key = services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source)
+    item = repo.get_dict(bucket=bucket_name, key=item_key)
+    repo.delete_objects(bucket=bucket_name, keys=[item_key])
+
+    # The footprint and statistics of the smallest product are cached together, not in turn
+    with mock.patch('sac_stac.domain.operations.rasterio.open', wraps=rasterio.open) as rasterio_open:
+        assert services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source) == \
+            ('item', item_key)
+        rasterio_open.assert_not_called()
+    assert repo.get_dict(bucket=bucket_name, key=item_key) == item
+
+
+@mock_s3
+def test_add_stac_item_update(tmp_path):
+    sensor_name = 'landsat_5'
+    acquisition_key = f'common_sensing/fiji/{sensor_name}/LT05_L1TP_075073_19920125/'
+    bucket_name = 'public-eo-data'
+
+    (tmp_path / acquisition_key).mkdir(parents=True)
+    for band in ('sr_band1', 'sr_band2', 'sr_band3', 'sr_band4'):
+        write_band(tmp_path / acquisition_key / f'LT05_L1GS_075073_19920125_20170124_01_T2_{band}.tif', 512, 256)
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=bucket_name)
+    add_stac_s3(sensor_name, s3.s3_resource, bucket_name)
+
+    repo = repository.S3Repository(s3)
+    source = FileSystemSource(str(tmp_path))
+    _, item_key = services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source, update=True)
+    item = repo.get_dict(bucket=bucket_name, key=item_key)
+
+    assert services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source, update=True) == \
+        ('item', None)
+
+    # Items written without the digest metadata are migrated from their fingerprints property, not rebuilt
+    s3.s3_resource.Object(bucket_name, item_key).put(Body=json.dumps(item).encode())
+    with mock.patch.object(services, 'build_stac_item') as build_stac_item:
+        assert services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source, update=True) == \
+            ('item', None)
+        build_stac_item.assert_not_called()
+    assert repo.head(bucket=bucket_name, key=item_key)['metadata'].get('fingerprint')
+
+    # Re-process the nir band in place
+    nir = tmp_path / acquisition_key / 'LT05_L1GS_075073_19920125_20170124_01_T2_sr_band4.tif'
+    write_band(nir, 1024, 512)
+    os.utime(nir, ns=(nir.stat().st_atime_ns, nir.stat().st_mtime_ns + 10 ** 9))
+
+    assert services.add_stac_item(repo=repo, acquisition_key=acquisition_key, source=source, update=True) == \
+        ('item', item_key)
+
+    updated = repo.get_dict(bucket=bucket_name, key=item_key)
+    fingerprints = updated['properties']['sac_stac:fingerprints']
+    assert updated['assets']['nir']['proj:shape'] == [512, 1024]
+    assert updated['assets']['red'] == item['assets']['red']
+    assert updated['geometry'] == item['geometry']
+    assert fingerprints[f'{acquisition_key}{nir.name}']['size'] == nir.stat().st_size
+
+
+@mock_s3
+def test_delete_stac_items(tmp_path, monkeypatch):
+    sensor_name = 'landsat_5'
+    sensor_conf = next(s for s in services.config.get('sensors') if s.get('id') == sensor_name)
+    monkeypatch.setitem(sensor_conf, 'thumbnail', {'enabled': True, 'format': 'JPEG'})
+    sensor_key = f'common_sensing/fiji/{sensor_name}/'
+    acquisition_key = f'{sensor_key}LT05_L1TP_075073_19920125/'
+    bucket_name = 'public-eo-data'
+    collection_key = f'stac_catalogs/cs_stac/{sensor_name}/collection.json'
+
+    (tmp_path / acquisition_key).mkdir(parents=True)
+    for band in ('sr_band1', 'sr_band2', 'sr_band3', 'sr_band4'):
+        write_band(tmp_path / acquisition_key / f'LT05_L1GS_075073_19920125_20170124_01_T2_{band}.tif', 512, 256)
+
+    s3 = S3(key=None, secret=None, s3_endpoint=None, region_name='us-east-1')
+    s3.s3_resource.create_bucket(Bucket=bucket_name)
+    add_stac_s3(sensor_name, s3.s3_resource, bucket_name)
+
+    repo = repository.S3Repository(s3)
+    extent = repo.get_dict(bucket=bucket_name, key=collection_key)['extent']
+    _, item_key = services.add_stac_item(repo=repo, acquisition_key=acquisition_key,
+                                         source=FileSystemSource(str(tmp_path)))
+
+    collection_keys, item_keys = services.delete_stac_items(
+        repo=repo, acquisition_keys=[acquisition_key, f'{sensor_key}LT05_L1TP_075073_19000101/'])
+
+    collection = repo.get_dict(bucket=bucket_name, key=collection_key)
+    assert collection_keys == [collection_key]
+    assert item_keys == [item_key]
+    assert not repo.exists(bucket=bucket_name, key=item_key)
+    assert not list(s3.s3_resource.Bucket(bucket_name).objects.filter(Prefix=item_key.rsplit('/', 1)[0]))
+    assert services.get_href(item_key) not in get_rel_links(collection, 'item')
+    assert len(get_rel_links(collection, 'item')) == 1
+    assert collection['extent'] == extent
+    assert read_index_records(repo.get_object(bucket=bucket_name, key=services.get_item_index_key(sensor_name))) == []
+
+    services.delete_stac_items(repo=repo, acquisition_keys=[f'{sensor_key}LT05_L1TP_075073_19911225/'])
+
+    collection = repo.get_dict(bucket=bucket_name, key=collection_key)
+    assert get_rel_links(collection, 'item') == []
+    assert collection['extent']['temporal'] == {'interval': [[None, None]]}
+
+    # A collection written by another process during the deletion is read again rather than overwritten
+    _, item_key = services.add_stac_item(repo=repo, acquisition_key=acquisition_key,
+                                         source=FileSystemSource(str(tmp_path)))
+    other_href = services.get_href(services.get_item_key(sensor_name, 'other'))
+    remove_items = services.remove_items_from_collection_dict
+
+    def remove_items_racing(collection_dict, **kwargs):
+        if other_href not in get_rel_links(collection_dict, 'item'):
+            concurrent = repo.get_dict(bucket=bucket_name, key=collection_key)
+            concurrent['links'].append({'rel': 'item', 'href': other_href, 'type': 'application/json'})
+            s3.s3_resource.Object(bucket_name, collection_key).put(Body=json.dumps(concurrent).encode())
+        return remove_items(collection_dict=collection_dict, **kwargs)
+
+    monkeypatch.setattr(services, 'remove_items_from_collection_dict', remove_items_racing)
+    monkeypatch.setattr(services, 'get_collection_item', lambda repo, href: (href, [0.0, 0.0, 1.0, 1.0], None))
+    assert services.delete_stac_items(repo=repo, acquisition_keys=[acquisition_key])[1] == [item_key]
+    assert get_rel_links(repo.get_dict(bucket=bucket_name, key=collection_key), 'item') == [other_href]
+    assert not repo.exists(bucket=bucket_name, key=item_key)
+
+
 @mock_s3
 def test_add_stac_item_with_empty_bands():
     sensor_name = 'landsat_5'
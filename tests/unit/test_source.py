@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import pytest
+
+from sac_stac.adapters.source import FileSystemSource
+from sac_stac.domain.s3 import NoObjectError
+
+SENSOR_KEY = 'common_sensing/fiji/sentinel_2/'
+
+
+def test_file_system_source_acquisition_keys():
+    source = FileSystemSource('tests/data')
+
+    assert source.get_acquisition_keys(SENSOR_KEY) == [
+        f'{SENSOR_KEY}S2A_MSIL2A_20151022T222102_T01KBU/',
+        f'{SENSOR_KEY}S2B_MSIL2A_20191023T220919_T01KBA/',
+        f'{SENSOR_KEY}S2B_MSIL2A_20191023T220919_T01KBB/'
+    ]
+    assert source.get_acquisition_keys('common_sensing/fiji/unknown/') == []
+
+
+def test_file_system_source_product_fingerprints():
+    source = FileSystemSource('tests/data')
+    acquisition_key = f'{SENSOR_KEY}S2A_MSIL2A_20151022T222102_T01KBU/'
+    product_key = f'{acquisition_key}S2A_MSIL2A_20151022T222102_T01KBU_B01_60m.tif'
+
+    fingerprints = source.get_product_fingerprints(acquisition_key)
+
+    assert len(fingerprints) == 15
+    assert fingerprints[product_key][0] == Path(f'tests/data/{product_key}').stat().st_size
+    assert source.get_cog_url(product_key) == f'tests/data/{product_key}'
+
+
+def test_file_system_source_no_products():
+    source = FileSystemSource('tests/data')
+
+    with pytest.raises(NoObjectError):
+        source.get_product_fingerprints(f'{SENSOR_KEY}unknown/')
@@ -0,0 +1,84 @@
+import pytest
+from botocore.exceptions import ClientError
+from rasterio import RasterioIOError
+
+from sac_stac.throttling import Throttle, is_throttling_error
+
+
+def slow_down():
+    return ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'},
+                        'ResponseMetadata': {'HTTPStatusCode': 503}}, 'PutObject')
+
+
+def flaky(failures, error=slow_down):
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error()
+        return len(calls)
+
+    return call
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(slow_down())
+    assert is_throttling_error(RasterioIOError('HTTP response code: 503'))
+    assert not is_throttling_error(ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject'))
+    assert not is_throttling_error(RasterioIOError('No such file or directory'))
+
+
+def test_throttle_retries_and_decreases_limit():
+    throttle = Throttle(max_concurrency=8, base_delay=0)
+
+    assert throttle.call('put_object', flaky(2)) == 3
+    assert throttle.limit < 8
+    assert throttle.in_flight == 0
+
+
+def test_throttle_gives_up_after_max_retries():
+    throttle = Throttle(max_concurrency=8, max_retries=2, base_delay=0)
+
+    with pytest.raises(ClientError):
+        throttle.call('put_object', flaky(3))
+    assert throttle.limit == 1
+
+
+def test_throttle_does_not_retry_other_errors():
+    throttle = Throttle(base_delay=0)
+    call = flaky(1, error=lambda: ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject'))
+
+    with pytest.raises(ClientError):
+        throttle.call('get_object', call)
+    assert throttle.limit == 64
+
+
+def test_throttle_increases_limit_additively():
+    throttle = Throttle(max_concurrency=8, base_delay=0)
+    throttle.call('put_object', flaky(1))
+    limit = throttle.limit
+
+    throttle.call('put_object', flaky(0))
+
+    assert throttle.limit == pytest.approx(limit + 1 / limit)
+
+
+def test_throttle_decreases_limit_on_latency():
+    throttle = Throttle(max_concurrency=8, latency_targets={'get_object': 0})
+
+    throttle.call('get_object', flaky(0))
+    assert throttle.limit == 6
+
+    # Operations without a target only back off on throttling errors
+    throttle.call('list_objects', flaky(0))
+    assert throttle.limit > 6
+
+
+def test_throttle_token_bucket_rate():
+    throttle = Throttle(rate=10, base_delay=0)
+
+    throttle.call('put_object', flaky(1))
+
+    assert throttle.bucket('put_object').rate < 10
+    assert 'get_object' not in throttle.buckets
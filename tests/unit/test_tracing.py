@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import pytest
+from sac_stac import tracing
+from sac_stac.entrypoints.nats_eventconsumer import publish
+
+
+@pytest.fixture
+def file_tracing(tmp_path):
+    pytest.importorskip('opentelemetry.sdk')
+    path = tmp_path / 'traces.jsonl'
+    tracing.configure_tracing(exporter='file', path=str(path))
+    yield path
+    tracing._provider.shutdown()
+    tracing._provider = None
+    tracing._tracer = None
+
+
+class FakeNATS:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, subject, payload, headers=None):
+        self.published.append((subject, payload, headers))
+
+
+def test_span_noop():
+    with tracing.span('test', key='some/key') as current:
+        current.set_attribute('bytes', 10)
+
+    assert isinstance(current, tracing.NoopSpan)
+    assert tracing.inject_context() == {}
+
+
+def test_span_file_exporter(file_tracing):
+    with tracing.span('parent', key='some/key'):
+        with tracing.span('child', bytes=10, ignored=None):
+            pass
+    tracing.flush_tracing()
+
+    spans = {s.get('name'): s for s in map(json.loads, file_tracing.read_text().splitlines())}
+
+    assert spans['child']['attributes']['bytes'] == 10
+    assert 'ignored' not in spans['child']['attributes']
+    assert 'latency_ms' in spans['child']['attributes']
+    assert spans['child']['parent_id'] == spans['parent']['context']['span_id']
+    assert spans['parent']['attributes']['key'] == 'some/key'
+
+
+def test_publish_propagates_context(file_tracing):
+    nc = FakeNATS()
+
+    with tracing.span('parent') as current:
+        asyncio.new_event_loop().run_until_complete(publish(nc, 'stac_indexer.item', b'key'))
+
+    subject, payload, headers = nc.published[0]
+    assert f"{current.get_span_context().trace_id:032x}" in headers['traceparent']
+
+    with tracing.span('child', context=headers) as child:
+        assert child.get_span_context().trace_id == current.get_span_context().trace_id
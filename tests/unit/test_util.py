@@ -1,4 +1,4 @@
-from sac_stac.util import unparse_s3_url
+from sac_stac.util import unparse_s3_url, extract_common_prefix
 
 
 def test_unparse_s3_url():
@@ -11,3 +11,18 @@ def test_unparse_s3_url():
     assert product_url == 'https://s3-uk-1.sa-catapult.co.uk/public-eo-data/' \
                           'common_sensing/fiji/sentinel_2/S2A_MSIL2A_20151022T222102_T01KBU/' \
                           'S2A_MSIL2A_20151022T222102_T01KBU_B02_10m.tif'
+
+
+def test_extract_common_prefix():
+    keys = ['common_sensing/fiji/sentinel_2/S2A_MSIL2A_20151022T222102_T01KBU/',
+            'common_sensing/fiji/sentinel_2/S2B_MSIL2A_20191023T220919_T01KBA/',
+            'common_sensing/fiji/sentinel_2/S2B_MSIL2A_20191023T220919_T01KBB/']
+
+    assert extract_common_prefix(keys) == 'common_sensing/fiji/sentinel_2/S2'
+    assert extract_common_prefix(keys, delimiter='/') == 'common_sensing/fiji/sentinel_2/'
+
+
+def test_extract_common_prefix_no_match():
+    assert extract_common_prefix(['landsat_8/', 'sentinel_2/']) == ''
+    assert extract_common_prefix(['landsat_8/', 'sentinel_2/'], delimiter='/') == ''
+    assert extract_common_prefix([]) == ''
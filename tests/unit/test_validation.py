@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from sac_stac.domain.validation import StacValidator, StacValidationError, MissingSchemaError, load_schemas, \
+    get_required_schema_uris
+from sac_stac.entrypoints.vendor_schemas import vendor_schemas, get_schema_path
+from sac_stac.util import load_json
+
+ITEM_PATH = 'tests/output/landsat_5/LT05_L1TP_075073_19911225/LT05_L1TP_075073_19911225.json'
+# Subsets of the core schemas, to test the validator apart from the vendored official schemas
+TEST_SCHEMAS = {**load_schemas(), **load_schemas(Path('tests/data/schemas'))}
+VENDORED = all(uri in load_schemas() for uri in get_required_schema_uris())
+
+
+def test_validate_generated_objects():
+    validator = StacValidator(TEST_SCHEMAS, required=[])
+
+    validator.validate(load_json(ITEM_PATH))
+    validator.validate(load_json('tests/output/landsat_5/collection.json'))
+    validator.validate(load_json('tests/output/catalog.json'))
+
+
+def test_validate_invalid_item():
+    validator = StacValidator(TEST_SCHEMAS, required=[])
+    item = load_json(ITEM_PATH)
+    item['bbox'] = item['bbox'][:3]
+
+    with pytest.raises(StacValidationError, match="at 'bbox'"):
+        validator.validate(item)
+
+
+def test_validator_requires_vendored_schemas():
+    item_uri = 'https://schemas.stacspec.org/v1.0.0-beta.2/item-spec/json-schema/item.json'
+
+    with pytest.raises(MissingSchemaError, match=item_uri):
+        StacValidator({})
+    with pytest.raises(MissingSchemaError, match='raster'):
+        StacValidator(TEST_SCHEMAS)
+
+
+@pytest.mark.skipif(not VENDORED, reason='the official schemas are not vendored in src/sac_stac/schemas')
+def test_validate_invalid_item_vendored_schemas():
+    validator = StacValidator()
+    item = load_json(ITEM_PATH)
+    validator.validate(item)
+
+    del item['properties']['datetime']
+    with pytest.raises(StacValidationError, match='item-spec'):
+        validator.validate(item)
+
+
+def test_validate_invalid_collection():
+    validator = StacValidator(TEST_SCHEMAS, required=[])
+    collection = load_json('tests/output/landsat_5/collection.json')
+    del collection['extent']['temporal']
+
+    with pytest.raises(StacValidationError, match='temporal'):
+        validator.validate(collection)
+
+
+def test_validator_cached_per_schema_uri():
+    validator = StacValidator(TEST_SCHEMAS, required=[])
+    item = load_json(ITEM_PATH)
+    item['stac_extensions'].append('https://example.com/unknown/v1.0.0/schema.json')
+
+    validator.validate(item)
+    validator.validate(item)
+
+    schema_uri = validator.get_schema_uris(item)[0]
+    assert validator.get_validator(schema_uri) is validator.local.validators[schema_uri]
+    assert validator.get_validator('https://example.com/unknown/v1.0.0/schema.json') is None
+
+
+def test_validate_invalid_fingerprints():
+    validator = StacValidator(TEST_SCHEMAS, required=[])
+    item = load_json(ITEM_PATH)
+    item['properties']['sac_stac:fingerprints'] = {'a_B01.tif': {'size': 300, 'etag': '"a"', 'last_modified': None}}
+    validator.validate(item)
+
+    item['properties']['sac_stac:fingerprints']['a_B01.tif']['size'] = '300'
+    with pytest.raises(StacValidationError, match="sac_stac:fingerprints"):
+        validator.validate(item)
+
+
+def test_vendor_schemas(tmp_path):
+    base_uri = 'https://schemas.stacspec.org/v1.0.0-beta.2/item-spec/json-schema'
+    bodies = {
+        f'{base_uri}/item.json': json.dumps({'$id': f'{base_uri}/item.json#', 'allOf': [
+            {'$ref': '#/definitions/core'},
+            {'$ref': 'basics.json'},
+            {'$ref': 'https://geojson.org/schema/Feature.json'}
+        ]}).encode(),
+        f'{base_uri}/basics.json': b'{"$id": "basics.json#", "type": "object"}\n',
+        'https://geojson.org/schema/Feature.json': b'{"type": "object"}'
+    }
+
+    vendored = vendor_schemas([f'{base_uri}/item.json'], schemas_dir=tmp_path, fetch=bodies.get)
+
+    assert sorted(vendored) == sorted(bodies)
+    for uri, body in bodies.items():
+        assert get_schema_path(uri, tmp_path).read_bytes() == body